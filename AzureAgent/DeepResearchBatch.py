@@ -0,0 +1,248 @@
+# Batch mode for the deep research agent: run a queue of topics unattended
+#
+# Reads topics (one per line, blank lines and lines starting with # are skipped), creates or
+# reuses one deep research agent, and runs one thread per topic with at most --concurrency
+# runs in flight. Every step that creates something on the service (thread, message, run) is
+# written to a JSON state file straight away, so after a crash or Ctrl+C the same command
+# picks each job up where it stopped instead of paying for the research again:
+#   - completed jobs are skipped
+#   - a job with a run still in progress is polled, not restarted
+#   - a failed run gets a new run on the same thread, up to --max-attempts
+# Each completed topic is written with write_research_summary to <output>/<job key>.md.
+# Unless --no-cache is given, the agent comes from the resource cache and topics researched
+# before by an identically configured agent are answered from the result cache (ResearchCache.py).
+#
+# Runs are started with runs.create and followed with poll_run rather than streamed, so the
+# run ID is in the state file before the run does any work.
+#
+# Usage:
+#   python DeepResearchBatch.py topics.txt --concurrency 8 --state research_state.json --output summaries
+
+import os, json, time, hashlib, argparse, threading
+import concurrent.futures
+from typing import Dict, List, Optional
+
+from azure.ai.agents import AgentsClient
+
+from o3DeepResearchAgent import (
+    CACHE_DIR,
+    create_project_client,
+    create_research_agent,
+    fetch_new_agent_response,
+    poll_run,
+    research_result,
+    write_research_summary,
+)
+from ResearchCache import ResourceCache, ResultCache, prompt_key
+
+
+def job_key(topic: str) -> str:
+    return hashlib.sha256(topic.encode("utf-8")).hexdigest()[:16]
+
+
+def load_topics(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as fp:
+        lines = (line.strip() for line in fp)
+        topics = [line for line in lines if line and not line.startswith("#")]
+    # Duplicate topics share a job key, so keep the first occurrence only
+    return list(dict.fromkeys(topics))
+
+
+class BatchState:
+    """Job state shared by the worker threads and persisted after every change."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as fp:
+                self.data = json.load(fp)
+        else:
+            self.data = {"agent_id": None, "jobs": {}}
+
+    def _save(self) -> None:
+        # Write to a temporary file and rename, so a crash mid-write never leaves a truncated file
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fp:
+            json.dump(self.data, fp, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def set_agent(self, agent_id: str) -> None:
+        with self._lock:
+            self.data["agent_id"] = agent_id
+            self._save()
+
+    def job(self, topic: str) -> Dict:
+        key = job_key(topic)
+        with self._lock:
+            if key not in self.data["jobs"]:
+                self.data["jobs"][key] = {
+                    "topic": topic,
+                    "status": "pending",
+                    "thread_id": None,
+                    "message_id": None,
+                    "run_id": None,
+                    "attempts": 0,
+                    "error": None,
+                    "summary": None,
+                }
+                self._save()
+            return dict(self.data["jobs"][key], key=key)
+
+    def update(self, key: str, **fields) -> None:
+        with self._lock:
+            self.data["jobs"][key].update(fields)
+            self.data["jobs"][key]["updated"] = time.time()
+            self._save()
+
+
+def run_job(
+    agents_client: AgentsClient,
+    state: BatchState,
+    agent_id: str,
+    topic: str,
+    output_dir: str,
+    max_attempts: int = 2,
+    result_cache: Optional[ResultCache] = None,
+    config_key: Optional[str] = None,
+) -> str:
+    """Take one topic from wherever the state file left it to a written summary. Returns the
+    final job status."""
+    job = state.job(topic)
+    key = job["key"]
+    label = f"[{key}] "
+    if job["status"] == "completed":
+        return "completed"
+    summary_path = os.path.join(output_dir, f"{key}.md")
+    result_key = prompt_key(topic, config_key) if result_cache and config_key else None
+
+    try:
+        # A job that already has a run in flight finishes that run rather than using the cache
+        cached = result_cache.get(result_key) if result_key and job["run_id"] is None else None
+        if cached is not None:
+            write_research_summary(cached, summary_path)
+            state.update(key, status="completed", summary=summary_path, cached=True)
+            print(f"{label}Served from result cache")
+            return "completed"
+
+        if job["thread_id"] is None:
+            thread = agents_client.threads.create()
+            job["thread_id"] = thread.id
+            state.update(key, thread_id=thread.id, status="thread_created")
+        if job["message_id"] is None:
+            message = agents_client.messages.create(thread_id=job["thread_id"], role="user", content=topic)
+            job["message_id"] = message.id
+            state.update(key, message_id=message.id, status="message_created")
+
+        while True:
+            if job["run_id"] is None:
+                if job["attempts"] >= max_attempts:
+                    state.update(key, status="failed")
+                    print(f"{label}Giving up after {job['attempts']} attempts")
+                    return "failed"
+                run = agents_client.runs.create(thread_id=job["thread_id"], agent_id=agent_id)
+                job["run_id"] = run.id
+                job["attempts"] += 1
+                state.update(key, run_id=run.id, attempts=job["attempts"], status="running", error=None)
+                print(f"{label}Started run {run.id} (attempt {job['attempts']})")
+            else:
+                print(f"{label}Resuming run {job['run_id']}")
+
+            run = poll_run(agents_client, job["thread_id"], job["run_id"], label=label)
+            if run.status == "completed":
+                break
+            # The thread keeps the user message, so a retry only needs a new run
+            error = str(run.last_error) if run.last_error else run.status
+            print(f"{label}Run {run.id} ended with {run.status}: {error}")
+            if run.status == "requires_action":
+                # The run holds the thread until it is resolved; nothing here submits tool outputs
+                agents_client.runs.cancel(thread_id=job["thread_id"], run_id=run.id)
+            job["run_id"] = None
+            state.update(key, run_id=None, status="retrying", error=error)
+
+        _, response = fetch_new_agent_response(job["thread_id"], agents_client)
+        if response is None:
+            state.update(key, status="failed", error="run completed without an agent response")
+            return "failed"
+        result = research_result(response)
+        write_research_summary(result, summary_path)
+        if result_key:
+            result_cache.put(result_key, result)
+        state.update(key, status="completed", summary=summary_path)
+        return "completed"
+
+    except Exception as e:
+        # Leave the IDs in place so the next invocation resumes from here
+        state.update(key, status="error", error=f"{type(e).__name__}: {e}")
+        print(f"{label}Error: {type(e).__name__}: {e}")
+        return "error"
+
+
+def run_batch(
+    topics: List[str],
+    state_path: str = "research_state.json",
+    output_dir: str = "research_summaries",
+    concurrency: int = 4,
+    max_attempts: int = 2,
+    agent_id: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, int]:
+    os.makedirs(output_dir, exist_ok=True)
+    state = BatchState(state_path)
+    resource_cache = ResourceCache(CACHE_DIR) if use_cache else None
+    result_cache = ResultCache(CACHE_DIR) if use_cache else None
+    project_client = create_project_client()
+
+    with project_client:
+
+        with project_client.agents as agents_client:
+
+            # One agent definition for the whole batch, reused when resuming. Results are only
+            # cached for an agent created (or found in the resource cache) from the configured
+            # definition, whose config key is known; a caller's or resumed agent ID is used as is.
+            config_key = None
+            agent_id = agent_id or state.data["agent_id"]
+            if agent_id is None:
+                agent, config_key = create_research_agent(project_client, agents_client, resource_cache)
+                agent_id = agent.id
+            else:
+                print(f"Reusing agent, ID: {agent_id}")
+            state.set_agent(agent_id)
+
+            pending = [topic for topic in topics if state.job(topic)["status"] != "completed"]
+            print(f"{len(topics)} topics, {len(topics) - len(pending)} already completed, "
+                  f"running {len(pending)} with concurrency {concurrency}")
+
+            start = time.perf_counter()
+            counts = {"completed": len(topics) - len(pending), "failed": 0, "error": 0}
+            with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                futures = [
+                    executor.submit(run_job, agents_client, state, agent_id, topic, output_dir, max_attempts,
+                                    result_cache, config_key)
+                    for topic in pending
+                ]
+                for future in concurrent.futures.as_completed(futures):
+                    counts[future.result()] += 1
+                    print(f"Progress: {sum(counts.values())}/{len(topics)} "
+                          f"({counts['completed']} completed, {counts['failed']} failed, {counts['error']} errors)")
+
+            print(f"Batch finished in {time.perf_counter() - start:.0f}s: {counts}")
+            if result_cache:
+                print(f"Result cache: {result_cache.hits} hits, {result_cache.misses} misses")
+            return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run deep research over a file of topics")
+    parser.add_argument("topics", help="text file with one research topic per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="runs in flight at once")
+    parser.add_argument("--state", default="research_state.json", help="job state file, used to resume")
+    parser.add_argument("--output", default="research_summaries", help="directory for per-topic summaries")
+    parser.add_argument("--max-attempts", type=int, default=2, help="runs per topic before giving up")
+    parser.add_argument("--agent-id", default=None, help="existing agent to use instead of creating one")
+    parser.add_argument("--no-cache", action="store_true", help="skip the agent and result caches")
+    args = parser.parse_args()
+
+    counts = run_batch(load_topics(args.topics), args.state, args.output, args.concurrency,
+                       args.max_attempts, args.agent_id, use_cache=not args.no_cache)
+    raise SystemExit(1 if counts["failed"] or counts["error"] else 0)
@@ -0,0 +1,145 @@
+# Local caches for the deep research agent
+#
+# ResourceCache remembers the IDs of things that are slow to look up or that pile up when
+# created again on every run:
+#   - Bing connection IDs, keyed by project endpoint + connection name
+#   - agent IDs, keyed by a hash of endpoint, model, name, instructions and tool definitions,
+#     so changing any of them creates a new agent instead of reusing a stale one
+#
+# ResultCache stores finished research (text + URL citations) content-addressed by a hash of
+# the normalized prompt and the agent key, so the same prompt asked of a differently
+# configured agent is a miss. Entries expire after ttl_seconds, and once there are more than
+# max_entries the least recently used ones are removed. Each entry is one JSON file next to
+# an index.json holding created / last-used times.
+#
+# Both caches are plain files under one directory (default AzureAgent/.research_cache) and
+# are safe to share between the threads of DeepResearchBatch.py.
+
+import os, json, time, hashlib, threading, unicodedata
+from typing import Dict, List, Optional
+
+
+def _hash(payload) -> str:
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _write_json(path: str, payload) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fp:
+        json.dump(payload, fp, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as fp:
+            return json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def agent_key(endpoint: str, model: str, name: str, instructions: str, tool_definitions: List[Dict]) -> str:
+    return _hash({
+        "endpoint": endpoint,
+        "model": model,
+        "name": name,
+        "instructions": instructions,
+        "tools": tool_definitions,
+    })
+
+
+def prompt_key(prompt: str, agent_config_key: str) -> str:
+    # Whitespace and Unicode normalization, so trivially different copies of a prompt share an entry
+    normalized = " ".join(unicodedata.normalize("NFC", prompt).split())
+    return _hash({"prompt": normalized, "agent": agent_config_key})
+
+
+class ResourceCache:
+    """Connection and agent IDs that survive between runs."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "resources.json")
+        self._lock = threading.Lock()
+        self.data = _read_json(self.path, {"connections": {}, "agents": {}})
+
+    def _get(self, kind: str, key: str) -> Optional[str]:
+        with self._lock:
+            return self.data[kind].get(key)
+
+    def _set(self, kind: str, key: str, value: Optional[str]) -> None:
+        with self._lock:
+            if value is None:
+                self.data[kind].pop(key, None)
+            else:
+                self.data[kind][key] = value
+            _write_json(self.path, self.data)
+
+    def get_connection(self, endpoint: str, name: str) -> Optional[str]:
+        return self._get("connections", f"{endpoint}|{name}")
+
+    def set_connection(self, endpoint: str, name: str, connection_id: Optional[str]) -> None:
+        self._set("connections", f"{endpoint}|{name}", connection_id)
+
+    def get_agent(self, key: str) -> Optional[str]:
+        return self._get("agents", key)
+
+    def set_agent(self, key: str, agent_id: Optional[str]) -> None:
+        self._set("agents", key, agent_id)
+
+
+class ResultCache:
+    """Finished research results with TTL expiry and LRU eviction."""
+
+    def __init__(self, directory: str, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 500):
+        self.directory = os.path.join(directory, "results")
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, "index.json")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.index = _read_json(self.index_path, {})
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _remove(self, key: str) -> None:
+        self.index.pop(key, None)
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            meta = self.index.get(key)
+            if meta is not None and now - meta["created"] > self.ttl_seconds:
+                self._remove(key)
+                _write_json(self.index_path, self.index)
+                meta = None
+            result = _read_json(self._entry_path(key), None) if meta is not None else None
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            meta["last_used"] = now
+            _write_json(self.index_path, self.index)
+            return result
+
+    def put(self, key: str, result: Dict) -> None:
+        now = time.time()
+        with self._lock:
+            _write_json(self._entry_path(key), result)
+            self.index[key] = {"created": now, "last_used": now}
+            # Drop expired entries first, then the least recently used ones over the limit
+            for stale in [k for k, meta in self.index.items() if now - meta["created"] > self.ttl_seconds]:
+                self._remove(stale)
+            if len(self.index) > self.max_entries:
+                by_use = sorted(self.index, key=lambda k: self.index[k]["last_used"])
+                for old in by_use[:len(self.index) - self.max_entries]:
+                    self._remove(old)
+            _write_json(self.index_path, self.index)
@@ -9,141 +9,366 @@
 # 5. Run pip install --pre azure-ai-projects, must be pre-release version
 # 6. Run pip install azure-ai-projects azure-identity azure-ai-agents
 # 7. Ensure Azure Login 
+#
+# Runs are driven by the streaming run API (ResearchEventHandler prints deltas, tool calls and
+# status changes as they arrive). If the stream cannot be opened or drops mid-run, the run is
+# followed with poll_run, which backs off while the status is unchanged. Use --poll to skip
+# streaming entirely.
+#
+# The Bing connection ID and the agent are cached in .research_cache (see ResearchCache.py)
+# and reused while model, instructions and tool config are unchanged, and a research prompt
+# that was answered before is served from the result cache. Use --no-cache to bypass both.
 
-import os, time
-from typing import Optional
+import os, time, argparse
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
 from azure.ai.projects import AIProjectClient
 from azure.identity import DefaultAzureCredential
 from azure.ai.agents import AgentsClient
-from azure.ai.agents.models import DeepResearchTool, MessageRole, ThreadMessage
+from azure.core.exceptions import ResourceNotFoundError
+from azure.ai.agents.models import (
+    AgentEventHandler,
+    DeepResearchTool,
+    MessageDeltaChunk,
+    MessageRole,
+    RunStep,
+    RunStepDeltaChunk,
+    ThreadMessage,
+    ThreadRun,
+)
+
+from ResearchCache import ResourceCache, ResultCache, agent_key, prompt_key
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
-def fetch_and_print_new_agent_response(
+AGENT_NAME = "deep-research-agent"
+AGENT_INSTRUCTIONS = "You are a helpful Agent that assists in researching scientific topics."
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), ".research_cache")
+
+# Run statuses that change on their own; polling stops on anything else, including
+# requires_action, which waits on the caller and would otherwise be polled forever
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "cancelling")
+
+def fetch_new_agent_response(
     thread_id: str,
     agents_client: AgentsClient,
     last_message_id: Optional[str] = None,
-) -> Optional[str]:
+) -> Tuple[Optional[str], Optional[ThreadMessage]]:
     response = agents_client.messages.get_last_message_by_role(
         thread_id=thread_id,
         role=MessageRole.AGENT,
     )
     if not response or response.id == last_message_id:
         return last_message_id, None  # No new content
+    return response.id, response
 
-    print("\nAgent response:")
-    print("\n".join(t.text.value for t in response.text_messages))
 
-    for ann in response.url_citation_annotations:
+def print_citations(message: ThreadMessage) -> None:
+    for ann in message.url_citation_annotations:
         print(f"URL Citation: [{ann.url_citation.title}]({ann.url_citation.url})")
 
+
+def fetch_and_print_new_agent_response(
+    thread_id: str,
+    agents_client: AgentsClient,
+    last_message_id: Optional[str] = None,
+) -> Tuple[Optional[str], Optional[ThreadMessage]]:
+    last_message_id, response = fetch_new_agent_response(thread_id, agents_client, last_message_id)
+    if response is None:
+        return last_message_id, None
+
+    print("\nAgent response:")
+    print("\n".join(t.text.value for t in response.text_messages))
+    print_citations(response)
+
     return response.id, response
 
 
-def create_research_summary(
-        message : ThreadMessage,
+class ResearchEventHandler(AgentEventHandler):
+    """Prints a streamed run as it happens and remembers the latest run state."""
+
+    def __init__(self, echo: bool = True):
+        super().__init__()
+        self.echo = echo
+        self.run: Optional[ThreadRun] = None
+        self.events = 0
+        self.error: Optional[str] = None
+
+    def on_message_delta(self, delta: MessageDeltaChunk) -> None:
+        self.events += 1
+        if self.echo and delta.text:
+            print(delta.text, end="", flush=True)
+
+    def on_thread_run(self, run: ThreadRun) -> None:
+        self.events += 1
+        if self.run is None or run.status != self.run.status:
+            print(f"\nRun status: {run.status}")
+        self.run = run
+
+    def on_run_step(self, step: RunStep) -> None:
+        self.events += 1
+        if step.type == "tool_calls" and step.status == "in_progress":
+            tool_types = ", ".join(call.type for call in getattr(step.step_details, "tool_calls", None) or [])
+            print(f"\nTool call started: {tool_types or 'unknown'}")
+
+    def on_run_step_delta(self, delta: RunStepDeltaChunk) -> None:
+        # Deep research progress arrives as step deltas; count them but keep the output to the message text
+        self.events += 1
+
+    def on_error(self, data: str) -> None:
+        self.error = data
+        print(f"\nStream error: {data}")
+
+    def on_unhandled_event(self, event_type: str, event_data: str) -> None:
+        self.events += 1
+
+
+def poll_run(
+    agents_client: AgentsClient,
+    thread_id: str,
+    run_id: str,
+    initial_interval: float = 1.0,
+    max_interval: float = 30.0,
+    backoff: float = 1.5,
+    label: str = "",
+) -> ThreadRun:
+    """Poll a run until it leaves ACTIVE_RUN_STATUSES. The interval grows by `backoff` while the
+    status is unchanged (up to max_interval) and drops back to initial_interval when it changes,
+    so a many-minute deep research run costs tens of calls instead of one per second."""
+    interval = initial_interval
+    run = agents_client.runs.get(thread_id=thread_id, run_id=run_id)
+    print(f"{label}Run status: {run.status}")
+    while run.status in ACTIVE_RUN_STATUSES:
+        time.sleep(interval)
+        previous_status = run.status
+        run = agents_client.runs.get(thread_id=thread_id, run_id=run_id)
+        if run.status != previous_status:
+            print(f"{label}Run status: {run.status}")
+            interval = initial_interval
+        else:
+            interval = min(interval * backoff, max_interval)
+    return run
+
+
+def execute_run(
+    agents_client: AgentsClient,
+    thread_id: str,
+    agent_id: str,
+    stream: bool = True,
+    echo: bool = True,
+) -> ThreadRun:
+    """Start a run on the thread and wait for it to finish, streaming when possible."""
+    if stream:
+        handler = ResearchEventHandler(echo=echo)
+        try:
+            with agents_client.runs.stream(thread_id=thread_id, agent_id=agent_id, event_handler=handler) as events:
+                events.until_done()
+        except Exception as e:
+            print(f"\nStreaming interrupted ({e}), falling back to polling")
+        if handler.run is not None:
+            print(f"\nReceived {handler.events} stream events")
+            if handler.run.status not in ACTIVE_RUN_STATUSES:
+                return handler.run
+            # The stream ended early: keep following the same run
+            return poll_run(agents_client, thread_id, handler.run.id)
+
+    run = agents_client.runs.create(thread_id=thread_id, agent_id=agent_id)
+    return poll_run(agents_client, thread_id, run.id)
+
+
+def research_result(message: ThreadMessage) -> Dict:
+    """The parts of an agent message needed for a summary, as plain data for the result cache."""
+    return {
+        "texts": [t.text.value for t in message.text_messages],
+        "citations": [
+            {"title": ann.url_citation.title, "url": ann.url_citation.url}
+            for ann in message.url_citation_annotations
+        ],
+    }
+
+
+def write_research_summary(
+        result: Dict,
         filepath: str = "research_summary.md"
 ) -> None:
-    if not message:
-        print("No message content provided, cannot create research summary.")
-        return
-
     with open(filepath, "w", encoding="utf-8") as fp:
         # Write text summary
-        text_summary = "\n\n".join([t.text.value.strip() for t in message.text_messages])
+        text_summary = "\n\n".join([text.strip() for text in result["texts"]])
         fp.write(text_summary)
 
         # Write unique URL citations, if present
-        if message.url_citation_annotations:
+        if result["citations"]:
             fp.write("\n\n## References\n")
             seen_urls = set()
-            for ann in message.url_citation_annotations:
-                url = ann.url_citation.url
-                title = ann.url_citation.title or url
+            for citation in result["citations"]:
+                url = citation["url"]
+                title = citation["title"] or url
                 if url not in seen_urls:
                     fp.write(f"- [{title}]({url})\n")
                     seen_urls.add(url)
 
     print(f"Research summary written to '{filepath}'.")
 
-print(os.getenv("PROJECT_ENDPOINT")),
 
-project_client = AIProjectClient(
-    endpoint=os.getenv("PROJECT_ENDPOINT"),
-    credential=DefaultAzureCredential(),
-)
+def create_research_summary(
+        message : ThreadMessage,
+        filepath: str = "research_summary.md"
+) -> None:
+    if not message:
+        print("No message content provided, cannot create research summary.")
+        return
+    write_research_summary(research_result(message), filepath)
 
-conn_id = project_client.connections.get(name=os.getenv("BING_RESOURCE_NAME")).id
+def create_project_client() -> AIProjectClient:
+    print(os.getenv("PROJECT_ENDPOINT")),
 
+    return AIProjectClient(
+        endpoint=os.getenv("PROJECT_ENDPOINT"),
+        credential=DefaultAzureCredential(),
+    )
 
-# Initialize a Deep Research tool with Bing Connection ID and Deep Research model deployment name
-deep_research_tool = DeepResearchTool(
-    bing_grounding_connection_id=conn_id,
-    deep_research_model=os.getenv("DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"),
-)
 
-# Create Agent with the Deep Research tool and process Agent run
-with project_client:
-
-    with project_client.agents as agents_client:
-
-        # Create a new agent that has the Deep Research tool attached.
-        agent = agents_client.create_agent(
-            model=os.getenv("MODEL_DEPLOYMENT_NAME"),
-            name="deep-research-agent",
-            instructions="You are a helpful Agent that assists in researching scientific topics.",
-            tools=deep_research_tool.definitions,
-        )
-        print(f"Created agent, ID: {agent.id}")
-
-        # Create thread for communication
-        thread = agents_client.threads.create()
-        print(f"Created thread, ID: {thread.id}")
-
-        # user_content = "Research data regarding the investment in renewable energy, energy capacity, and energy consumption of countries in Sub-Saharan Africa"
-        user_content = "分析美国加息政策对全球高等教育的影响，特别是对中国留学生的影响。请提供相关数据和研究结果。结果以简单中文输出。"
-        last_message_id = None
-        while True:
-            message = agents_client.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=user_content,
-            )
-            print(f"Created message, ID: {message.id}")
-
-            print("Start processing the message... this may take a few minutes to finish. Be patient!")
-            run = agents_client.runs.create(thread_id=thread.id, agent_id=agent.id)
-            agent_response = None
-            while run.status in ("queued", "in_progress"):
-                time.sleep(1)
-                run = agents_client.runs.get(thread_id=thread.id, run_id=run.id)
-                last_message_id, agent_response = fetch_and_print_new_agent_response(
+def get_connection_id(
+    project_client: AIProjectClient,
+    name: str,
+    cache: Optional[ResourceCache] = None,
+) -> str:
+    endpoint = os.getenv("PROJECT_ENDPOINT")
+    conn_id = cache.get_connection(endpoint, name) if cache else None
+    if conn_id is None:
+        conn_id = project_client.connections.get(name=name).id
+        if cache:
+            cache.set_connection(endpoint, name, conn_id)
+    return conn_id
+
+
+def create_research_agent(
+    project_client: AIProjectClient,
+    agents_client: AgentsClient,
+    cache: Optional[ResourceCache] = None,
+):
+    """Return (agent, agent config key). With a cache, an agent created earlier with the same
+    model, instructions and tools is reused instead of creating another one."""
+    conn_id = get_connection_id(project_client, os.getenv("BING_RESOURCE_NAME"), cache)
+
+    # Initialize a Deep Research tool with Bing Connection ID and Deep Research model deployment name
+    deep_research_tool = DeepResearchTool(
+        bing_grounding_connection_id=conn_id,
+        deep_research_model=os.getenv("DEEP_RESEARCH_MODEL_DEPLOYMENT_NAME"),
+    )
+
+    model = os.getenv("MODEL_DEPLOYMENT_NAME")
+    key = agent_key(os.getenv("PROJECT_ENDPOINT"), model, AGENT_NAME, AGENT_INSTRUCTIONS,
+                    [definition.as_dict() for definition in deep_research_tool.definitions])
+    agent_id = cache.get_agent(key) if cache else None
+    if agent_id is not None:
+        try:
+            agent = agents_client.get_agent(agent_id)
+            print(f"Reusing agent, ID: {agent.id}")
+            return agent, key
+        except ResourceNotFoundError:
+            # Deleted on the service since it was cached
+            cache.set_agent(key, None)
+
+    # Create a new agent that has the Deep Research tool attached.
+    agent = agents_client.create_agent(
+        model=model,
+        name=AGENT_NAME,
+        instructions=AGENT_INSTRUCTIONS,
+        tools=deep_research_tool.definitions,
+    )
+    print(f"Created agent, ID: {agent.id}")
+    if cache:
+        cache.set_agent(key, agent.id)
+    return agent, key
+
+
+def main(stream: bool = True, use_cache: bool = True) -> None:
+    resource_cache = ResourceCache(CACHE_DIR) if use_cache else None
+    result_cache = ResultCache(CACHE_DIR) if use_cache else None
+    project_client = create_project_client()
+
+    # Create Agent with the Deep Research tool and process Agent run
+    with project_client:
+
+        with project_client.agents as agents_client:
+
+            agent, config_key = create_research_agent(project_client, agents_client, resource_cache)
+
+            # user_content = "Research data regarding the investment in renewable energy, energy capacity, and energy consumption of countries in Sub-Saharan Africa"
+            user_content = "分析美国加息政策对全球高等教育的影响，特别是对中国留学生的影响。请提供相关数据和研究结果。结果以简单中文输出。"
+
+            # Only the opening prompt of a fresh thread is cached; follow-ups depend on the thread
+            result_key = prompt_key(user_content, config_key)
+            cached = result_cache.get(result_key) if result_cache else None
+            if cached is not None:
+                print("\nAgent response (cached, run with --no-cache to research again):")
+                print("\n".join(cached["texts"]))
+                write_research_summary(cached)
+                return
+
+            # Create thread for communication
+            thread = agents_client.threads.create()
+            print(f"Created thread, ID: {thread.id}")
+
+            last_message_id = None
+            while True:
+                message = agents_client.messages.create(
                     thread_id=thread.id,
-                    agents_client=agents_client,
-                    last_message_id=last_message_id,
+                    role="user",
+                    content=user_content,
                 )
-                print(f"Run status: {run.status}")
-
-            print(f"Run finished with status: {run.status}, ID: {run.id}")
+                print(f"Created message, ID: {message.id}")
 
-            if run.status == "failed":
-                print(f"Run failed: {run.last_error}")
-                break
+                print("Start processing the message... this may take a few minutes to finish. Be patient!")
+                run = execute_run(agents_client, thread.id, agent.id, stream=stream)
 
-            # let customer decide whether to add more content or finish the research summary
-            if agent_response:
-                user_decision = input("Any supplementaries? (y/n，n will finish and compose final deliverables)：").strip().lower()
-                if user_decision == "y":
-                    user_content = input("Supplementary content: ")
-                    continue
+                # One fetch once the run is done; with streaming the text has already been printed
+                if stream:
+                    last_message_id, agent_response = fetch_new_agent_response(
+                        thread_id=thread.id,
+                        agents_client=agents_client,
+                        last_message_id=last_message_id,
+                    )
+                    if agent_response:
+                        print_citations(agent_response)
                 else:
-                    create_research_summary(agent_response)
+                    last_message_id, agent_response = fetch_and_print_new_agent_response(
+                        thread_id=thread.id,
+                        agents_client=agents_client,
+                        last_message_id=last_message_id,
+                    )
+
+                print(f"Run finished with status: {run.status}, ID: {run.id}")
+
+                if run.status == "failed":
+                    print(f"Run failed: {run.last_error}")
                     break
 
-        # Clean-up and delete the agent once the run is finished.
-        # NOTE: Comment out this line if you plan to reuse the agent later.
-        # agents_client.delete_agent(agent.id)
-        # print("Deleted agent")
+                if agent_response and result_cache and result_key:
+                    result_cache.put(result_key, research_result(agent_response))
+                    result_key = None
+
+                # let customer decide whether to add more content or finish the research summary
+                if agent_response:
+                    user_decision = input("Any supplementaries? (y/n，n will finish and compose final deliverables)：").strip().lower()
+                    if user_decision == "y":
+                        user_content = input("Supplementary content: ")
+                        continue
+                    else:
+                        create_research_summary(agent_response)
+                        break
+
+            # Clean-up and delete the agent once the run is finished.
+            # NOTE: The agent is cached for the next run; uncomment only together with --no-cache.
+            # agents_client.delete_agent(agent.id)
+            # print("Deleted agent")
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deep research agent")
+    parser.add_argument("--poll", action="store_true", help="poll the run with backoff instead of streaming it")
+    parser.add_argument("--no-cache", action="store_true", help="always create the agent and run the research")
+    args = parser.parse_args()
+    main(stream=not args.poll, use_cache=not args.no_cache)
@@ -1,246 +1,842 @@
-import requests
-import time
-import statistics
-import json
-import concurrent.futures
-import matplotlib.pyplot as plt
-from datetime import datetime
-
-# Configuration for the three regions
-regions = {
-    "East US": {
-        "endpoint": "https://eastus.api.cognitive.microsoft.com/",
-        "api_key": "###",
-        "deployment": "gpt-4o"
-    },
-    "West US": {
-        "endpoint": "https://westus.api.cognitive.microsoft.com/",
-        "api_key": "###",
-        "deployment": "gpt-4o"
-    },
-    "Japan East": {
-        "endpoint": "https://japaneast.api.cognitive.microsoft.com/",
-        "api_key": "###",
-        "deployment": "gpt-4o"
-    }
-}
-
-# Test prompts of varying complexity
-test_prompts = [
-    "Hello, how are you?",  # Short prompt
-    "Explain the theory of relativity in 100 words.",  # Medium prompt
-    "Write a detailed analysis of global economic trends over the past decade...",  # Long prompt
-]
-
-# Function to execute a single test case (region + prompt + iteration)
-def execute_test_case(args):
-    region, prompt, iteration = args
-    result = test_latency(region, prompt)
-    
-    # Safe printing of results (handling None values)
-    latency_str = f"{result['latency']:.4f}s" if result['latency'] is not None else "Failed"
-    print(f"Region: {region}, Iteration: {iteration+1}, Latency: {latency_str}")
-    
-    return result
-
-# Function to test latency for a single request
-def test_latency(region_name, prompt, is_warmup=False):
-    region_config = regions[region_name]
-    
-    headers = {
-        "Content-Type": "application/json",
-        "api-key": region_config["api_key"]
-    }
-    
-    data = {
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 100
-    }
-    
-    url = f"{region_config['endpoint']}openai/deployments/{region_config['deployment']}/chat/completions?api-version=2024-12-01-preview"
-    
-    start_time = time.time()
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        elapsed = time.time() - start_time
-        
-        if not is_warmup:
-            return {
-                "region": region_name,
-                "prompt_length": len(prompt),
-                "latency": elapsed,
-                "status": "success"
-            }
-        return None
-    except Exception as e:
-        if not is_warmup:
-            return {
-                "region": region_name,
-                "prompt_length": len(prompt),
-                "latency": None,
-                "status": f"error: {str(e)}"
-            }
-        return None
-
-# Warmup function to initialize connections
-def perform_warmup():
-    print("Performing warmup calls...")
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(regions)) as executor:
-        futures = []
-        for region in regions:
-            futures.append(executor.submit(test_latency, region, "Warmup call", True))
-        concurrent.futures.wait(futures)
-    time.sleep(2)  # Brief pause after warmup
-    print("Warmup complete")
-
-# Main testing function with parallel execution
-def run_latency_tests(iterations=5, warmup=True, max_workers=10):
-    if warmup:
-        perform_warmup()
-    
-    results = []
-    print(f"Starting parallel latency tests across {len(regions)} regions with {len(test_prompts)} prompts, {iterations} iterations each...")
-    
-    # Create a list of all test cases
-    test_cases = []
-    for prompt_idx, prompt in enumerate(test_prompts):
-        for i in range(iterations):
-            for region in regions:
-                test_cases.append((region, prompt, i))
-    
-    # Execute test cases in parallel
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_case = {executor.submit(execute_test_case, case): case for case in test_cases}
-        
-        for future in concurrent.futures.as_completed(future_to_case):
-            result = future.result()
-            if result:
-                results.append(result)
-    
-    return results
-
-# Analyze and visualize results
-def analyze_results(results):
-    # Filter out any failed requests
-    valid_results = [r for r in results if r["latency"] is not None]
-    
-    if not valid_results:
-        print("No valid results to analyze!")
-        return
-    
-    # Group by region
-    region_results = {}
-    for region in regions:
-        region_results[region] = [r["latency"] for r in valid_results if r["region"] == region]
-    
-    # Calculate statistics
-    stats = {}
-    for region, latencies in region_results.items():
-        if latencies:
-            stats[region] = {
-                "min": min(latencies),
-                "max": max(latencies),
-                "avg": statistics.mean(latencies),
-                "median": statistics.median(latencies),
-                "p95": statistics.quantiles(latencies, n=20)[18] if len(latencies) >= 20 else None,
-                "std_dev": statistics.stdev(latencies) if len(latencies) > 1 else 0,
-                "sample_size": len(latencies)
-            }
-    
-    # Print statistics
-    print("\n===== LATENCY STATISTICS (seconds) =====")
-    for region, region_stats in stats.items():
-        print(f"\n{region} (Sample size: {region_stats['sample_size']}):")
-        print(f"  Min: {region_stats['min']:.4f}s")
-        print(f"  Max: {region_stats['max']:.4f}s")
-        print(f"  Avg: {region_stats['avg']:.4f}s")
-        print(f"  Median: {region_stats['median']:.4f}s")
-        if region_stats['p95']:
-            print(f"  95th percentile: {region_stats['p95']:.4f}s")
-        print(f"  Standard Deviation: {region_stats['std_dev']:.4f}s")
-    
-    # Count failures
-    failures = [r for r in results if r["latency"] is None]
-    if failures:
-        print(f"\nFailed requests: {len(failures)}/{len(results)} ({len(failures)/len(results)*100:.1f}%)")
-        for region in regions:
-            region_failures = [f for f in failures if f["region"] == region]
-            if region_failures:
-                print(f"  {region}: {len(region_failures)} failures")
-    
-    # Create visualization
-    plt.figure(figsize=(12, 8))
-    
-    # Box plot
-    plt.subplot(2, 1, 1)
-    plt.boxplot([latencies for region, latencies in region_results.items() if latencies], 
-                labels=[f"{region}\n(n={len(latencies)})" for region, latencies in region_results.items() if latencies], 
-                showfliers=True)
-    plt.title('GPT-4o Latency Comparison by Region')
-    plt.ylabel('Latency (seconds)')
-    plt.grid(True, linestyle='--', alpha=0.7)
-    
-    # Bar chart with error bars
-    plt.subplot(2, 1, 2)
-    regions_list = list(stats.keys())
-    avgs = [stats[r]["avg"] for r in regions_list]
-    std_devs = [stats[r]["std_dev"] for r in regions_list]
-    
-    bars = plt.bar(regions_list, avgs, yerr=std_devs, alpha=0.7, capsize=10)
-    
-    # Add value labels on top of bars
-    for bar, avg in zip(bars, avgs):
-        plt.text(bar.get_x() + bar.get_width()/2., bar.get_height() + 0.02,
-                f'{avg:.3f}s', ha='center', va='bottom', fontweight='bold')
-    
-    plt.title('Average Latency by Region')
-    plt.ylabel('Latency (seconds)')
-    plt.ylim(top=max(avgs) * 1.2)  # Add some headroom for labels
-    plt.grid(True, linestyle='--', alpha=0.7, axis='y')
-    
-    plt.tight_layout()
-    plt.savefig('azure_gpt4o_latency_comparison.png')
-    print("\nVisualization saved as 'azure_gpt4o_latency_comparison.png'")
-    
-    # Prompt length analysis
-    plt.figure(figsize=(12, 6))
-    prompt_lengths = sorted(list(set([r["prompt_length"] for r in valid_results])))
-    
-    for region in regions:
-        region_by_length = {}
-        for length in prompt_lengths:
-            region_by_length[length] = [
-                r["latency"] for r in valid_results 
-                if r["region"] == region and r["prompt_length"] == length
-            ]
-        
-        avgs_by_length = [statistics.mean(latencies) if latencies else 0 
-                          for length, latencies in region_by_length.items()]
-        
-        plt.plot(prompt_lengths, avgs_by_length, marker='o', label=region)
-    
-    plt.title('Latency by Prompt Length')
-    plt.xlabel('Prompt Length (characters)')
-    plt.ylabel('Average Latency (seconds)')
-    plt.legend()
-    plt.grid(True, linestyle='--', alpha=0.7)
-    plt.tight_layout()
-    plt.savefig('azure_gpt4o_latency_by_prompt_length.png')
-    print("Prompt length analysis saved as 'azure_gpt4o_latency_by_prompt_length.png'")
-    
-    # Save raw results
-    with open('latency_test_results.json', 'w') as f:
-        json.dump({
-            "raw_data": results,
-            "statistics": stats,
-            "test_time": datetime.now().isoformat()
-        }, f, indent=2)
-    
-    print("Raw results saved as 'latency_test_results.json'")
-
-# Run everything
-if __name__ == "__main__":
-    # Can adjust the parallelism level and number of iterations
-    results = run_latency_tests(iterations=10, warmup=True, max_workers=15)
-    analyze_results(results)
+import requests
+import time
+import json
+import socket
+import ssl
+import http.client
+import threading
+import functools
+import concurrent.futures
+import requests.adapters
+from urllib.parse import urlsplit
+from datetime import datetime
+import numpy as np
+from LatencyStats import LatencyAggregator, LatencyHistogram, PERCENTILES
+from LatencyDashboard import LiveStats, TerminalDashboard
+from RetryPolicy import NO_RETRY, OUTCOMES, classify_outcome, parse_retry_after
+from ProviderAdapters import OpenAIAdapter, adapter_for
+
+# Configuration for the three regions. Entries are Azure OpenAI unless they set "provider"
+# (see ProviderAdapters.py), so other backends run under the same load and reports, e.g.
+#   "Databricks Claude": {"provider": "databricks", "endpoint": "https://adb-<workspace>.azuredatabricks.net/",
+#                         "api_key": "###", "deployment": "databricks-claude-3-7-sonnet"},
+regions = {
+    "East US": {
+        "endpoint": "https://eastus.api.cognitive.microsoft.com/",
+        "api_key": "###",
+        "deployment": "gpt-4o"
+    },
+    "West US": {
+        "endpoint": "https://westus.api.cognitive.microsoft.com/",
+        "api_key": "###",
+        "deployment": "gpt-4o"
+    },
+    "Japan East": {
+        "endpoint": "https://japaneast.api.cognitive.microsoft.com/",
+        "api_key": "###",
+        "deployment": "gpt-4o"
+    }
+}
+
+# How requests reach each region:
+#   "cold"   - a new TCP+TLS connection per request (bare requests.post)
+#   "pooled" - a keep-alive requests.Session per region shared by all worker threads
+#   "http2"  - an httpx HTTP/2 client per region, multiplexing requests over few connections
+CONNECTION_MODES = ("cold", "pooled", "http2")
+
+# Pool settings for the shared per-region sessions
+connection_settings = {
+    "pool_size": 20,     # max connections kept per region
+    "keep_alive": True,  # False sends "Connection: close" so every request re-handshakes
+}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Test prompts of varying complexity
+test_prompts = [
+    "Hello, how are you?",  # Short prompt
+    "Explain the theory of relativity in 100 words.",  # Medium prompt
+    "Write a detailed analysis of global economic trends over the past decade...",  # Long prompt
+]
+
+# Default completion length requested per call
+MAX_TOKENS = 100
+
+# USD per 1M tokens by deployment, used for the cost estimates in analyze_results.
+# List prices for gpt-4o global standard; check current Azure pricing for your deployment type.
+token_prices = {
+    "gpt-4o": {"input": 2.50, "output": 10.00},
+}
+
+# Filler for synthetic prompts: short common words that are one token each in the
+# cl100k/o200k encodings, so word count tracks token count closely
+SYNTHETIC_WORDS = ("the quick brown fox jumps over a lazy dog while seven bright stars "
+                   "glow above quiet green hills and old stone walls").split()
+SYNTHETIC_INSTRUCTION = "Summarize the following text in one paragraph:\n"
+
+@functools.lru_cache(maxsize=1)
+def _token_encoding():
+    try:
+        import tiktoken  # optional: pip install tiktoken
+        # The encoding file is downloaded on first use, which fails on isolated load boxes
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+# Function to count prompt tokens, falling back to ~4 characters per token without tiktoken
+def count_tokens(text):
+    encoding = _token_encoding()
+    if encoding is None:
+        return max(1, round(len(text) / 4))
+    return len(encoding.encode(text))
+
+# Function to build a prompt of roughly target_tokens tokens. The service's usage field
+# reports the exact count; this only needs to land close to the requested size.
+def generate_prompt(target_tokens):
+    words_needed = max(1, target_tokens - count_tokens(SYNTHETIC_INSTRUCTION))
+    words = [SYNTHETIC_WORDS[i % len(SYNTHETIC_WORDS)] for i in range(words_needed)]
+    return SYNTHETIC_INSTRUCTION + " ".join(words)
+
+# Function to build one synthetic prompt per target length, e.g. [100, 1000, 8000, 32000]
+def generate_prompts(token_lengths):
+    return [generate_prompt(n) for n in token_lengths]
+
+# Function to execute a single test case (region + prompt + iteration)
+# With a live dashboard the per-request line is skipped, the dashboard shows the totals.
+def execute_test_case(args, stream=False, connection_mode="pooled", live_stats=None, max_tokens=MAX_TOKENS,
+                      retry_policy=NO_RETRY):
+    region, prompt, iteration = args
+    if live_stats is not None:
+        live_stats.request_started(region)
+    result = test_latency(region, prompt, stream=stream, connection_mode=connection_mode, max_tokens=max_tokens,
+                          retry_policy=retry_policy)
+    if live_stats is not None:
+        live_stats.request_finished(result)
+        return result
+    
+    # Safe printing of results (handling None values)
+    latency_str = f"{result['latency']:.4f}s" if result['latency'] is not None else "Failed"
+    if result.get("ttft") is not None:
+        latency_str += f", TTFT: {result['ttft']:.4f}s"
+    if result.get("attempts", 1) > 1:
+        latency_str += f", Attempts: {result['attempts']}"
+    print(f"Region: {region}, Iteration: {iteration+1}, Latency: {latency_str}")
+    
+    return result
+
+# Function to build the url, headers and body of a chat request for a region, in the shape
+# of the region's provider
+def build_request(region_name, prompt, max_tokens=MAX_TOKENS, stream=False):
+    url, headers, data = adapter_for(regions[region_name]).build_request(
+        [{"role": "user", "content": prompt}], max_tokens, stream)
+    if not connection_settings["keep_alive"]:
+        headers["Connection"] = "close"
+    return url, headers, data
+
+# Function to get the shared client for a region. Sessions are created once per
+# (region, mode) and shared by all worker threads, so connections opened during warmup
+# are reused by the measured requests.
+def get_session(region_name, connection_mode="pooled"):
+    key = (region_name, connection_mode)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            pool_size = connection_settings["pool_size"]
+            if connection_mode == "http2":
+                import httpx  # only needed for HTTP/2: pip install "httpx[http2]"
+                session = httpx.Client(
+                    http2=True,
+                    timeout=120,
+                    limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+                )
+            else:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+            _sessions[key] = session
+    return session
+
+# Function to close every shared session (call once the benchmark is finished)
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+# Function to record a failed attempt on result: HTTP status and Retry-After (when the
+# exception carries a response), outcome class and error text
+def record_failure(result, exception):
+    response = getattr(exception, "response", None)
+    if result.get("status_code") is None and response is not None:
+        result["status_code"] = getattr(response, "status_code", None)
+        result["retry_after"] = parse_retry_after(getattr(response, "headers", None))
+    result["error_type"] = classify_outcome(result.get("status_code"), exception)
+    result["latency"] = None
+    result["status"] = f"error: {str(exception)}"
+
+# Function to test latency for a single request. Failed attempts are retried according
+# to retry_policy (the default NO_RETRY sends exactly one attempt); latency is then the
+# end-to-end time including backoff waits, as a production client would see it.
+def test_latency(region_name, prompt, is_warmup=False, stream=False, connection_mode="pooled", max_tokens=MAX_TOKENS,
+                 retry_policy=NO_RETRY):
+    start_time = time.perf_counter()
+    attempt = 0
+    retry_wait = 0.0
+    throttle_wait = 0.0
+    first_attempt = None
+    while True:
+        attempt += 1
+        attempt_offset = time.perf_counter() - start_time
+        timeout = retry_policy.attempt_timeout(start_time)
+        if stream:
+            result = test_streaming_latency(region_name, prompt, connection_mode, max_tokens, timeout)
+        else:
+            result = test_single_request(region_name, prompt, connection_mode, max_tokens, timeout)
+        if first_attempt is None:
+            first_attempt = result
+        if result["status"] == "success":
+            break
+        delay = retry_policy.next_delay(attempt, result["error_type"], start_time, result.get("retry_after"))
+        if delay is None:
+            break
+        time.sleep(delay)
+        retry_wait += delay
+        if result["error_type"] == "throttled":
+            throttle_wait += delay
+
+    if is_warmup:
+        return None
+    result.pop("retry_after", None)
+    result["attempts"] = attempt
+    result["retry_wait"] = retry_wait
+    result["throttle_wait"] = throttle_wait
+    # What a client without retries would have seen
+    result["first_attempt_latency"] = first_attempt["latency"]
+    result["first_attempt_outcome"] = first_attempt["error_type"]
+    if attempt > 1 and result["status"] == "success":
+        result["latency"] = time.perf_counter() - start_time
+        if result.get("ttft") is not None:
+            result["ttft"] += attempt_offset
+    return result
+
+# Function to send one non-streaming request
+def test_single_request(region_name, prompt, connection_mode="pooled", max_tokens=MAX_TOKENS, timeout=120):
+    url, headers, data = build_request(region_name, prompt, max_tokens)
+    result = {
+        "region": region_name,
+        "prompt_length": len(prompt),
+        "latency": None,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "deployment": regions[region_name]["deployment"],
+        "connection_mode": connection_mode,
+        "status_code": None,
+    }
+    
+    start_time = time.perf_counter()
+    try:
+        if connection_mode == "cold":
+            # A bare requests.post opens (and tears down) its own connection every time
+            response = requests.post(url, headers=headers, json=data, timeout=timeout)
+        else:
+            response = get_session(region_name, connection_mode).post(url, headers=headers, json=data, timeout=timeout)
+        response.raise_for_status()
+        elapsed = time.perf_counter() - start_time
+        prompt_tokens, completion_tokens = adapter_for(regions[region_name]).parse_usage(response.json())
+        
+        result.update({
+            "latency": elapsed,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "status_code": response.status_code,
+            "error_type": "success",
+            "status": "success"
+        })
+    except Exception as e:
+        record_failure(result, e)
+    return result
+
+# Function to read an SSE chat completions body, filling in TTFT, inter-token gaps,
+# token counts and total time on result. Lines may be bytes or str; the adapter decodes
+# each chunk (OpenAI chat completion chunks when not given).
+def read_sse_stream(lines, result, start_ns, adapter=None):
+    parse_chunk = (adapter or OpenAIAdapter).parse_chunk
+    first_token_ns = None
+    last_token_ns = None
+    content_chunks = 0
+    for raw_line in lines:
+        line = raw_line.strip()
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            continue
+        payload = line[5:].strip()
+        if payload == "[DONE]":
+            break
+        text, usage = parse_chunk(json.loads(payload))
+        if usage:
+            result.update((key, value) for key, value in usage.items() if value is not None)
+        if not text:
+            continue
+        now_ns = time.perf_counter_ns()
+        if first_token_ns is None:
+            first_token_ns = now_ns
+        else:
+            result["inter_token_gaps"].append((now_ns - last_token_ns) / 1e9)
+        last_token_ns = now_ns
+        content_chunks += 1
+    end_ns = time.perf_counter_ns()
+
+    result["latency"] = (end_ns - start_ns) / 1e9
+    if first_token_ns is not None:
+        result["ttft"] = (first_token_ns - start_ns) / 1e9
+        # Fall back to counting content chunks when the service sends no usage chunk
+        if result["completion_tokens"] is None:
+            result["completion_tokens"] = content_chunks
+        generation_s = (end_ns - first_token_ns) / 1e9
+        if generation_s > 0:
+            result["tokens_per_sec"] = result["completion_tokens"] / generation_s
+
+# Function to test a streaming request, splitting latency into its phases.
+# For cold connections the socket is opened by hand (getaddrinfo -> TCP connect -> TLS
+# handshake) so each phase can be timed, and http.client sends the request over it.
+# Pooled modes reuse the shared session, so the connection phases are left as None.
+# All timings use perf_counter_ns and are reported in seconds.
+def test_streaming_latency(region_name, prompt, connection_mode="pooled", max_tokens=MAX_TOKENS, timeout=120):
+    url, headers, data = build_request(region_name, prompt, max_tokens, stream=True)
+    adapter = adapter_for(regions[region_name])
+
+    result = {
+        "region": region_name,
+        "prompt_length": len(prompt),
+        "latency": None,
+        "deployment": regions[region_name]["deployment"],
+        "connection_mode": connection_mode,
+        "dns_time": None,
+        "connect_time": None,
+        "tls_time": None,
+        "ttft": None,
+        "inter_token_gaps": [],
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "tokens_per_sec": None,
+        "status_code": None,
+    }
+    conn = None
+    start_ns = time.perf_counter_ns()
+    try:
+        if connection_mode == "cold":
+            parts = urlsplit(url)
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            addr_info = socket.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+            dns_ns = time.perf_counter_ns()
+            family, socktype, proto, _, sockaddr = addr_info[0]
+            sock = socket.socket(family, socktype, proto)
+            sock.settimeout(timeout)
+            sock.connect(sockaddr)
+            connect_ns = time.perf_counter_ns()
+            if parts.scheme == "https":
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+                conn = http.client.HTTPSConnection(parts.hostname, port)
+            else:
+                conn = http.client.HTTPConnection(parts.hostname, port)
+            tls_ns = time.perf_counter_ns()
+            conn.sock = sock
+
+            path = parts.path + (f"?{parts.query}" if parts.query else "")
+            conn.request("POST", path, body=json.dumps(data), headers=headers)
+            response = conn.getresponse()
+            result["status_code"] = response.status
+            if response.status >= 400:
+                result["retry_after"] = parse_retry_after(response.headers)
+                raise requests.HTTPError(f"{response.status} {response.reason} for url: {url}")
+            read_sse_stream(response, result, start_ns, adapter)
+
+            result["dns_time"] = (dns_ns - start_ns) / 1e9
+            result["connect_time"] = (connect_ns - dns_ns) / 1e9
+            result["tls_time"] = (tls_ns - connect_ns) / 1e9 if parts.scheme == "https" else 0.0
+        elif connection_mode == "http2":
+            with get_session(region_name, connection_mode).stream("POST", url, headers=headers, json=data, timeout=timeout) as response:
+                response.raise_for_status()
+                result["status_code"] = response.status_code
+                read_sse_stream(response.iter_lines(), result, start_ns, adapter)
+        else:
+            with get_session(region_name, connection_mode).post(url, headers=headers, json=data, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                result["status_code"] = response.status_code
+                read_sse_stream(response.iter_lines(), result, start_ns, adapter)
+
+        result["error_type"] = "success"
+        result["status"] = "success"
+        return result
+    except Exception as e:
+        record_failure(result, e)
+        return result
+    finally:
+        if conn is not None:
+            conn.close()
+
+# Warmup function to initialize connections. With a pooled mode, connections_per_region
+# concurrent calls leave that many open connections in each region's pool.
+def perform_warmup(connection_mode="pooled", connections_per_region=1):
+    print("Performing warmup calls...")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(regions) * connections_per_region) as executor:
+        futures = []
+        for region in regions:
+            for _ in range(connections_per_region):
+                futures.append(executor.submit(test_latency, region, "Warmup call", True, False, connection_mode))
+        concurrent.futures.wait(futures)
+    time.sleep(2)  # Brief pause after warmup
+    print("Warmup complete")
+
+# Main testing function with parallel execution
+# Results are fed to aggregator (if given) as each future completes; keep_results=False
+# drops the raw dicts afterwards so memory stays constant over long soak runs.
+# live=True redraws a per-region dashboard every second while the test runs.
+# prompts defaults to test_prompts; pass generate_prompts([...]) for token-sized prompts.
+# retry_policy=RetryPolicy(...) retries throttled/failed calls the way production clients do.
+# result_store=LatencyResultStore.ResultWriter(...) appends every result to the columnar store.
+def run_latency_tests(iterations=5, warmup=True, max_workers=10, stream=False, connection_mode="pooled",
+                      aggregator=None, keep_results=True, live=False, prompts=None, max_tokens=MAX_TOKENS,
+                      retry_policy=NO_RETRY, result_store=None):
+    prompts = prompts or test_prompts
+    if warmup:
+        # Warm roughly as many connections per region as workers will hit it concurrently
+        connections_per_region = 1
+        if connection_mode != "cold":
+            connections_per_region = max(1, min(connection_settings["pool_size"], max_workers // len(regions)))
+        perform_warmup(connection_mode, connections_per_region)
+    
+    results = []
+    print(f"Starting parallel latency tests across {len(regions)} regions with {len(prompts)} prompts, {iterations} iterations each ({connection_mode} connections)...")
+    
+    # Create a list of all test cases
+    test_cases = []
+    for prompt_idx, prompt in enumerate(prompts):
+        for i in range(iterations):
+            for region in regions:
+                test_cases.append((region, prompt, i))
+    
+    live_stats = LiveStats() if live else None
+    dashboard = TerminalDashboard(live_stats).start() if live else None
+    
+    # Execute test cases in parallel
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_case = {executor.submit(execute_test_case, case, stream, connection_mode, live_stats, max_tokens,
+                                              retry_policy): case
+                              for case in test_cases}
+            
+            for future in concurrent.futures.as_completed(future_to_case):
+                result = future.result()
+                if result:
+                    if aggregator is not None:
+                        aggregator.add_result(result)
+                    if result_store is not None:
+                        result_store.add_result(result)
+                    if keep_results:
+                        results.append(result)
+    finally:
+        if dashboard is not None:
+            dashboard.stop()
+    
+    return results
+
+# Run the same test once per connection mode and report how much of the latency is
+# connection setup: the gap between "cold" and "pooled" is TCP+TLS handshake overhead,
+# the gap between "pooled" and "http2" is what multiplexing buys on top.
+def compare_connection_modes(iterations=5, max_workers=10, stream=False, modes=CONNECTION_MODES):
+    results_by_mode = {}
+    aggregators = {}
+    for mode in modes:
+        aggregators[mode] = LatencyAggregator()
+        results_by_mode[mode] = run_latency_tests(iterations, True, max_workers, stream, mode, aggregators[mode])
+
+    print("\n===== CONNECTION MODE COMPARISON (median / p95 / p99, seconds) =====")
+    comparison = {}
+    for region in regions:
+        comparison[region] = {}
+        print(f"\n{region}:")
+        for mode, aggregator in aggregators.items():
+            summary = aggregator.histogram("latency", region).summary()
+            if summary is None:
+                print(f"  {mode:<7} no successful requests")
+                continue
+            comparison[region][mode] = summary
+            print(f"  {mode:<7} median {summary['median']:.4f}s  p95 {summary['p95']:.4f}s  p99 {summary['p99']:.4f}s")
+        if "cold" in comparison[region] and "pooled" in comparison[region]:
+            overhead = comparison[region]["cold"]["median"] - comparison[region]["pooled"]["median"]
+            print(f"  handshake overhead (cold - pooled median): {overhead*1000:.1f}ms")
+
+    return results_by_mode, comparison
+
+# Streaming metrics reported per region, as (result key, label, unit)
+STREAMING_METRICS = [
+    ("dns_time", "DNS", "s"),
+    ("connect_time", "TCP connect", "s"),
+    ("tls_time", "TLS handshake", "s"),
+    ("ttft", "Time to first token", "s"),
+    ("inter_token_gaps", "Inter-token gap", "s"),
+    ("tokens_per_sec", "Tokens/sec", "tok/s"),
+    ("latency", "Total", "s"),
+]
+
+# Function to import pyplot only when a plot is actually drawn, so headless load boxes and
+# plots=False runs never load matplotlib. Plots are only saved to files, so the non-GUI
+# Agg backend is used.
+def _pyplot():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+# Function to turn a histogram into the precomputed box statistics plt.bxp draws, so box
+# plots need no raw samples. Whiskers are p1/p99; min and max are drawn as fliers.
+def histogram_box_stats(histogram, label):
+    whislo, q1, med, q3, whishi = histogram.quantiles([0.01, 0.25, 0.5, 0.75, 0.99]).tolist()
+    return {
+        "label": label,
+        "med": med,
+        "q1": q1,
+        "q3": q3,
+        "whislo": whislo,
+        "whishi": whishi,
+        "fliers": [histogram.min, histogram.max],
+    }
+
+# Function to format the percentile part of a summary line
+def format_percentiles(dist, unit="s"):
+    return ", ".join(f"p{p:g} {dist[f'p{p:g}']:.4f}{unit}" for p in PERCENTILES)
+
+# Analyze the per-phase distributions of streaming results
+def analyze_streaming_results(aggregator, plots=True):
+    if aggregator.histogram("ttft").count == 0:
+        return {}
+
+    streaming_stats = {}
+    print("\n===== STREAMING LATENCY STATISTICS =====")
+    for region in aggregator.regions():
+        ttft_histogram = aggregator.histogram("ttft", region)
+        if ttft_histogram.count == 0:
+            continue
+        streaming_stats[region] = {}
+        print(f"\n{region} (Streams: {ttft_histogram.count}):")
+        for key, label, unit in STREAMING_METRICS:
+            dist = aggregator.histogram(key, region).summary()
+            if dist is None:
+                continue
+            streaming_stats[region][key] = dist
+            print(f"  {label}: avg {dist['avg']:.4f}{unit}, median {dist['median']:.4f}{unit}, max {dist['max']:.4f}{unit}")
+            print(f"    {format_percentiles(dist, unit)}")
+
+    if not plots:
+        return streaming_stats
+
+    # TTFT and generation speed side by side
+    plt = _pyplot()
+    plt.figure(figsize=(12, 8))
+    ax = plt.subplot(2, 1, 1)
+    ax.bxp([histogram_box_stats(aggregator.histogram("ttft", region), f"{region}\n(n={stats['ttft']['sample_size']})")
+            for region, stats in streaming_stats.items()], showfliers=True)
+    plt.title('GPT-4o Time to First Token by Region (whiskers p1-p99)')
+    plt.ylabel('TTFT (seconds)')
+    plt.grid(True, linestyle='--', alpha=0.7)
+
+    ax = plt.subplot(2, 1, 2)
+    tps_regions = [region for region, stats in streaming_stats.items() if "tokens_per_sec" in stats]
+    if tps_regions:
+        ax.bxp([histogram_box_stats(aggregator.histogram("tokens_per_sec", region), region) for region in tps_regions],
+               showfliers=True)
+    plt.title('Generation Speed by Region')
+    plt.ylabel('Tokens per second')
+    plt.grid(True, linestyle='--', alpha=0.7)
+
+    plt.tight_layout()
+    plt.savefig('azure_gpt4o_ttft_comparison.png')
+    plt.close()
+    print("\nStreaming visualization saved as 'azure_gpt4o_ttft_comparison.png'")
+
+    return streaming_stats
+
+# Function to estimate the USD cost of 1,000 requests at the given average token counts
+def cost_per_1k_requests(deployment, avg_prompt_tokens, avg_completion_tokens):
+    prices = token_prices.get(deployment)
+    if prices is None:
+        return None
+    return 1000 * (avg_prompt_tokens * prices["input"] + avg_completion_tokens * prices["output"]) / 1_000_000
+
+# Analyze token usage: average prompt/completion size, output tokens/sec and cost per region
+def analyze_token_usage(aggregator):
+    token_stats = {}
+    for region in aggregator.regions():
+        prompt_histogram = aggregator.histogram("prompt_tokens", region)
+        completion_histogram = aggregator.histogram("completion_tokens", region)
+        if completion_histogram.count == 0:
+            continue
+        latency_total = aggregator.histogram("latency", region).total
+        avg_prompt = prompt_histogram.mean or 0
+        avg_completion = completion_histogram.mean
+        deployment = regions[region]["deployment"] if region in regions else None
+        token_stats[region] = {
+            "avg_prompt_tokens": avg_prompt,
+            "avg_completion_tokens": avg_completion,
+            # Output tokens per second of request time, averaged over all requests
+            "tokens_per_sec": completion_histogram.total / latency_total if latency_total else None,
+            "cost_per_1k_requests": cost_per_1k_requests(deployment, avg_prompt, avg_completion),
+        }
+
+    if token_stats:
+        print("\n===== TOKEN THROUGHPUT AND COST =====")
+        for region, region_stats in token_stats.items():
+            print(f"\n{region}:")
+            print(f"  Avg prompt tokens: {region_stats['avg_prompt_tokens']:.0f}")
+            print(f"  Avg completion tokens: {region_stats['avg_completion_tokens']:.0f}")
+            if region_stats["tokens_per_sec"] is not None:
+                print(f"  Output tokens/sec: {region_stats['tokens_per_sec']:.1f}")
+            if region_stats["cost_per_1k_requests"] is not None:
+                print(f"  Estimated cost per 1k requests: ${region_stats['cost_per_1k_requests']:.4f}")
+    return token_stats
+
+# Analyze retries: amplification, time lost to throttling, and latency with retries vs.
+# what a client that never retries would have seen (first attempt only)
+def analyze_retries(aggregator):
+    if aggregator.histogram("attempts", status=None).max in (None, 1):
+        return {}
+
+    retry_stats = {}
+    print("\n===== RETRIES AND THROTTLING =====")
+    for region in aggregator.regions():
+        requests_sent = aggregator.request_count(region)
+        attempts = aggregator.histogram("attempts", region, status=None)
+        if not requests_sent or attempts.count == 0:
+            continue
+        with_retries = aggregator.histogram("latency", region)
+        without_retries = aggregator.histogram("first_attempt_latency", region, status=None)
+        retry_stats[region] = {
+            "requests": requests_sent,
+            "attempts": attempts.total,
+            "retry_amplification": attempts.total / requests_sent,
+            "retry_wait_total": aggregator.histogram("retry_wait", region, status=None).total,
+            "throttle_wait_total": aggregator.histogram("throttle_wait", region, status=None).total,
+            "success_rate_without_retries": without_retries.count / requests_sent,
+            "success_rate_with_retries": aggregator.request_count(region, "success") / requests_sent,
+            "latency_without_retries": without_retries.summary(),
+            "latency_with_retries": with_retries.summary(),
+        }
+        region_stats = retry_stats[region]
+        print(f"\n{region}:")
+        print(f"  Retry amplification: {region_stats['retry_amplification']:.2f}x "
+              f"({region_stats['attempts']:.0f} attempts for {requests_sent} requests)")
+        print(f"  Time lost waiting on throttling: {region_stats['throttle_wait_total']:.1f}s "
+              f"(all backoff: {region_stats['retry_wait_total']:.1f}s)")
+        print(f"  Success rate: {region_stats['success_rate_without_retries']*100:.1f}% without retries, "
+              f"{region_stats['success_rate_with_retries']*100:.1f}% with retries")
+        for label, dist in (("without", region_stats["latency_without_retries"]),
+                            ("with", region_stats["latency_with_retries"])):
+            if dist is not None:
+                print(f"  Latency {label} retries: median {dist['median']:.4f}s, p99 {dist['p99']:.4f}s, max {dist['max']:.4f}s")
+    return retry_stats
+
+# Function to draw the per-region box plot (from histogram quantiles) and average bars
+def plot_region_comparison(region_histograms, stats, path='azure_gpt4o_latency_comparison.png'):
+    plt = _pyplot()
+    plt.figure(figsize=(12, 8))
+
+    # Box plot
+    ax = plt.subplot(2, 1, 1)
+    ax.bxp([histogram_box_stats(histogram, f"{region}\n(n={histogram.count})")
+            for region, histogram in region_histograms.items()],
+           showfliers=True)
+    plt.title('GPT-4o Latency Comparison by Region (whiskers p1-p99)')
+    plt.ylabel('Latency (seconds)')
+    plt.grid(True, linestyle='--', alpha=0.7)
+
+    # Bar chart with error bars
+    plt.subplot(2, 1, 2)
+    regions_list = list(stats.keys())
+    avgs = [stats[r]["avg"] for r in regions_list]
+    std_devs = [stats[r]["std_dev"] for r in regions_list]
+
+    bars = plt.bar(regions_list, avgs, yerr=std_devs, alpha=0.7, capsize=10)
+
+    # Add value labels on top of bars
+    for bar, avg in zip(bars, avgs):
+        plt.text(bar.get_x() + bar.get_width()/2., bar.get_height() + 0.02,
+                f'{avg:.3f}s', ha='center', va='bottom', fontweight='bold')
+
+    plt.title('Average Latency by Region')
+    plt.ylabel('Latency (seconds)')
+    plt.ylim(top=max(avgs) * 1.2)  # Add some headroom for labels
+    plt.grid(True, linestyle='--', alpha=0.7, axis='y')
+
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+    print(f"\nVisualization saved as '{path}'")
+
+# Function to plot average latency against prompt length, one line per region. All
+# (region, prompt length) histograms are grouped in a single pass over the aggregator.
+def plot_prompt_lengths(aggregator, path='azure_gpt4o_latency_by_prompt_length.png'):
+    by_length = aggregator.histograms_by("latency", ("region", "prompt_length"))
+    prompt_lengths = np.array(sorted({length for _, length in by_length if length is not None}))
+
+    plt = _pyplot()
+    plt.figure(figsize=(12, 6))
+    for region in sorted({region for region, _ in by_length}):
+        avgs_by_length = np.array([(by_length.get((region, length)) or LatencyHistogram()).mean or np.nan
+                                   for length in prompt_lengths.tolist()])
+        measured = ~np.isnan(avgs_by_length)
+        plt.plot(prompt_lengths[measured], avgs_by_length[measured], marker='o', label=region)
+
+    plt.title('Latency by Prompt Length')
+    plt.xlabel('Prompt Length (characters)')
+    plt.ylabel('Average Latency (seconds)')
+    plt.legend()
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+    print(f"Prompt length analysis saved as '{path}'")
+
+# Function to plot the latency CDF per region straight from the histogram buckets. The
+# log x-axis and the p99/p99.9 guides make the tail visible, which a box plot hides.
+def plot_latency_cdf(region_histograms, path='azure_gpt4o_latency_cdf.png'):
+    plt = _pyplot()
+    plt.figure(figsize=(12, 6))
+    for region, histogram in region_histograms.items():
+        values, fractions = histogram.cdf()
+        plt.step(values, fractions, where='post', label=f"{region} (n={histogram.count})")
+    for level in (0.99, 0.999):
+        plt.axhline(level, color='grey', linestyle=':', linewidth=1)
+
+    plt.xscale('log')
+    plt.title('Latency CDF by Region')
+    plt.xlabel('Latency (seconds, log scale)')
+    plt.ylabel('Fraction of requests')
+    plt.legend()
+    plt.grid(True, linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+    print(f"Latency CDF saved as '{path}'")
+
+# Function to plot p50/p99 latency and failure rate per timeline interval over the run,
+# to spot warm-up effects, throttling bursts and drift during long tests
+def plot_latency_timeline(aggregator, path='azure_gpt4o_latency_timeline.png'):
+    timelines = {region: aggregator.timeline_arrays(region, (0.5, 0.99)) for region in aggregator.regions()}
+    timelines = {region: timeline for region, timeline in timelines.items() if len(timeline[0])}
+    if not timelines:
+        return
+    run_start = min(times[0] for times, _, _ in timelines.values())
+
+    plt = _pyplot()
+    plt.figure(figsize=(12, 8))
+    ax = plt.subplot(2, 1, 1)
+    for region, (times, percentiles, _) in timelines.items():
+        elapsed = times - run_start
+        line, = ax.plot(elapsed, percentiles[:, 0], marker='.', label=f"{region} p50")
+        ax.plot(elapsed, percentiles[:, 1], linestyle='--', color=line.get_color(), label=f"{region} p99")
+    plt.title(f'Latency over the Run ({aggregator.timeline_interval}s intervals)')
+    plt.ylabel('Latency (seconds)')
+    plt.legend()
+    plt.grid(True, linestyle='--', alpha=0.7)
+
+    ax = plt.subplot(2, 1, 2)
+    for region, (times, _, failure_rate) in timelines.items():
+        ax.plot(times - run_start, failure_rate * 100, marker='.', label=region)
+    plt.title('Failure Rate over the Run')
+    plt.xlabel('Elapsed (seconds)')
+    plt.ylabel('Failed requests (%)')
+    plt.legend()
+    plt.grid(True, linestyle='--', alpha=0.7)
+
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+    print(f"Latency timeline saved as '{path}'")
+
+# Analyze and visualize results. Statistics come from a LatencyAggregator (built from
+# results when not supplied), so a soak run can pass only the aggregator it fed while
+# running and never hold the raw result list in memory. plots=False skips every chart
+# (and the matplotlib import) for headless runs.
+def analyze_results(results=None, aggregator=None, plots=True):
+    if aggregator is None:
+        aggregator = LatencyAggregator()
+        for result in results or []:
+            aggregator.add_result(result)
+    
+    if aggregator.histogram("latency").count == 0:
+        print("No valid results to analyze!")
+        return
+    
+    # Calculate statistics
+    region_histograms = {region: histogram
+                         for (region,), histogram in sorted(aggregator.histograms_by("latency").items())
+                         if histogram.count}
+    stats = {region: histogram.summary() for region, histogram in region_histograms.items()}
+    
+    # Print statistics
+    print("\n===== LATENCY STATISTICS (seconds) =====")
+    for region, region_stats in stats.items():
+        print(f"\n{region} (Sample size: {region_stats['sample_size']}):")
+        print(f"  Min: {region_stats['min']:.4f}s")
+        print(f"  Max: {region_stats['max']:.4f}s")
+        print(f"  Avg: {region_stats['avg']:.4f}s")
+        print(f"  Median: {region_stats['median']:.4f}s")
+        print(f"  Percentiles: {format_percentiles(region_stats)}")
+        print(f"  Standard Deviation: {region_stats['std_dev']:.4f}s")
+    
+    # Count failures, broken down by outcome (throttled / timeout / server_error / ...)
+    total_requests = aggregator.request_count()
+    total_failures = total_requests - aggregator.request_count(status="success")
+    if total_failures:
+        print(f"\nFailed requests: {total_failures}/{total_requests} ({total_failures/total_requests*100:.1f}%)")
+        for region in aggregator.regions():
+            region_failures = aggregator.request_count(region) - aggregator.request_count(region, "success")
+            if region_failures:
+                breakdown = ", ".join(f"{outcome}: {aggregator.request_count(region, outcome)}"
+                                      for outcome in OUTCOMES[1:] if aggregator.request_count(region, outcome))
+                print(f"  {region}: {region_failures} failures ({breakdown})")
+    
+    streaming_stats = analyze_streaming_results(aggregator, plots)
+    token_stats = analyze_token_usage(aggregator)
+    retry_stats = analyze_retries(aggregator)
+    
+    if plots:
+        plot_region_comparison(region_histograms, stats)
+        plot_prompt_lengths(aggregator)
+        plot_latency_cdf(region_histograms)
+        plot_latency_timeline(aggregator)
+    
+    # Save the summaries and the mergeable histogram snapshot. Per-request rows belong in the
+    # columnar store (LatencyResultStore); raw_data is only written when results are passed.
+    with open('latency_test_results.json', 'w') as f:
+        json.dump({
+            "raw_data": results or [],
+            "statistics": stats,
+            "streaming_statistics": streaming_stats,
+            "token_statistics": token_stats,
+            "retry_statistics": retry_stats,
+            "histograms": aggregator.to_dict(),
+            "test_time": datetime.now().isoformat()
+        }, f, indent=2)
+    
+    print("Results saved as 'latency_test_results.json'")
+
+# Run everything
+if __name__ == "__main__":
+    # Can adjust the parallelism level and number of iterations
+    # Set stream=True to measure TTFT / inter-token latency instead of only total time
+    # Every request is appended to ./latency_results; compare against previous days with
+    #   python LatencyResultStore.py compare
+    from LatencyResultStore import ResultWriter  # pip install pyarrow pandas
+    aggregator = LatencyAggregator()
+    with ResultWriter("latency_results") as result_store:
+        run_latency_tests(iterations=10, warmup=True, max_workers=15, stream=False, connection_mode="pooled",
+                          aggregator=aggregator, keep_results=False, result_store=result_store)
+    analyze_results(aggregator=aggregator)
+    # To quantify handshake overhead instead:
+    # compare_connection_modes(iterations=10, max_workers=15)
+    close_sessions()
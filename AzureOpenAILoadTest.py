@@ -0,0 +1,548 @@
+# Open-loop load generator for the regions in AzureOpenAILatencyTest.py (any provider
+# ProviderAdapters.py covers, so Azure regions and e.g. a Databricks endpoint share one run)
+#
+# Unlike run_latency_tests (a fixed list of cases pushed through a thread pool, so slow
+# responses throttle the offered load), requests here are launched on an arrival schedule
+# (constant-rate or Poisson) regardless of how many are still in flight. This shows how a
+# region behaves at a target RPS, which is what PTU vs. pay-as-you-go sizing needs.
+#
+# Requirements: pip install aiohttp
+# Usage:        python AzureOpenAILoadTest.py --rps 50 --ramp-up 30 --steady 120 --ramp-down 30
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+
+import aiohttp
+
+from AzureOpenAILatencyTest import (regions, test_prompts, build_request, analyze_results, generate_prompt,
+                                    cost_per_1k_requests, MAX_TOKENS)
+from LatencyStats import LatencyAggregator, LatencyHistogram
+from LatencyDashboard import LiveStats, TerminalDashboard
+from RetryPolicy import RetryPolicy, NO_RETRY, classify_outcome, parse_retry_after
+from ProviderAdapters import adapter_for
+
+# A phase is (name, duration in seconds, rate at phase start, rate at phase end); the
+# arrival rate is interpolated linearly inside a phase.
+def build_load_profile(target_rps, ramp_up=30, steady=120, ramp_down=30):
+    phases = []
+    if ramp_up > 0:
+        phases.append(("ramp-up", ramp_up, 0.0, float(target_rps)))
+    if steady > 0:
+        phases.append(("steady", steady, float(target_rps), float(target_rps)))
+    if ramp_down > 0:
+        phases.append(("ramp-down", ramp_down, float(target_rps), 0.0))
+    return phases
+
+# Function to compute the instantaneous arrival rate at offset t into a phase
+def rate_at(phase, t):
+    _, duration, start_rps, end_rps = phase
+    return start_rps + (end_rps - start_rps) * min(t / duration, 1.0)
+
+# Function to generate arrival offsets (seconds since run start) for a load profile.
+# Non-homogeneous Poisson arrivals use thinning against the phase's peak rate, so
+# ramps are followed exactly rather than stepwise; constant arrivals invert the cumulative
+# count of the ramp.
+def generate_arrivals(phases, arrival="poisson", rng=None):
+    rng = rng or random.Random()
+    phase_start = 0.0
+    for phase in phases:
+        name, duration, start_rps, end_rps = phase
+        peak = max(start_rps, end_rps)
+        if peak <= 0:
+            phase_start += duration
+            continue
+        if arrival == "poisson":
+            t = 0.0
+            while True:
+                t += rng.expovariate(peak)
+                if t >= duration:
+                    break
+                if rng.random() * peak <= rate_at(phase, t):
+                    yield name, phase_start + t
+        else:
+            # Constant rate: the k-th arrival is where the expected count, the integral of the
+            # linear rate a*t + (b-a)*t^2/(2*duration), reaches k. Solved in the form
+            # 2k / (a + sqrt(a^2 + 2(b-a)k/duration)), which holds for flat, rising and
+            # falling ramps alike, including ones starting or ending at 0 rps
+            slope = (end_rps - start_rps) / duration
+            k = 1
+            while True:
+                root = math.sqrt(max(start_rps * start_rps + 2.0 * slope * k, 0.0))
+                t = 2.0 * k / (start_rps + root)
+                if t >= duration:
+                    break
+                yield name, phase_start + t
+                k += 1
+        phase_start += duration
+
+# Function to send one request and time it; never raises so the scheduler is not disturbed.
+# Failed attempts are retried per retry_policy, with latency measured end to end.
+async def send_request(session, region_name, prompt, phase, scheduled_offset, run_start, timeout,
+                       max_tokens=MAX_TOKENS, retry_policy=NO_RETRY):
+    url, headers, data = build_request(region_name, prompt, max_tokens)
+    parse_usage = adapter_for(regions[region_name]).parse_usage
+    send_time = time.perf_counter()
+    result = {
+        "region": region_name,
+        "prompt_length": len(prompt),
+        "phase": phase,
+        "scheduled_offset": scheduled_offset,
+        # How late the request left compared to its schedule (event loop saturation)
+        "send_lag": send_time - run_start - scheduled_offset,
+        "retry_wait": 0.0,
+        "throttle_wait": 0.0,
+        "first_attempt_latency": None,
+    }
+    attempt = 0
+    while True:
+        attempt += 1
+        attempt_start = time.perf_counter()
+        result["status_code"] = None
+        retry_after = None
+        attempt_timeout = aiohttp.ClientTimeout(total=retry_policy.attempt_timeout(send_time, timeout.total))
+        try:
+            async with session.post(url, headers=headers, json=data, timeout=attempt_timeout) as response:
+                body = await response.read()
+                result["status_code"] = response.status
+                retry_after = parse_retry_after(response.headers)
+                response.raise_for_status()
+            result["latency"] = time.perf_counter() - send_time
+            result["prompt_tokens"], result["completion_tokens"] = parse_usage(json.loads(body))
+            result["error_type"] = "success"
+            result["status"] = "success"
+        except Exception as e:
+            result["latency"] = None
+            result["error_type"] = classify_outcome(result["status_code"], e)
+            result["status"] = f"error: {str(e) or type(e).__name__}"
+        if attempt == 1:
+            result["first_attempt_outcome"] = result["error_type"]
+            if result["latency"] is not None:
+                result["first_attempt_latency"] = time.perf_counter() - attempt_start
+        if result["status"] == "success":
+            break
+        delay = retry_policy.next_delay(attempt, result["error_type"], send_time, retry_after)
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+        result["retry_wait"] += delay
+        if result["error_type"] == "throttled":
+            result["throttle_wait"] += delay
+    result["attempts"] = attempt
+    result["completed_offset"] = time.perf_counter() - run_start
+    return result
+
+# Function to send one logical request hedged: if the primary has not finished after
+# hedge["delay"] seconds, a duplicate goes to hedge["region"] (another region, or the same
+# deployment) and the first success wins; the loser is cancelled, which closes its
+# connection. Latency is measured from the logical request's start.
+async def send_hedged_request(session, region_name, prompt, phase, scheduled_offset, run_start, timeout,
+                              max_tokens, retry_policy, hedge):
+    start = time.perf_counter()
+    primary = asyncio.create_task(send_request(session, region_name, prompt, phase, scheduled_offset, run_start,
+                                               timeout, max_tokens, retry_policy))
+    done, _ = await asyncio.wait([primary], timeout=hedge["delay"])
+    if done:
+        result = primary.result()
+        result.update(hedged=False, hedge_winner=False)
+        return result
+
+    backup = asyncio.create_task(send_request(hedge["session"], hedge["region"], prompt, phase, scheduled_offset,
+                                              run_start, timeout, max_tokens, retry_policy))
+    pending = {primary, backup}
+    result = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        # Prefer the primary's result when both land in the same tick
+        for task in sorted(done, key=lambda t: t is not primary):
+            if result is None or result["status"] != "success":
+                result = dict(task.result(), hedge_winner=task is backup)
+        if result["status"] == "success":
+            break
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # Report under the logical request's region whichever copy won
+    result.update(region=region_name, hedged=True, hedge_region=hedge["region"])
+    if result["latency"] is not None:
+        result["latency"] = time.perf_counter() - start
+    result["completed_offset"] = time.perf_counter() - run_start
+    return result
+
+# Function to drive one region through the load profile
+async def run_region_load(session, region_name, phases, arrival, max_in_flight, timeout, seed=None,
+                          live_stats=None, prompts=None, max_tokens=MAX_TOKENS, retry_policy=NO_RETRY,
+                          hedge=None):
+    prompts = prompts or test_prompts
+    rng = random.Random(seed)
+    run_start = time.perf_counter()
+    in_flight = set()
+    results = []
+    offered = {name: 0 for name, *_ in phases}
+    dropped = {name: 0 for name, *_ in phases}
+    peak_in_flight = 0
+
+    def on_done(task):
+        in_flight.discard(task)
+        results.append(task.result())
+        if live_stats is not None:
+            live_stats.request_finished(task.result())
+
+    for phase, offset in generate_arrivals(phases, arrival, rng):
+        delay = run_start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        offered[phase] += 1
+        # Open loop: never wait for a free slot. Past the in-flight cap the arrival is
+        # counted as dropped so offered load stays honest.
+        if len(in_flight) >= max_in_flight:
+            dropped[phase] += 1
+            continue
+        prompt = rng.choice(prompts)
+        if hedge is None:
+            request = send_request(session, region_name, prompt, phase, offset, run_start, timeout, max_tokens,
+                                   retry_policy)
+        else:
+            request = send_hedged_request(session, region_name, prompt, phase, offset, run_start, timeout,
+                                          max_tokens, retry_policy, hedge)
+        task = asyncio.create_task(request)
+        in_flight.add(task)
+        task.add_done_callback(on_done)
+        if live_stats is not None:
+            live_stats.request_started(region_name)
+        peak_in_flight = max(peak_in_flight, len(in_flight))
+
+    if in_flight:
+        await asyncio.wait(list(in_flight))
+
+    return {
+        "region": region_name,
+        "results": results,
+        "offered": offered,
+        "dropped": dropped,
+        "peak_in_flight": peak_in_flight,
+    }
+
+# Function to pick where a region's hedge copies go: the next region in config order
+# ("next-region") or the same deployment ("same")
+def hedge_region_for(region_name, target="next-region"):
+    if target == "same":
+        return region_name
+    names = list(regions)
+    return names[(names.index(region_name) + 1) % len(names)]
+
+# Main entry: run every region concurrently on one event loop.
+# hedge_delays ({region: seconds}) turns on hedging with copies sent per hedge_target.
+async def run_load_test(target_rps, ramp_up=30, steady=120, ramp_down=30, arrival="poisson",
+                        max_in_flight=5000, timeout_s=120, seed=None, live=False, prompts=None,
+                        max_tokens=MAX_TOKENS, retry_policy=NO_RETRY, hedge_delays=None, hedge_target="next-region"):
+    phases = build_load_profile(target_rps, ramp_up, steady, ramp_down)
+    total = sum(duration for _, duration, *_ in phases)
+    print(f"Starting open-loop {arrival} load: {target_rps} rps per region across {len(regions)} regions, "
+          f"{total}s total ({', '.join(f'{n} {d}s' for n, d, *_ in phases)})...")
+
+    # One pooled session per region so a slow region cannot starve another's connections
+    timeout = aiohttp.ClientTimeout(total=timeout_s)
+    sessions = {
+        region: aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_in_flight, ttl_dns_cache=300))
+        for region in regions
+    }
+    # The dashboard renders from its own thread so a busy event loop cannot stall it
+    live_stats = LiveStats() if live else None
+    dashboard = TerminalDashboard(live_stats).start() if live else None
+    hedges = {region: None for region in regions}
+    if hedge_delays:
+        for region in regions:
+            target = hedge_region_for(region, hedge_target)
+            hedges[region] = {"delay": hedge_delays[region], "region": target, "session": sessions[target]}
+    try:
+        region_runs = await asyncio.gather(*[
+            run_region_load(sessions[region], region, phases, arrival, max_in_flight, timeout,
+                            None if seed is None else seed + i, live_stats, prompts, max_tokens, retry_policy,
+                            hedges[region])
+            for i, region in enumerate(regions)
+        ])
+    finally:
+        await asyncio.gather(*[s.close() for s in sessions.values()])
+        if dashboard is not None:
+            dashboard.stop()
+
+    return phases, region_runs
+
+# Function to summarise offered vs. achieved throughput and latency per region and phase
+def summarize_load(phases, region_runs):
+    summary = {}
+    print("\n===== OPEN-LOOP THROUGHPUT (requests/second) =====")
+    for run in region_runs:
+        region = run["region"]
+        summary[region] = {"peak_in_flight": run["peak_in_flight"], "phases": {}}
+        print(f"\n{region} (peak in-flight: {run['peak_in_flight']}):")
+        for name, duration, *_ in phases:
+            latency = LatencyHistogram()
+            completed = 0
+            max_send_lag = 0
+            for r in run["results"]:
+                if r["phase"] != name:
+                    continue
+                completed += 1
+                max_send_lag = max(max_send_lag, r["send_lag"])
+                if r["latency"] is not None:
+                    latency.record(r["latency"])
+            phase_stats = {
+                "offered_rps": run["offered"][name] / duration,
+                "achieved_rps": latency.count / duration,
+                "dropped": run["dropped"][name],
+                "errors": completed - latency.count,
+                "p50": latency.percentile(50),
+                "p95": latency.percentile(95),
+                "p99": latency.percentile(99),
+                "max_send_lag": max_send_lag,
+            }
+            summary[region]["phases"][name] = phase_stats
+            line = (f"  {name:<9} offered {phase_stats['offered_rps']:.2f}  achieved {phase_stats['achieved_rps']:.2f}"
+                    f"  errors {phase_stats['errors']}  dropped {phase_stats['dropped']}")
+            for key in ("p50", "p95", "p99"):
+                if phase_stats[key] is not None:
+                    line += f"  {key} {phase_stats[key]:.3f}s"
+            print(line)
+            if phase_stats["max_send_lag"] > 0.05:
+                print(f"  {'':<9} warning: requests left up to {phase_stats['max_send_lag']*1000:.0f}ms late, "
+                      "the generator itself is saturated")
+    return summary
+
+# Function to measure one constant-rate step of the saturation search
+def summarize_step(run, duration):
+    latency = LatencyHistogram()
+    completed = throttled = tokens = 0
+    for r in run["results"]:
+        completed += 1
+        if r.get("status_code") == 429:
+            throttled += 1
+        if r["latency"] is not None:
+            latency.record(r["latency"])
+            tokens += (r.get("prompt_tokens") or 0) + (r.get("completion_tokens") or 0)
+    return {
+        "offered_rps": run["offered"]["steady"] / duration,
+        "achieved_rps": latency.count / duration,
+        "tpm": tokens / duration * 60,
+        "throttle_rate": throttled / completed if completed else 0.0,
+        "error_rate": (completed - latency.count) / completed if completed else 0.0,
+        "p50": latency.percentile(50),
+        "p95": latency.percentile(95),
+        "avg_prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in run["results"]) / max(latency.count, 1),
+        "avg_completion_tokens": sum(r.get("completion_tokens") or 0 for r in run["results"]) / max(latency.count, 1),
+        "tokens_per_sec": sum(r.get("completion_tokens") or 0 for r in run["results"]) / latency.total if latency.total else None,
+    }
+
+# Saturation search for one region: raise a constant request rate geometrically until
+# 429s exceed throttle_threshold, p95 latency passes knee_factor x the first step's p95
+# (the latency knee), or achieved throughput falls behind the offered rate. The last
+# healthy step gives the deployment's sustainable tokens per minute at this prompt size.
+async def find_saturation(region_name, prompt_tokens=1000, max_tokens=200, start_rps=0.5, growth=1.5,
+                          step_s=60, cooldown_s=15, max_steps=15, throttle_threshold=0.01, knee_factor=2.0,
+                          max_in_flight=5000, timeout_s=120):
+    prompt = generate_prompt(prompt_tokens)
+    timeout = aiohttp.ClientTimeout(total=timeout_s)
+    steps = []
+    last_good = None
+    saturation_reason = "max steps reached"
+    print(f"Searching TPM saturation for {region_name}: ~{prompt_tokens} prompt tokens, "
+          f"max_tokens {max_tokens}, {step_s}s steps from {start_rps} rps...")
+
+    rps = start_rps
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_in_flight)) as session:
+        for step_index in range(max_steps):
+            run = await run_region_load(session, region_name, [("steady", step_s, rps, rps)], "constant",
+                                        max_in_flight, timeout, prompts=[prompt], max_tokens=max_tokens)
+            step = summarize_step(run, step_s)
+            steps.append(step)
+            p95 = f"{step['p95']:.3f}s" if step["p95"] is not None else "-"
+            print(f"  {rps:8.2f} rps  achieved {step['achieved_rps']:.2f}  TPM {step['tpm']:,.0f}  "
+                  f"429 {step['throttle_rate']*100:.1f}%  p95 {p95}")
+
+            baseline_p95 = steps[0]["p95"]
+            if step["throttle_rate"] > throttle_threshold:
+                saturation_reason = "429 throttling"
+            elif step["p95"] is None:
+                saturation_reason = "no successful requests"
+            elif baseline_p95 is not None and step["p95"] > knee_factor * baseline_p95:
+                saturation_reason = "latency knee"
+            elif step["achieved_rps"] < 0.9 * step["offered_rps"]:
+                saturation_reason = "throughput plateau"
+            else:
+                last_good = step
+                rps *= growth
+                # Let the per-minute token window drain before the next step
+                await asyncio.sleep(cooldown_s)
+                continue
+            break
+
+    deployment = regions[region_name]["deployment"]
+    report = {
+        "region": region_name,
+        "deployment": deployment,
+        "steps": steps,
+        "saturation_reason": saturation_reason,
+        "saturation_tpm": last_good["tpm"] if last_good else None,
+        "saturation_rps": last_good["offered_rps"] if last_good else None,
+        "tokens_per_sec": last_good["tokens_per_sec"] if last_good else None,
+        "cost_per_1k_requests": cost_per_1k_requests(deployment, last_good["avg_prompt_tokens"],
+                                                     last_good["avg_completion_tokens"]) if last_good else None,
+    }
+    if last_good:
+        print(f"{region_name}: sustainable ~{report['saturation_tpm']:,.0f} TPM at {report['saturation_rps']:.2f} rps "
+              f"(stopped on {saturation_reason})")
+        if report["tokens_per_sec"] is not None:
+            print(f"  Output tokens/sec per request: {report['tokens_per_sec']:.1f}")
+        if report["cost_per_1k_requests"] is not None:
+            print(f"  Estimated cost per 1k requests: ${report['cost_per_1k_requests']:.4f}")
+    else:
+        print(f"{region_name}: saturated at the first step ({saturation_reason}); lower --start-rps")
+    return report
+
+# Function to summarise one run's tail latency and hedging overhead per region
+def summarize_hedging(region_runs):
+    summary = {}
+    for run in region_runs:
+        latency = LatencyHistogram()
+        requests_sent = hedges = hedge_wins = successes = 0
+        prompt_tokens = completion_tokens = 0
+        for r in run["results"]:
+            requests_sent += 1
+            hedges += 1 if r.get("hedged") else 0
+            hedge_wins += 1 if r.get("hedge_winner") else 0
+            if r["latency"] is not None:
+                successes += 1
+                latency.record(r["latency"])
+                prompt_tokens += r.get("prompt_tokens") or 0
+                completion_tokens += r.get("completion_tokens") or 0
+        summary[run["region"]] = {
+            "requests": requests_sent,
+            "success_rate": successes / requests_sent if requests_sent else 0.0,
+            "p50": latency.percentile(50),
+            "p90": latency.percentile(90),
+            "p99": latency.percentile(99),
+            "hedge_rate": hedges / requests_sent if requests_sent else 0.0,
+            "hedge_win_rate": hedge_wins / hedges if hedges else 0.0,
+            "avg_prompt_tokens": prompt_tokens / successes if successes else 0.0,
+            "avg_completion_tokens": completion_tokens / successes if successes else 0.0,
+        }
+    return summary
+
+# Hedging experiment: a baseline run, then the same load with hedging, comparing p99 and
+# the extra load. With hedge_delay="p90" each region's delay is the p90 observed in the
+# baseline. The extra cost counts the prompt tokens of every hedge copy (the service bills
+# prompt processing even when the copy is cancelled) plus completions of hedge winners
+# that the primary would otherwise have produced -- an upper bound on the token spend.
+async def run_hedging_comparison(target_rps, steady=120, hedge_delay="p90", hedge_target="next-region",
+                                 max_in_flight=5000, timeout_s=120, seed=None, prompts=None, max_tokens=MAX_TOKENS):
+    print("Baseline run (no hedging)...")
+    _, baseline_runs = await run_load_test(target_rps, 0, steady, 0, "poisson", max_in_flight, timeout_s, seed,
+                                           prompts=prompts, max_tokens=max_tokens)
+    baseline = summarize_hedging(baseline_runs)
+    if hedge_delay == "p90":
+        hedge_delays = {region: baseline[region]["p90"] or 1.0 for region in regions}
+    else:
+        hedge_delays = {region: float(hedge_delay) for region in regions}
+
+    print(f"Hedged run ({hedge_target}, delays "
+          f"{', '.join(f'{r} {d*1000:.0f}ms' for r, d in hedge_delays.items())})...")
+    _, hedged_runs = await run_load_test(target_rps, 0, steady, 0, "poisson", max_in_flight, timeout_s, seed,
+                                         prompts=prompts, max_tokens=max_tokens, hedge_delays=hedge_delays,
+                                         hedge_target=hedge_target)
+    hedged = summarize_hedging(hedged_runs)
+
+    def fmt(value):
+        return f"{value:.3f}s" if value is not None else "-"
+
+    comparison = {}
+    print("\n===== HEDGING: BASELINE vs. HEDGED =====")
+    for region in regions:
+        base, hedge = baseline[region], hedged[region]
+        deployment = regions[region]["deployment"]
+        extra_cost = None
+        if hedge["requests"]:
+            # Extra tokens per 1k logical requests, priced like ordinary requests
+            extra_prompt = hedge["hedge_rate"] * hedge["avg_prompt_tokens"]
+            extra_completion = hedge["hedge_rate"] * hedge["hedge_win_rate"] * hedge["avg_completion_tokens"]
+            extra_cost = cost_per_1k_requests(deployment, extra_prompt, extra_completion)
+        comparison[region] = {"baseline": base, "hedged": hedge, "hedge_delay": hedge_delays[region],
+                              "extra_cost_per_1k_requests": extra_cost}
+        print(f"\n{region} (hedge delay {hedge_delays[region]*1000:.0f}ms -> {hedge_region_for(region, hedge_target)}):")
+        print(f"  p50  {fmt(base['p50'])} -> {fmt(hedge['p50'])}")
+        print(f"  p99  {fmt(base['p99'])} -> {fmt(hedge['p99'])}")
+        print(f"  success rate {base['success_rate']*100:.1f}% -> {hedge['success_rate']*100:.1f}%")
+        print(f"  extra load: {hedge['hedge_rate']*100:.1f}% of requests hedged, "
+              f"hedge won {hedge['hedge_win_rate']*100:.1f}% of those")
+        if extra_cost is not None:
+            print(f"  extra cost: up to ${extra_cost:.4f} per 1k requests")
+    return comparison
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load test for Azure OpenAI regions")
+    parser.add_argument("--rps", type=float, default=10, help="target requests/second per region")
+    parser.add_argument("--ramp-up", type=int, default=30)
+    parser.add_argument("--steady", type=int, default=120)
+    parser.add_argument("--ramp-down", type=int, default=30)
+    parser.add_argument("--arrival", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--max-in-flight", type=int, default=5000, help="per region")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--live", action="store_true", help="show a live per-region dashboard while running")
+    parser.add_argument("--prompt-tokens", type=int, nargs="+", default=None,
+                        help="use synthetic prompts of these token lengths instead of test_prompts")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--saturation", action="store_true",
+                        help="search each region's TPM saturation point instead of running a fixed profile")
+    parser.add_argument("--step", type=int, default=60, help="seconds per saturation search step")
+    parser.add_argument("--max-attempts", type=int, default=1,
+                        help="retry throttled/failed requests up to this many attempts (honours Retry-After)")
+    parser.add_argument("--deadline", type=float, default=None, help="per-request deadline in seconds, including retries")
+    parser.add_argument("--hedge", nargs="?", const="p90", default=None, metavar="DELAY",
+                        help="compare a baseline run against hedged requests (delay in seconds, default: baseline p90)")
+    parser.add_argument("--hedge-target", choices=["next-region", "same"], default="next-region")
+    args = parser.parse_args()
+
+    if args.saturation:
+        async def search_all():
+            reports = []
+            for region in regions:
+                for prompt_tokens in args.prompt_tokens or [1000]:
+                    reports.append(await find_saturation(region, prompt_tokens, args.max_tokens,
+                                                         start_rps=args.rps, step_s=args.step,
+                                                         max_in_flight=args.max_in_flight, timeout_s=args.timeout))
+            return reports
+
+        with open("tpm_saturation_results.json", "w") as f:
+            json.dump(asyncio.run(search_all()), f, indent=2)
+        print("Saturation results saved as 'tpm_saturation_results.json'")
+        raise SystemExit
+
+    prompts = [generate_prompt(n) for n in args.prompt_tokens] if args.prompt_tokens else None
+
+    if args.hedge:
+        comparison = asyncio.run(run_hedging_comparison(
+            args.rps, args.steady, args.hedge, args.hedge_target, args.max_in_flight, args.timeout, args.seed,
+            prompts, args.max_tokens,
+        ))
+        with open("hedging_comparison_results.json", "w") as f:
+            json.dump(comparison, f, indent=2)
+        print("Hedging comparison saved as 'hedging_comparison_results.json'")
+        raise SystemExit
+
+    phases, region_runs = asyncio.run(run_load_test(
+        args.rps, args.ramp_up, args.steady, args.ramp_down, args.arrival,
+        args.max_in_flight, args.timeout, args.seed, args.live, prompts, args.max_tokens,
+        RetryPolicy(max_attempts=args.max_attempts, deadline=args.deadline),
+    ))
+    summarize_load(phases, region_runs)
+    aggregator = LatencyAggregator()
+    for run in region_runs:
+        for result in run["results"]:
+            aggregator.add_result(result)
+    analyze_results(aggregator=aggregator)
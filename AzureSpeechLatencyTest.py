@@ -2,32 +2,121 @@ import azure.cognitiveservices.speech as speechsdk
 import time
 from datetime import datetime
 import statistics
+import argparse
+import threading
+import wave
+import bisect
+import queue
+import concurrent.futures
+import csv
+import itertools
+import os
+import re
+import unicodedata
+import math
+import numpy as np
+from LatencyStats import LatencyHistogram, PERCENTILES
+try:
+    from scipy.signal import resample_poly
+except ImportError:
+    resample_poly = None
+
+# 多路并发压测使用的 Speech 配置
+speech_settings = {
+    "subscription_key": "",   # 订阅密钥
+    "service_region": "",     # 服务区域
+    "language": "zh-CN",
+    "segmentation_silence_timeout_ms": "100",
+}
 
 def get_current_time():
     """返回当前时间的格式化字符串"""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
 
+# Speech SDK 的 offset / duration 单位: 100 纳秒
+TICKS_PER_SECOND = 10_000_000
+
+# 音频时钟: 记录每块音频推送完成的时刻 (perf_counter)，把音频中的位置换算成
+# "这段音频到达 SDK 的时刻"。麦克风模式没有推送记录，按实时采集从 start 起推算。
+class AudioClock:
+    def __init__(self, start=None):
+        self.start = start
+        self.chunk_ends = []   # 每块结束位置 (秒)
+        self.push_times = []   # 每块推送完成时刻
+
+    def pushed(self, audio_end_seconds, push_time):
+        if self.start is None:
+            self.start = push_time
+        self.chunk_ends.append(audio_end_seconds)
+        self.push_times.append(push_time)
+
+    def wall_time_at(self, ticks):
+        seconds = ticks / TICKS_PER_SECOND
+        if not self.chunk_ends:
+            return self.start + seconds
+        index = bisect.bisect_left(self.chunk_ends, seconds)
+        return self.push_times[min(index, len(self.push_times) - 1)]
+
+# 性能监控: 以音频时钟为基准，按 evt.result.offset 区分每一句话 (同一句的中间结果
+# offset 相同)，统计每句的延迟 (秒，内部用 LatencyHistogram 统计):
+#   first_partial_latency - 该句语音开始 -> 第一个中间结果
+#   partial_latency       - 中间结果所覆盖的音频末尾 -> 收到该中间结果
+#   partial_gap           - 同一句相邻两个中间结果的间隔
+#   final_latency         - 语音结束 (offset + duration) -> 最终结果
+# first byte 延迟 (add_latency, 毫秒) 保持原有含义。
 class PerformanceMonitor:
-    def __init__(self):
+    def __init__(self, clock=None):
         self.latencies = []
-        self.recognition_start_times = {}
+        self.clock = clock or AudioClock()
+        self.utterances = {}
         self.recognition_results = []
+        self.histograms = {key: LatencyHistogram()
+                           for key in ("first_partial_latency", "partial_latency", "partial_gap", "final_latency")}
+        self._lock = threading.Lock()
         
     def add_latency(self, latency):
         self.latencies.append(latency)
-        
-    def add_recognition_start(self, session_id, start_time):
-        self.recognition_start_times[session_id] = start_time
-        
-    def add_recognition_result(self, session_id, text, end_time):
-        if session_id in self.recognition_start_times:
-            start_time = self.recognition_start_times[session_id]
-            duration = end_time - start_time
-            self.recognition_results.append({
-                'text': text,
-                'duration': duration,
+
+    def _utterance(self, offset):
+        utterance = self.utterances.get(offset)
+        if utterance is None:
+            utterance = self.utterances[offset] = {"partials": 0, "first_partial_latency": None, "last_partial": None}
+        return utterance
+
+    # 处理 recognizing 事件; now 为收到事件的 perf_counter 时刻
+    def on_recognizing(self, evt, now):
+        offset, duration = evt.result.offset, evt.result.duration
+        with self._lock:
+            utterance = self._utterance(offset)
+            if utterance["last_partial"] is None:
+                latency = max(now - self.clock.wall_time_at(offset), 0.0)
+                utterance["first_partial_latency"] = latency
+                self.histograms["first_partial_latency"].record(latency)
+            else:
+                self.histograms["partial_gap"].record(now - utterance["last_partial"])
+            utterance["last_partial"] = now
+            utterance["partials"] += 1
+            self.histograms["partial_latency"].record(max(now - self.clock.wall_time_at(offset + duration), 0.0))
+
+    # 处理 recognized 事件，返回该句的结果 (含 final_latency)
+    def on_recognized(self, evt, now):
+        offset, duration = evt.result.offset, evt.result.duration
+        with self._lock:
+            # 没有中间结果的短句也会直接产生最终结果
+            utterance = self.utterances.pop(offset, None) or {"partials": 0, "first_partial_latency": None}
+            final_latency = max(now - self.clock.wall_time_at(offset + duration), 0.0)
+            self.histograms["final_latency"].record(final_latency)
+            result = {
+                'text': evt.result.text,
+                'offset': offset / TICKS_PER_SECOND,
+                'duration': duration / TICKS_PER_SECOND,
+                'first_partial_latency': utterance["first_partial_latency"],
+                'partials': utterance["partials"],
+                'final_latency': final_latency,
                 'timestamp': get_current_time()
-            })
+            }
+            self.recognition_results.append(result)
+            return result
             
     def print_statistics(self):
         if self.latencies:
@@ -39,9 +128,8 @@ class PerformanceMonitor:
                 print(f"  延迟标准差: {statistics.stdev(self.latencies):.2f}ms")
         
         if self.recognition_results:
-            print(f"\n识别结果统计:")
-            avg_duration = statistics.mean([r['duration'] * 1000 for r in self.recognition_results])
-            print(f"  平均识别时间: {avg_duration:.2f}ms")
+            print(f"\n识别结果统计 ({len(self.recognition_results)} 句，按音频时钟):")
+            print_utterance_statistics(self.histograms)
 
 def speech_recognize_continuous():
 
@@ -116,14 +204,11 @@ def speech_recognize_continuous():
     print(f"[{get_current_time()}] 识别器创建时间: {recognizer_time*1000:.2f}ms")
     print(f"[{get_current_time()}] 总初始化时间: {total_init_time*1000:.2f}ms")
 
-    # 预热连接
-    silent_audio = b'\x00' * 16000  # 1秒静音
-    audio_stream = speechsdk.audio.PushAudioInputStream()
-    audio_stream.write(silent_audio)
-    audio_stream.close()
-    silent_audio_config = speechsdk.audio.AudioConfig(stream=audio_stream)
-    silent_recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=silent_audio_config)
-    silent_recognizer.recognize_once()  # 模型加载
+    # 预连接: 直接在实际使用的识别器上打开连接 (另建一个静音识别器 recognize_once
+    # 预热的是另一个对象，对这个识别器的首包延迟没有帮助)
+    preconnect_start = time.time()
+    connection, _, _ = preconnect(speech_recognizer)
+    print(f"[{get_current_time()}] 预连接完成: {(time.time() - preconnect_start)*1000:.2f}ms")
 
     # 程序启动提示
     print(f"[{get_current_time()}] 程序启动，5秒后开始录音...")
@@ -140,22 +225,22 @@ def speech_recognize_continuous():
     recognition_duration = 20  # 识别持续时间（秒）
     
     # 用于计算延迟的变量
-    recognition_start_time = None
     first_byte_time = None
     is_first_recognition = True
-    current_session_id = 0
+
+    # 麦克风音频按实时采集，会话开始时刻即音频时钟的零点
+    monitor.clock.start = time.perf_counter()
+    speech_recognizer.session_started.connect(lambda evt: setattr(monitor.clock, "start", time.perf_counter()))
 
     # 处理识别开始的回调函数
     def handle_recognizing(evt):
-        nonlocal recognition_start_time, first_byte_time, is_first_recognition, current_session_id
+        nonlocal first_byte_time, is_first_recognition
         current_time = time.time()
         
         if evt.result.text:
-            current_session_id += 1
-            monitor.add_recognition_start(current_session_id, current_time)
+            monitor.on_recognizing(evt, time.perf_counter())
             
             if is_first_recognition:
-                recognition_start_time = current_time
                 first_byte_time = current_time
                 is_first_recognition = False
                 first_byte_latency = (first_byte_time - start_time) * 1000
@@ -166,19 +251,13 @@ def speech_recognize_continuous():
 
     # 处理识别结果的回调函数
     def handle_result(evt):
-        nonlocal recognition_start_time, current_session_id
         current_time = time.time()
         
         if current_time - start_time <= recognition_duration:
             if evt.result.text:
-                if recognition_start_time is not None:
-                    finish_latency = (current_time - recognition_start_time) * 1000
-                    print(f"[{get_current_time()}] 识别结果: {evt.result.text}")
-                    print(f"[{get_current_time()}] Finish Latency: {finish_latency:.2f}ms")
-                    monitor.add_recognition_result(current_session_id, evt.result.text, current_time)
-                    recognition_start_time = None
-                else:
-                    print(f"[{get_current_time()}] 识别结果: {evt.result.text}")
+                utterance = monitor.on_recognized(evt, time.perf_counter())
+                print(f"[{get_current_time()}] 识别结果: {evt.result.text}")
+                print(f"[{get_current_time()}] Finish Latency (语音结束->最终结果): {utterance['final_latency']*1000:.2f}ms")
 
     # 处理识别结束的回调函数
     def stop_cb(evt):
@@ -206,8 +285,546 @@ def speech_recognize_continuous():
     monitor.print_statistics()
     print(f"[{get_current_time()}] 程序退出.")
 
+# 根据 speech_settings 创建 speech 配置对象
+def create_speech_config(settings=None):
+    settings = settings or speech_settings
+    speech_config = speechsdk.SpeechConfig(
+        subscription=settings["subscription_key"],
+        region=settings["service_region"]
+    )
+    speech_config.speech_recognition_language = settings["language"]
+    speech_config.set_profanity(speechsdk.ProfanityOption.Raw)
+    speech_config.set_property(speechsdk.PropertyId.Speech_SegmentationSilenceTimeoutMs,
+                               str(settings["segmentation_silence_timeout_ms"]))
+    # 以下为可选项，参数扫描时使用
+    if settings.get("initial_silence_timeout_ms") is not None:
+        speech_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_InitialSilenceTimeoutMs,
+                                   str(settings["initial_silence_timeout_ms"]))
+    if settings.get("recognition_mode") is not None:
+        # INTERACTIVE / CONVERSATION / DICTATION
+        speech_config.set_property(speechsdk.PropertyId.SpeechServiceConnection_RecoMode,
+                                   settings["recognition_mode"])
+    return speech_config
+
+# 读取 WAV 文件，返回 PCM 数据和音频格式 (PushAudioInputStream 只接受 PCM)
+def read_wav(path):
+    with wave.open(path, "rb") as wav:
+        if wav.getcomptype() != "NONE":
+            raise ValueError(f"{path}: 只支持 PCM WAV 文件")
+        return {
+            "path": path,
+            "pcm": wav.readframes(wav.getnframes()),
+            "sample_rate": wav.getframerate(),
+            "bits_per_sample": wav.getsampwidth() * 8,
+            "channels": wav.getnchannels(),
+            "audio_seconds": wav.getnframes() / wav.getframerate(),
+        }
+
+# 单路识别会话: 按实时速度 (speed=1) 或加速 (speed>1) 把 WAV 推入 PushAudioInputStream，
+# 用独立的 SpeechRecognizer 连续识别，返回该路的延迟指标 (秒):
+#   first_partial_latency - 开始推音频 -> 第一个 recognizing 事件
+#   final_latency         - 最后一块音频推完 -> 最后一个 recognized 事件
+#   rtf                   - 实时率: 开始推音频到最后结果的耗时 / 音频时长
+# 每块音频的推送时刻记入 AudioClock，PerformanceMonitor 据此给出每句话的延迟
+# (utterance_histograms / utterance_results)。
+# entry 为预先创建 (可已预连接) 的识别器，见 create_recognizer_entry / RecognizerPool;
+# 不传则现场冷启动。setup_time 为会话开始 -> 识别已启动、可以推音频的耗时。
+def run_stream_session(speech_config, audio, stream_index=0, speed=1.0, chunk_ms=100, timeout=60, entry=None):
+    setup_start = time.perf_counter()
+    if entry is None:
+        entry = create_recognizer_entry(speech_config, stream_format_for(audio))
+    push_stream = entry["push_stream"]
+    recognizer = entry["recognizer"]
+
+    result = {
+        "stream": stream_index,
+        "wav": audio["path"],
+        "audio_seconds": audio["audio_seconds"],
+        "first_partial_latency": None,
+        "final_latency": None,
+        "rtf": None,
+        "setup_time": None,
+        "utterances": 0,
+        "text": [],
+        "status": "success",
+    }
+    lock = threading.Lock()
+    stopped = threading.Event()
+    monitor = PerformanceMonitor(AudioClock())
+    push_start = None
+    push_end = None
+    last_final = None
+
+    def handle_recognizing(evt):
+        now = time.perf_counter()
+        if not evt.result.text:
+            return
+        monitor.on_recognizing(evt, now)
+        with lock:
+            if result["first_partial_latency"] is None and push_start is not None:
+                result["first_partial_latency"] = now - push_start
+
+    def handle_recognized(evt):
+        nonlocal last_final
+        now = time.perf_counter()
+        if evt.result.reason == speechsdk.ResultReason.RecognizedSpeech and evt.result.text:
+            monitor.on_recognized(evt, now)
+            with lock:
+                last_final = now
+                result["utterances"] += 1
+                result["text"].append(evt.result.text)
+
+    def handle_canceled(evt):
+        details = evt.cancellation_details
+        if details.reason == speechsdk.CancellationReason.Error:
+            result["status"] = f"error: {details.error_details}"
+        stopped.set()
+
+    recognizer.recognizing.connect(handle_recognizing)
+    recognizer.recognized.connect(handle_recognized)
+    recognizer.session_stopped.connect(lambda evt: stopped.set())
+    recognizer.canceled.connect(handle_canceled)
+
+    recognizer.start_continuous_recognition()
+    result["setup_time"] = time.perf_counter() - setup_start
+    try:
+        # 按时间表推送，避免 sleep 误差累积导致推送速度漂移
+        bytes_per_second = audio["sample_rate"] * audio["channels"] * audio["bits_per_sample"] // 8
+        chunk_bytes = max(1, bytes_per_second * chunk_ms // 1000)
+        pcm = audio["pcm"]
+        push_start = time.perf_counter()
+        for i, offset in enumerate(range(0, len(pcm), chunk_bytes)):
+            delay = push_start + i * chunk_ms / 1000 / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            chunk = pcm[offset:offset + chunk_bytes]
+            push_stream.write(chunk)
+            monitor.clock.pushed((offset + len(chunk)) / bytes_per_second, time.perf_counter())
+        push_end = time.perf_counter()
+        push_stream.close()
+
+        # 音频结束后，服务端识别完最后一句会触发 session_stopped
+        if not stopped.wait(timeout):
+            result["status"] = "error: timeout waiting for final result"
+    finally:
+        recognizer.stop_continuous_recognition()
+
+    with lock:
+        if last_final is not None:
+            result["final_latency"] = max(last_final - push_end, 0.0)
+            result["rtf"] = (last_final - push_start) / audio["audio_seconds"]
+    result["utterance_histograms"] = monitor.histograms
+    result["utterance_results"] = monitor.recognition_results
+    return result
+
+# WAV 对应的推流音频格式
+def stream_format_for(audio):
+    return speechsdk.audio.AudioStreamFormat(
+        samples_per_second=audio["sample_rate"],
+        bits_per_sample=audio["bits_per_sample"],
+        channels=audio["channels"],
+    )
+
+# 在识别器上预先建立到服务端的连接 (Connection.open)，等到 connected 事件返回。
+# 返回 (connection, connected, disconnected)，两个 Event 供调用方判断连接状态;
+# connection 需要保持引用，否则连接会随对象回收而关闭。
+def preconnect(recognizer, timeout=10):
+    connected = threading.Event()
+    disconnected = threading.Event()
+    settled = threading.Event()
+
+    def on_connected(evt):
+        connected.set()
+        settled.set()
+
+    def on_disconnected(evt):
+        disconnected.set()
+        settled.set()
+
+    connection = speechsdk.Connection.from_recognizer(recognizer)
+    connection.connected.connect(on_connected)
+    connection.disconnected.connect(on_disconnected)
+    connection.open(True)
+    # 连接失败时 SDK 触发 disconnected 而不是 connected，不必等到超时
+    if not settled.wait(timeout) or not connected.is_set():
+        connection.close()
+        raise ConnectionError("预连接失败" if disconnected.is_set() else f"预连接超时 ({timeout}s)")
+    return connection, connected, disconnected
+
+# 创建一个推流识别器; connect=True 时同时预连接
+def create_recognizer_entry(speech_config, stream_format, connect=False, timeout=10):
+    push_stream = speechsdk.audio.PushAudioInputStream(stream_format=stream_format)
+    audio_config = speechsdk.audio.AudioConfig(stream=push_stream)
+    entry = {
+        "push_stream": push_stream,
+        "recognizer": speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config),
+        "connection": None,
+        "disconnected": None,
+        "connected_at": None,
+    }
+    if connect:
+        entry["connection"], _, entry["disconnected"] = preconnect(entry["recognizer"], timeout)
+        entry["connected_at"] = time.perf_counter()
+    return entry
+
+# 预连接识别器池: 后台线程始终保持 size 个已连接、未使用的识别器。识别器绑定了各自的
+# 推流，用完即弃，checkout 后由后台补充。服务端断开或空闲超过 max_idle 秒的连接在
+# checkout 时丢弃; 池空时现场创建 (计为 miss)。
+class RecognizerPool:
+    def __init__(self, speech_config, stream_format, size=4, max_idle=60, connect_timeout=10):
+        self.speech_config = speech_config
+        self.stream_format = stream_format
+        self.size = size
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self.hits = 0
+        self.misses = 0
+        self._ready = queue.Queue()
+        self._free_slots = threading.Semaphore(size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, name="recognizer-pool", daemon=True)
+        self._thread.start()
+
+    def _fill(self):
+        while True:
+            self._free_slots.acquire()
+            if self._stop.is_set():
+                return
+            try:
+                self._ready.put(create_recognizer_entry(self.speech_config, self.stream_format, True,
+                                                        self.connect_timeout))
+            except Exception as e:
+                print(f"[{get_current_time()}] 识别器池预连接失败: {e}")
+                self._free_slots.release()
+                self._stop.wait(1)
+
+    # 等待池中准备好 size 个识别器
+    def wait_ready(self, timeout=30):
+        deadline = time.perf_counter() + timeout
+        while self._ready.qsize() < self.size and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        return self._ready.qsize()
+
+    def checkout(self):
+        while True:
+            try:
+                entry = self._ready.get_nowait()
+            except queue.Empty:
+                self.misses += 1
+                return create_recognizer_entry(self.speech_config, self.stream_format, True, self.connect_timeout)
+            self._free_slots.release()
+            if entry["disconnected"].is_set() or time.perf_counter() - entry["connected_at"] > self.max_idle:
+                entry["connection"].close()
+                continue
+            self.hits += 1
+            return entry
+
+    def close(self):
+        self._stop.set()
+        self._free_slots.release()
+        self._thread.join()
+        while not self._ready.empty():
+            self._ready.get_nowait()["connection"].close()
+
+# 启动方式对比: 对同一段短音频依次测 trials 次
+#   cold         - 会话开始时才创建识别器，连接在 start_continuous_recognition 时建立
+#   preconnected - 会话开始时创建识别器并 Connection.open，连上后再开始推音频
+#   pooled       - 从 RecognizerPool 取一个早已连好的识别器
+# 报告 setup (会话开始 -> 可推音频)、首个中间结果 (开始推音频 -> 首个 recognizing) 和两者之和。
+def benchmark_startup(wav_path, trials=10, pool_size=2, settings=None):
+    audio = read_wav(wav_path)
+    speech_config = create_speech_config(settings)
+    stream_format = stream_format_for(audio)
+    pool = RecognizerPool(speech_config, stream_format, size=pool_size)
+    pool.wait_ready()
+
+    def entry_for(mode):
+        if mode == "cold":
+            return None
+        if mode == "preconnected":
+            return create_recognizer_entry(speech_config, stream_format, connect=True)
+        return pool.checkout()
+
+    report = {}
+    try:
+        for mode in ("cold", "preconnected", "pooled"):
+            histograms = {key: LatencyHistogram() for key in ("setup_time", "first_partial_latency", "total")}
+            failures = 0
+            print(f"[{get_current_time()}] 测试启动方式: {mode} ({trials} 次)...")
+            for trial in range(trials):
+                if mode == "pooled":
+                    # 模拟两次来电之间的间隔，让池有时间补充
+                    pool.wait_ready(5)
+                try:
+                    # 识别器创建 / 预连接 / 取池的耗时也计入 setup
+                    setup_start = time.perf_counter()
+                    entry = entry_for(mode)
+                    entry_time = time.perf_counter() - setup_start
+                    session = run_stream_session(speech_config, audio, trial, entry=entry)
+                except Exception as e:
+                    session = {"status": f"error: {e}"}
+                if session["status"] != "success" or session.get("first_partial_latency") is None:
+                    failures += 1
+                    continue
+                setup_time = entry_time + session["setup_time"]
+                histograms["setup_time"].record(setup_time)
+                histograms["first_partial_latency"].record(session["first_partial_latency"])
+                histograms["total"].record(setup_time + session["first_partial_latency"])
+            report[mode] = histograms
+            print(f"  setup: {format_histogram_ms(histograms['setup_time'])}")
+            print(f"  首个中间结果: {format_histogram_ms(histograms['first_partial_latency'])}")
+            print(f"  合计: {format_histogram_ms(histograms['total'])}")
+            if failures:
+                print(f"  失败: {failures}/{trials}")
+    finally:
+        pool.close()
+
+    print(f"\n[{get_current_time()}] ===== 启动方式对比 (中位数) =====")
+    for mode, histograms in report.items():
+        total = histograms["total"]
+        if total.count:
+            print(f"  {mode:<13} setup {histograms['setup_time'].quantile(0.5)*1000:.0f}ms + "
+                  f"首个中间结果 {histograms['first_partial_latency'].quantile(0.5)*1000:.0f}ms = "
+                  f"{total.quantile(0.5)*1000:.0f}ms")
+    print(f"  识别器池命中: {pool.hits}, 未命中: {pool.misses}")
+    return report
+
+# 格式化一个 LatencyHistogram 的百分位 (毫秒)
+def format_histogram_ms(histogram):
+    if histogram.count == 0:
+        return "无数据"
+    percentiles = histogram.quantiles([p / 100 for p in PERCENTILES]).tolist()
+    return (f"平均 {histogram.mean*1000:.0f}ms, " +
+            ", ".join(f"p{p:g} {value*1000:.0f}ms" for p, value in zip(PERCENTILES, percentiles)) +
+            f", 最大 {histogram.max*1000:.0f}ms")
+
+# 打印 PerformanceMonitor 的每句延迟统计
+def print_utterance_statistics(histograms):
+    print(f"  语音开始->首个中间结果: {format_histogram_ms(histograms['first_partial_latency'])}")
+    print(f"  中间结果滞后音频: {format_histogram_ms(histograms['partial_latency'])}")
+    print(f"  中间结果间隔: {format_histogram_ms(histograms['partial_gap'])}")
+    print(f"  语音结束->最终结果: {format_histogram_ms(histograms['final_latency'])}")
+
+# 多路并发压测: streams 路会话同时运行，第 i 路使用 wav_files[i % len(wav_files)]，
+# ramp_seconds 内均匀启动各路会话。所有路的指标汇总到 LatencyHistogram 中统计。
+def run_parallel_streams(wav_files, streams=10, speed=1.0, ramp_seconds=0.0, chunk_ms=100, settings=None):
+    audios = [read_wav(path) for path in wav_files]
+    speech_config = create_speech_config(settings)
+    print(f"[{get_current_time()}] 开始 {streams} 路并发识别 (音频 {len(audios)} 个, 推送速度 {speed}x)...")
+
+    def start_session(index):
+        time.sleep(ramp_seconds * index / max(streams, 1))
+        try:
+            return run_stream_session(speech_config, audios[index % len(audios)], index, speed, chunk_ms)
+        except Exception as e:
+            return {"stream": index, "wav": audios[index % len(audios)]["path"], "status": f"error: {e}"}
+
+    histograms = {key: LatencyHistogram() for key in ("first_partial_latency", "final_latency", "rtf")}
+    utterance_histograms = PerformanceMonitor().histograms
+    results = []
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=streams) as executor:
+        for future in concurrent.futures.as_completed([executor.submit(start_session, i) for i in range(streams)]):
+            session = future.result()
+            results.append(session)
+            for key, histogram in histograms.items():
+                if session.get(key) is not None:
+                    histogram.record(session[key])
+            for key, histogram in session.get("utterance_histograms", {}).items():
+                utterance_histograms[key].merge(histogram)
+            print(f"[{get_current_time()}] 第 {session['stream']} 路结束: {session['status']}, "
+                  f"识别 {session.get('utterances', 0)} 句")
+    elapsed = time.perf_counter() - start
+
+    failures = [r for r in results if r["status"] != "success"]
+    audio_total = sum(r.get("audio_seconds", 0) for r in results)
+    print(f"\n[{get_current_time()}] ===== 并发识别统计 ({streams} 路) =====")
+    print(f"  总耗时: {elapsed:.1f}s, 音频总时长: {audio_total:.1f}s, 失败: {len(failures)}/{len(results)}")
+    print(f"  开始推送->首个中间结果: {format_histogram_ms(histograms['first_partial_latency'])}")
+    print(f"  音频推完->最终结果: {format_histogram_ms(histograms['final_latency'])}")
+    rtf = histograms["rtf"]
+    if rtf.count:
+        print(f"  实时率 (RTF): 平均 {rtf.mean:.2f}, p50 {rtf.quantile(0.5):.2f}, p95 {rtf.quantile(0.95):.2f}, 最大 {rtf.max:.2f}")
+    print(f"\n  每句延迟 (按音频时钟, 共 {utterance_histograms['final_latency'].count} 句):")
+    print_utterance_statistics(utterance_histograms)
+    for failure in failures[:10]:
+        print(f"  第 {failure['stream']} 路失败: {failure['status']}")
+    return results, histograms, utterance_histograms
+
+# ===== 参数扫描 =====
+
+# 参数扫描的默认网格: 每个键取值列表的笛卡尔积，未列出的键沿用 speech_settings。
+# sample_rate 会把语料重采样 (带抗混叠滤波) 到该采样率后再推送 (模拟 8kHz 电话音频)。
+sweep_grid = {
+    "segmentation_silence_timeout_ms": [100, 300, 500],
+    "initial_silence_timeout_ms": [5000],
+    "recognition_mode": ["CONVERSATION", "INTERACTIVE"],
+    "language": ["zh-CN"],
+    "sample_rate": [16000, 8000],
+}
+
+# 加载语料: 目录下每个 xxx.wav 配一个同名 xxx.txt 参考文本
+def load_corpus(corpus_dir):
+    corpus = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        path = os.path.join(corpus_dir, name)
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(reference_path):
+            print(f"[{get_current_time()}] 跳过 {name}: 缺少参考文本 {os.path.basename(reference_path)}")
+            continue
+        with open(reference_path, encoding="utf-8") as f:
+            corpus.append((read_wav(path), f.read().strip()))
+    return corpus
+
+# 把 16 位 PCM 重采样到 sample_rate。降采样前必须先低通滤波，否则新奈奎斯特频率以上的能量
+# 会混叠进语音频带，让 8kHz 的识别结果比真实电话音频更差。装了 scipy 时用多相滤波
+# (resample_poly)，否则在频域截断频谱 (理想低通，整段音频做一次 FFT)。
+def resample_audio(audio, sample_rate):
+    if sample_rate == audio["sample_rate"]:
+        return audio
+    if audio["bits_per_sample"] != 16:
+        raise ValueError("重采样只支持 16 位 PCM")
+    channels = audio["channels"]
+    samples = np.frombuffer(audio["pcm"], dtype="<i2").reshape(-1, channels).astype(np.float64)
+    if resample_poly is not None:
+        divisor = math.gcd(sample_rate, audio["sample_rate"])
+        resampled = resample_poly(samples, sample_rate // divisor, audio["sample_rate"] // divisor, axis=0)
+    else:
+        count = int(round(len(samples) * sample_rate / audio["sample_rate"]))
+        spectrum = np.fft.rfft(samples, axis=0)[:count // 2 + 1]
+        resampled = np.fft.irfft(spectrum, count, axis=0) * (count / len(samples))
+    pcm = np.clip(np.round(resampled), -32768, 32767).astype("<i2")
+    return dict(audio, pcm=pcm.tobytes(), sample_rate=sample_rate)
+
+# 文本切分: 含中日韩字符时按字切分 (即 CER)，否则按词切分; 忽略大小写和标点
+def tokenize_transcript(text):
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(" " if unicodedata.category(ch).startswith("P") else ch for ch in text)
+    if re.search(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]", text):
+        return [ch for ch in text if not ch.isspace()]
+    return text.split()
+
+# 编辑距离 (替换 + 删除 + 插入)，返回 (错误数, 参考文本长度)
+def transcript_errors(reference, hypothesis):
+    ref = tokenize_transcript(reference)
+    hyp = tokenize_transcript(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_token in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_token in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_token != hyp_token))
+        previous = current
+    return previous[-1], len(ref)
+
+# 参数扫描: 对 grid 中每组参数把语料中每个文件识别一遍 (parallel 路同时进行)，
+# 汇总每组的错误率 (WER/CER) 和每句延迟，按错误率、最终结果延迟排序输出，并写入 CSV。
+def run_config_sweep(corpus_dir, grid=None, parallel=8, speed=1.0, output="speech_config_sweep.csv", settings=None):
+    grid = grid or sweep_grid
+    corpus = load_corpus(corpus_dir)
+    if not corpus:
+        print(f"[{get_current_time()}] {corpus_dir} 中没有可用的语料")
+        return []
+    keys = list(grid)
+    combinations = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    print(f"[{get_current_time()}] 参数扫描: {len(combinations)} 组参数 x {len(corpus)} 个音频, 并发 {parallel}")
+
+    # 每组参数的统计
+    rows = []
+    for combination in combinations:
+        combo_settings = dict(settings or speech_settings, **combination)
+        rows.append({
+            "params": combination,
+            "speech_config": create_speech_config(combo_settings),
+            "sample_rate": combination.get("sample_rate"),
+            "errors": 0,
+            "reference_tokens": 0,
+            "failures": 0,
+            "histograms": PerformanceMonitor().histograms,
+        })
+
+    # 每个采样率只重采样一次语料，各组参数共用
+    corpus_by_rate = {rate: corpus if not rate else [(resample_audio(audio, rate), reference) for audio, reference in corpus]
+                      for rate in {row["sample_rate"] for row in rows}}
+
+    def run_case(row, audio, reference):
+        try:
+            session = run_stream_session(row["speech_config"], audio, speed=speed)
+        except Exception as e:
+            session = {"status": f"error: {e}"}
+        return row, reference, session
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [executor.submit(run_case, row, audio, reference)
+                   for row in rows for audio, reference in corpus_by_rate[row["sample_rate"]]]
+        for future in concurrent.futures.as_completed(futures):
+            row, reference, session = future.result()
+            if session["status"] != "success":
+                row["failures"] += 1
+                continue
+            errors, reference_tokens = transcript_errors(reference, " ".join(session["text"]))
+            row["errors"] += errors
+            row["reference_tokens"] += reference_tokens
+            for key, histogram in session["utterance_histograms"].items():
+                row["histograms"][key].merge(histogram)
+
+    table = []
+    for row in rows:
+        final = row["histograms"]["final_latency"]
+        first_partial = row["histograms"]["first_partial_latency"]
+        table.append(dict(
+            row["params"],
+            error_rate=row["errors"] / row["reference_tokens"] if row["reference_tokens"] else None,
+            final_p50_ms=final.quantile(0.5) * 1000 if final.count else None,
+            final_p95_ms=final.quantile(0.95) * 1000 if final.count else None,
+            first_partial_p50_ms=first_partial.quantile(0.5) * 1000 if first_partial.count else None,
+            utterances=final.count,
+            failures=row["failures"],
+        ))
+    table.sort(key=lambda r: (r["error_rate"] is None, r["error_rate"] or 0, r["final_p50_ms"] or 0))
+
+    def fmt(value, pattern):
+        return pattern.format(value) if value is not None else "-"
+
+    print(f"\n[{get_current_time()}] ===== 参数扫描结果 (按错误率、最终结果延迟排序) =====")
+    print("  " + "  ".join(f"{k}" for k in keys) + "  | 错误率  最终p50  最终p95  首个中间p50  句数  失败")
+    for r in table:
+        error_pct = r["error_rate"] * 100 if r["error_rate"] is not None else None
+        print("  " + "  ".join(f"{r[k]}" for k in keys) +
+              f"  | {fmt(error_pct, '{:.2f}%'):>7} {fmt(r['final_p50_ms'], '{:.0f}ms'):>8}"
+              f" {fmt(r['final_p95_ms'], '{:.0f}ms'):>8} {fmt(r['first_partial_p50_ms'], '{:.0f}ms'):>11}"
+              f" {r['utterances']:>5} {r['failures']:>5}")
+
+    with open(output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(table[0]))
+        writer.writeheader()
+        writer.writerows(table)
+    print(f"[{get_current_time()}] 扫描结果已保存到 '{output}'")
+    return table
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Azure Speech 延迟测试")
+    parser.add_argument("--wav", nargs="*", default=[], help="WAV 文件 (指定后进入多路并发模式)")
+    parser.add_argument("--streams", type=int, default=10, help="并发会话数")
+    parser.add_argument("--speed", type=float, default=1.0, help="推送速度, 1 为实时, 2 为两倍速")
+    parser.add_argument("--ramp", type=float, default=0.0, help="在多少秒内逐步启动全部会话")
+    parser.add_argument("--startup-benchmark", action="store_true",
+                        help="用第一个 WAV 对比冷启动 / 预连接 / 识别器池的首个中间结果延迟")
+    parser.add_argument("--trials", type=int, default=10)
+    parser.add_argument("--sweep", metavar="CORPUS_DIR",
+                        help="参数扫描: 目录下的 xxx.wav + xxx.txt 参考文本, 网格见 sweep_grid")
+    parser.add_argument("--parallel", type=int, default=8, help="参数扫描的并发会话数")
+    args = parser.parse_args()
+
     try:
-        speech_recognize_continuous()
+        if args.sweep:
+            run_config_sweep(args.sweep, parallel=args.parallel, speed=args.speed)
+        elif args.startup_benchmark:
+            benchmark_startup(args.wav[0], args.trials)
+        elif args.wav:
+            run_parallel_streams(args.wav, args.streams, args.speed, args.ramp)
+        else:
+            speech_recognize_continuous()
     except Exception as e:
         print(f"[{get_current_time()}] 发生错误: {str(e)}")
@@ -0,0 +1,215 @@
+# Coordinator + worker processes for generating load beyond one Python process
+#
+# One process is GIL- and NIC-bound well before production load, so the coordinator splits
+# the test into N shares and runs each in its own worker: local worker processes via
+# multiprocessing, and optionally worker servers on other hosts over a minimal socket
+# protocol. Workers never send raw results back, only their LatencyAggregator snapshot
+# (a few KB regardless of run length), which the coordinator merges into one report.
+#
+# Two kinds of share:
+#   "closed" - run_latency_tests with this worker's share of the iterations
+#   "open"   - AzureOpenAILoadTest.run_load_test with this worker's share of the target RPS
+#
+# Socket protocol: every message is a 4-byte big-endian length followed by UTF-8 JSON.
+# The coordinator sends one job, the worker replies with one snapshot and closes. Workers
+# use the regions config of their own host; run them only on a trusted network.
+#
+# Usage:
+#   python DistributedLoadTest.py coordinator --processes 8 --mode open --rps 400 --steady 300
+#   python DistributedLoadTest.py worker --listen 0.0.0.0:9500          (on each extra host)
+#   python DistributedLoadTest.py coordinator --processes 8 --hosts host2:9500 host3:9500 ...
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import time
+import concurrent.futures
+
+from LatencyStats import LatencyAggregator
+
+# ----- wire format -----
+
+def send_message(sock, payload):
+    data = json.dumps(payload).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed mid-message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def recv_message(sock):
+    (size,) = struct.unpack(">I", _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+# ----- worker side -----
+
+# Function to run one share of the test and return a mergeable snapshot. Imports happen
+# here so the coordinator process does not need the HTTP client stack.
+def run_share(job):
+    aggregator = LatencyAggregator()
+    start = time.perf_counter()
+    region_counts = {}
+    if job["mode"] == "closed":
+        from AzureOpenAILatencyTest import run_latency_tests
+        run_latency_tests(iterations=job["iterations"], warmup=job.get("warmup", True),
+                          max_workers=job.get("max_workers", 10), stream=job.get("stream", False),
+                          connection_mode=job.get("connection_mode", "pooled"),
+                          aggregator=aggregator, keep_results=False)
+    else:
+        from AzureOpenAILoadTest import run_load_test
+        _, region_runs = asyncio.run(run_load_test(
+            job["rps"], job.get("ramp_up", 0), job.get("steady", 60), job.get("ramp_down", 0),
+            job.get("arrival", "poisson"), job.get("max_in_flight", 5000), job.get("timeout", 120),
+            job.get("seed"),
+        ))
+        for run in region_runs:
+            for result in run["results"]:
+                aggregator.add_result(result)
+            region_counts[run["region"]] = {
+                "offered": sum(run["offered"].values()),
+                "dropped": sum(run["dropped"].values()),
+                "peak_in_flight": run["peak_in_flight"],
+            }
+    return {
+        "worker": job.get("worker"),
+        "host": socket.gethostname(),
+        "elapsed": time.perf_counter() - start,
+        "region_counts": region_counts,
+        "aggregator": aggregator.to_dict(),
+    }
+
+# Function to serve jobs from a coordinator, one connection at a time. A bad connection (a
+# stray client, a malformed or truncated job, a coordinator that went away) is logged and
+# dropped; the server keeps accepting.
+def serve_worker(host="0.0.0.0", port=9500, recv_timeout=30):
+    with socket.create_server((host, port)) as server:
+        print(f"Worker listening on {host}:{port}")
+        while True:
+            conn, address = server.accept()
+            with conn:
+                try:
+                    # A client that connects and sends nothing must not hold the worker
+                    conn.settimeout(recv_timeout)
+                    job = recv_message(conn)
+                    if not isinstance(job, dict) or job.get("mode") not in ("closed", "open"):
+                        raise ValueError(f"not a job: {str(job)[:200]}")
+                    conn.settimeout(None)
+                    print(f"Running share {job.get('worker')} for {address[0]} ({job['mode']})")
+                    try:
+                        snapshot = run_share(job)
+                    except Exception as e:
+                        snapshot = {"error": f"{type(e).__name__}: {e}"}
+                    send_message(conn, snapshot)
+                except (OSError, ValueError, KeyError) as e:
+                    print(f"Dropped connection from {address[0]}: {type(e).__name__}: {e}")
+
+# ----- coordinator side -----
+
+def _run_remote(address, job, timeout):
+    host, port = address.rsplit(":", 1)
+    with socket.create_connection((host, int(port)), timeout=timeout) as sock:
+        # The share itself can run much longer than the connect timeout
+        sock.settimeout(None)
+        send_message(sock, job)
+        snapshot = recv_message(sock)
+    if "error" in snapshot:
+        raise RuntimeError(f"worker {address} failed: {snapshot['error']}")
+    return snapshot
+
+# Function to split a test into shares and build one job per worker
+def build_jobs(mode, total_workers, iterations=10, rps=10.0, **options):
+    jobs = []
+    for i in range(total_workers):
+        job = dict(options, mode=mode, worker=i)
+        if mode == "closed":
+            job["iterations"] = iterations // total_workers + (1 if i < iterations % total_workers else 0)
+        else:
+            job["rps"] = rps / total_workers
+            if job.get("seed") is not None:
+                job["seed"] += 1000 * i
+        jobs.append(job)
+    # Workers with nothing to do (more workers than iterations) are skipped
+    return [job for job in jobs if mode != "closed" or job["iterations"] > 0]
+
+# Run every share (local processes first, then remote hosts) and merge the snapshots.
+# Returns the merged LatencyAggregator and per-region offered/dropped totals.
+def run_distributed(mode="open", processes=None, hosts=(), iterations=10, rps=10.0, connect_timeout=10, **options):
+    processes = os.cpu_count() if processes is None else processes
+    jobs = build_jobs(mode, processes + len(hosts), iterations, rps, **options)
+    local_jobs, remote_jobs = jobs[:processes], jobs[processes:]
+    print(f"Distributing {mode}-loop test over {len(local_jobs)} local processes and {len(remote_jobs)} remote workers...")
+
+    snapshots = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(len(local_jobs), 1)) as pool, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(len(remote_jobs), 1)) as remote_pool:
+        futures = [pool.submit(run_share, job) for job in local_jobs]
+        futures += [remote_pool.submit(_run_remote, address, job, connect_timeout)
+                    for address, job in zip(hosts, remote_jobs)]
+        for future in concurrent.futures.as_completed(futures):
+            snapshot = future.result()
+            print(f"  worker {snapshot['worker']} on {snapshot['host']} finished in {snapshot['elapsed']:.1f}s")
+            snapshots.append(snapshot)
+
+    merged = LatencyAggregator()
+    region_counts = {}
+    for snapshot in snapshots:
+        merged.merge(LatencyAggregator.from_dict(snapshot["aggregator"]))
+        for region, counts in snapshot["region_counts"].items():
+            totals = region_counts.setdefault(region, {"offered": 0, "dropped": 0, "peak_in_flight": 0})
+            totals["offered"] += counts["offered"]
+            totals["dropped"] += counts["dropped"]
+            # Workers peak at different moments, so the sum is an upper bound
+            totals["peak_in_flight"] += counts["peak_in_flight"]
+    return merged, region_counts
+
+# Function to print combined offered vs. achieved throughput for an open-loop run
+def summarize_distributed(aggregator, region_counts, duration):
+    print("\n===== DISTRIBUTED THROUGHPUT (requests/second) =====")
+    for region, counts in region_counts.items():
+        achieved = aggregator.histogram("latency", region).count
+        print(f"  {region:<16} offered {counts['offered'] / duration:.2f}  achieved {achieved / duration:.2f}"
+              f"  dropped {counts['dropped']}  peak in-flight <= {counts['peak_in_flight']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distributed latency/load test")
+    sub = parser.add_subparsers(dest="role", required=True)
+
+    worker = sub.add_parser("worker", help="serve shares for a remote coordinator")
+    worker.add_argument("--listen", default="0.0.0.0:9500")
+
+    coordinator = sub.add_parser("coordinator", help="split the test, run shares, merge the report")
+    coordinator.add_argument("--mode", choices=["open", "closed"], default="open")
+    coordinator.add_argument("--processes", type=int, default=None, help="local worker processes (default: CPU count)")
+    coordinator.add_argument("--hosts", nargs="*", default=[], help="remote workers as host:port")
+    coordinator.add_argument("--rps", type=float, default=10, help="open loop: total target rps per region")
+    coordinator.add_argument("--ramp-up", type=int, default=0)
+    coordinator.add_argument("--steady", type=int, default=60)
+    coordinator.add_argument("--ramp-down", type=int, default=0)
+    coordinator.add_argument("--iterations", type=int, default=10, help="closed loop: total iterations")
+    coordinator.add_argument("--max-workers", type=int, default=10, help="closed loop: threads per process")
+    coordinator.add_argument("--stream", action="store_true")
+    coordinator.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        host, port = args.listen.rsplit(":", 1)
+        serve_worker(host, int(port))
+    else:
+        aggregator, region_counts = run_distributed(
+            args.mode, args.processes, args.hosts, iterations=args.iterations, rps=args.rps,
+            ramp_up=args.ramp_up, steady=args.steady, ramp_down=args.ramp_down,
+            max_workers=args.max_workers, stream=args.stream, seed=args.seed,
+        )
+        if args.mode == "open":
+            summarize_distributed(aggregator, region_counts, args.ramp_up + args.steady + args.ramp_down)
+        from AzureOpenAILatencyTest import analyze_results
+        analyze_results(aggregator=aggregator)
@@ -0,0 +1,210 @@
+# Benchmark of the latency LLMGateway adds and the throughput one gateway core sustains
+#
+# Starts MockAzureServer (zero-latency profile, so the backend adds almost nothing) in its
+# own process(es) and LLMGateway in another process pinned to a single core, then drives
+# both with closed-loop aiohttp clients running in separate processes:
+#   1. added latency - low concurrency, direct-to-mock vs. through the gateway, for
+#      non-streaming (full response) and streaming (TTFT and full response). The difference
+#      in p50/p99 is the cost of the gateway hop, including its extra loopback connection.
+#      The gateway's own X-Gateway-Overhead-Ms (time outside the upstream call) is shown too.
+#   2. max RPS - high concurrency from several client processes, direct vs. gateway. The
+#      gateway figure is requests/second for one gateway core; the direct figure shows the
+#      mock's own ceiling, so a gateway number close to it means the mock was the limit.
+#
+# Client, mock and gateway should sit on different cores; with fewer than 3 cores they
+# compete and the RPS figures are lower bounds.
+#
+# Usage:
+#   python GatewayBenchmark.py [--duration 10] [--concurrency 1] [--rps-concurrency 64]
+#                              [--client-processes 2] [--mock-processes 1] [--strategy weighted]
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import socket
+import time
+
+import aiohttp
+
+from LatencyStats import LatencyHistogram
+from MockAzureServer import regions_for
+from LLMGateway import API_VERSION, backends_from_regions, load_config
+
+# Backend profile with no simulated latency: what is left is HTTP and event-loop cost
+ZERO_LATENCY_PROFILE = {"ttft": 0, "latency": 0, "tokens_per_sec": 0, "completion_tokens": 20}
+
+BENCH_MESSAGES = [{"role": "user", "content": "Summarize the benefits of connection pooling in one sentence."}]
+
+def _serve_mock(port, profiles):
+    from aiohttp import web
+    from MockAzureServer import create_app
+    web.run_app(create_app(profiles), host="127.0.0.1", port=port, access_log=None, backlog=4096,
+                reuse_port=True, print=None)
+
+def _serve_gateway(config, port, core):
+    if core is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {core})
+    from LLMGateway import run_gateway
+    run_gateway(config, "127.0.0.1", port)
+
+# Function to wait until a server accepts connections
+def wait_for_port(port, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+# Closed loop: `concurrency` workers each send the next request as soon as the last one is
+# done, for `duration` seconds. Returns histograms as dicts so they can cross processes.
+async def closed_loop(url, headers, body, concurrency, duration, stream):
+    latency, ttft, overhead = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        end = time.perf_counter() + duration
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < end:
+                start = time.perf_counter()
+                try:
+                    async with session.post(url, data=body, headers=headers) as response:
+                        if response.status != 200:
+                            await response.read()
+                            errors += 1
+                            continue
+                        if stream:
+                            first = None
+                            async for _ in response.content.iter_any():
+                                if first is None:
+                                    first = time.perf_counter() - start
+                            # An empty body has no first token to time
+                            if first is not None:
+                                ttft.record(first)
+                        else:
+                            await response.read()
+                            gateway_overhead = response.headers.get("X-Gateway-Overhead-Ms")
+                            if gateway_overhead is not None:
+                                overhead.record(float(gateway_overhead) / 1000)
+                    latency.record(time.perf_counter() - start)
+                except aiohttp.ClientError:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {"latency": latency.to_dict(), "ttft": ttft.to_dict(), "overhead": overhead.to_dict(),
+            "errors": errors, "elapsed": elapsed}
+
+def _client_process(url, headers, body, concurrency, duration, stream):
+    return asyncio.run(closed_loop(url, headers, body, concurrency, duration, stream))
+
+# Function to run one load level from `processes` client processes and merge the results
+def run_clients(url, headers, payload, concurrency, duration, stream, processes=1):
+    body = json.dumps(dict(payload, stream=stream)).encode("utf-8")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        parts = list(pool.map(_client_process, *zip(*[(url, headers, body, concurrency, duration, stream)] * processes)))
+    merged = {name: LatencyHistogram() for name in ("latency", "ttft", "overhead")}
+    for part in parts:
+        for name, histogram in merged.items():
+            histogram.merge(LatencyHistogram.from_dict(part[name]))
+    elapsed = max(part["elapsed"] for part in parts)
+    merged["errors"] = sum(part["errors"] for part in parts)
+    merged["rps"] = merged["latency"].count / elapsed
+    return merged
+
+def _ms(histogram, q):
+    value = histogram.quantile(q) if histogram.count else None
+    return f"{value * 1000:8.3f}" if value is not None else "       -"
+
+def run_benchmark(duration=10.0, concurrency=1, rps_concurrency=64, client_processes=2, mock_processes=1,
+                  strategy="weighted", gateway_core=0):
+    cores = os.cpu_count() or 1
+    mock_port, gateway_port = _free_port(), _free_port()
+    profiles = {"eastus": ZERO_LATENCY_PROFILE, "westus": ZERO_LATENCY_PROFILE}
+    regions = regions_for(f"http://127.0.0.1:{mock_port}", profiles)
+    config = load_config()
+    config["backends"] = backends_from_regions(regions)
+    config["routing"]["strategy"] = strategy
+
+    servers = [multiprocessing.Process(target=_serve_mock, args=(mock_port, profiles), daemon=True)
+               for _ in range(mock_processes)]
+    servers.append(multiprocessing.Process(target=_serve_gateway, args=(config, gateway_port, gateway_core % cores),
+                                           daemon=True))
+    for server in servers:
+        server.start()
+    try:
+        wait_for_port(mock_port)
+        wait_for_port(gateway_port)
+
+        direct = regions["eastus"]
+        targets = {
+            "direct": (f"{direct['endpoint']}openai/deployments/{direct['deployment']}/chat/completions"
+                       f"?api-version={API_VERSION}", {"Content-Type": "application/json", "api-key": "mock"}),
+            "gateway": (f"http://127.0.0.1:{gateway_port}/v1/chat/completions",
+                        {"Content-Type": "application/json"}),
+        }
+        payload = {"model": "gpt-4o", "messages": BENCH_MESSAGES, "max_tokens": 20}
+
+        # Warm both paths so connection setup is not measured
+        for url, headers in targets.values():
+            run_clients(url, headers, payload, 4, 1.0, False)
+
+        print(f"\n===== ADDED LATENCY (concurrency {concurrency}, {duration:.0f}s per cell, ms) =====")
+        print(f"{'mode':<12}{'path':<10}{'p50':>9}{'p99':>9}{'ttft p50':>10}{'ttft p99':>10}{'rps':>10}")
+        latency_results = {}
+        for stream in (False, True):
+            mode = "stream" if stream else "non-stream"
+            for path, (url, headers) in targets.items():
+                result = run_clients(url, headers, payload, concurrency, duration, stream)
+                latency_results[mode, path] = result
+                print(f"{mode:<12}{path:<10}{_ms(result['latency'], 0.5)} {_ms(result['latency'], 0.99)}"
+                      f"  {_ms(result['ttft'], 0.5)}  {_ms(result['ttft'], 0.99)}{result['rps']:10.1f}")
+            added = [latency_results[mode, "gateway"]["latency"].quantile(q) -
+                     latency_results[mode, "direct"]["latency"].quantile(q) for q in (0.5, 0.99)]
+            print(f"{mode:<12}{'added':<10}{added[0] * 1000:8.3f} {added[1] * 1000:8.3f}")
+        overhead = latency_results["non-stream", "gateway"]["overhead"]
+        print(f"Gateway-internal overhead (X-Gateway-Overhead-Ms): p50 {_ms(overhead, 0.5).strip()}  "
+              f"p99 {_ms(overhead, 0.99).strip()}")
+
+        print(f"\n===== MAX RPS ({client_processes} client processes x {rps_concurrency} concurrent, "
+              f"gateway pinned to core {gateway_core % cores}) =====")
+        if cores < 3:
+            print(f"Only {cores} core(s): client, mock and gateway share CPU, so these are lower bounds")
+        rps_results = {}
+        for path, (url, headers) in targets.items():
+            result = run_clients(url, headers, payload, rps_concurrency, duration, False, client_processes)
+            rps_results[path] = result
+            print(f"  {path:<10}{result['rps']:10.0f} rps   p50 {_ms(result['latency'], 0.5).strip()} ms  "
+                  f"p99 {_ms(result['latency'], 0.99).strip()} ms  errors {result['errors']}")
+        return latency_results, rps_results
+    finally:
+        for server in servers:
+            server.terminate()
+            server.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gateway added-latency and RPS-per-core benchmark")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per measurement")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrency for the added-latency runs")
+    parser.add_argument("--rps-concurrency", type=int, default=64, help="concurrency per client process for max RPS")
+    parser.add_argument("--client-processes", type=int, default=2)
+    parser.add_argument("--mock-processes", type=int, default=1)
+    parser.add_argument("--strategy", default="weighted")
+    parser.add_argument("--gateway-core", type=int, default=0)
+    args = parser.parse_args()
+
+    run_benchmark(args.duration, args.concurrency, args.rps_concurrency, args.client_processes,
+                  args.mock_processes, args.strategy, args.gateway_core)
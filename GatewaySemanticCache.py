@@ -0,0 +1,557 @@
+# In-process semantic cache for LLMGateway (llm-gateway-spec/SKILL.md section 5)
+#
+# A request's cache key text (see KEY_STRATEGIES) is looked up in two steps:
+#   1. exact: a SHA-256 of the partition and the normalized key text in a dict, no
+#      embedding needed
+#   2. semantic: the key text is embedded and compared (cosine = dot product of unit
+#      vectors) against the cached prompts of the same partition; the best match at or
+#      above similarity_threshold is a hit
+# The partition (cache_partition) hashes the model and every generation parameter
+# (GENERATION_PARAMS), so whatever the key strategy, a cached answer is only served to a
+# request for the same model with the same sampling, tools and output format.
+# Entries expire after ttl seconds; when the cache is full, expired entries go first, then
+# the least recently (lru) or least frequently (lfu) used 1% at once.
+#
+# VectorIndex keeps all embeddings in one preallocated float32 matrix (row = slot) and
+# answers a batch of queries with one matrix product. Past ivf_threshold entries it adds an
+# IVF layer: k-means centroids (trained on a snapshot, off the event loop when used from the
+# gateway) with each slot's rows grouped by nearest centroid, and a query only scores the
+# rows of its nprobe nearest centroids plus anything added since the last training.
+#
+# Responses are cached as the exact bytes the backend sent: JSON for non-streaming calls and
+# the captured SSE stream for streaming ones. A hit in the other mode is converted
+# (completion_from_sse / sse_from_completion), so one entry serves both.
+#
+# Embedders: HashingEmbedder (signed hashing of character trigrams, NumPy only) is
+# lexical - it matches re-phrasings that share most of their wording, not paraphrases - and
+# needs no network. EndpointEmbedder calls an OpenAI-compatible /embeddings endpoint for
+# real semantic matching.
+#
+# Usage (gateway config):
+#   "caching": {"enabled": true, "similarity_threshold": 0.95, "ttl": 3600, "max_cache_size": 10000}
+# Benchmarks: python SemanticCacheBenchmark.py
+
+import asyncio
+import hashlib
+import json
+import time
+import unicodedata
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+# What part of the request identifies a cached answer (spec 5.3); the model is always part
+# of the partition, "user" only drops the system and assistant turns from the key text
+KEY_STRATEGIES = ("messages", "user", "user+model")
+
+# Request fields that change the answer, hashed into the partition along with the model
+GENERATION_PARAMS = ("temperature", "top_p", "max_tokens", "max_completion_tokens", "stop", "seed",
+                     "presence_penalty", "frequency_penalty", "logit_bias", "logprobs", "top_logprobs",
+                     "tools", "tool_choice", "functions", "function_call", "response_format")
+
+# Function to normalize text so trivially different copies hash and embed the same
+def normalize_text(text):
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+def _content_text(content):
+    if isinstance(content, str):
+        return content
+    # Multi-part content: keep the text parts
+    return " ".join(part.get("text", "") for part in content or () if isinstance(part, dict))
+
+# Function to build the key text for a request under one of KEY_STRATEGIES
+def cache_key_text(payload, strategy="messages"):
+    messages = payload.get("messages") or ()
+    if strategy == "messages":
+        text = "\n".join(f"{m.get('role')}: {_content_text(m.get('content'))}" for m in messages)
+    else:
+        text = "\n".join(_content_text(m.get("content")) for m in messages if m.get("role") == "user")
+        if strategy == "user+model":
+            text = f"{payload.get('model')}\n{text}"
+    return normalize_text(text)
+
+# Function to hash the model and generation parameters into a signed 64-bit partition id
+def cache_partition(payload):
+    params = {name: payload[name] for name in GENERATION_PARAMS if payload.get(name) is not None}
+    canonical = json.dumps([payload.get("model"), params], sort_keys=True, separators=(",", ":"))
+    return int.from_bytes(hashlib.sha256(canonical.encode("utf-8")).digest()[:8], "little", signed=True)
+
+# ----- embedders -----
+
+class HashingEmbedder:
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def embed_sync(self, texts):
+        out = np.zeros((len(texts), self.dim), np.float32)
+        for row, text in enumerate(texts):
+            data = np.frombuffer(f"  {text} ".encode("utf-8"), np.uint8).astype(np.uint32)
+            if data.size < 3:
+                continue
+            # One code per character trigram, then a multiplicative hash: high bits pick the
+            # bucket, the lowest bit the sign
+            codes = (data[:-2] << 16) | (data[1:-1] << 8) | data[2:]
+            hashed = codes * np.uint32(2654435761)
+            buckets = (hashed >> np.uint32(8)) % np.uint32(self.dim)
+            signs = np.where(hashed & np.uint32(1), 1.0, -1.0)
+            out[row] = np.bincount(buckets, weights=signs, minlength=self.dim)
+        return out
+
+    async def embed(self, texts):
+        return self.embed_sync(texts)
+
+class EndpointEmbedder:
+    def __init__(self, url, headers, model, dim):
+        self.url = url
+        self.headers = headers
+        self.model = model
+        self.dim = dim
+        self._session = None
+
+    async def embed(self, texts):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        async with self._session.post(self.url, headers=self.headers,
+                                      json={"model": self.model, "input": list(texts)}) as response:
+            response.raise_for_status()
+            body = await response.json()
+        data = sorted(body["data"], key=lambda item: item["index"])
+        return np.asarray([item["embedding"] for item in data], np.float32)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+def _normalize_rows(vectors):
+    vectors = np.asarray(vectors, np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+# ----- vector index -----
+
+# Function to run a few rounds of k-means (Lloyd) on unit vectors; returns unit centroids
+def train_centroids(vectors, nlist, iterations=8, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+        # Empty clusters keep their old centroid
+        filled = counts > 0
+        centroids[filled] = _normalize_rows(sums[filled])
+    return centroids
+
+class VectorIndex:
+    def __init__(self, dim, capacity, ivf_threshold=100_000, nprobe=8):
+        self.dim = dim
+        self.capacity = capacity
+        self.vectors = np.zeros((capacity, dim), np.float32)
+        self.valid = np.zeros(capacity, bool)
+        self.generation = np.zeros(capacity, np.int64)
+        self.partition = np.zeros(capacity, np.int64)
+        self.size = 0
+        # Slots are handed out low-first, so rows [0, high) hold every valid vector
+        self.high = 0
+        self._free = []
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.centroids = None
+        self._list_rows = None      # rows grouped by centroid
+        self._list_offsets = None   # start of each centroid's rows in _list_rows
+        # Rows added since the IVF lists were built, scored by brute force
+        self._recent = np.empty(capacity, np.int64)
+        self._recent_count = 0
+        self._trained_size = 0
+        self._training = False
+
+    def add(self, vector, partition=0):
+        slot = self._free.pop() if self._free else self.high
+        if slot == self.high:
+            self.high += 1
+        self.vectors[slot] = vector
+        self.partition[slot] = partition
+        self.valid[slot] = True
+        self.generation[slot] += 1
+        self.size += 1
+        if self.centroids is not None and self._recent_count < self.capacity:
+            self._recent[self._recent_count] = slot
+            self._recent_count += 1
+        return slot
+
+    def remove(self, slot):
+        if self.valid[slot]:
+            self.valid[slot] = False
+            self.size -= 1
+            self._free.append(slot)
+
+    def clear(self):
+        self.valid[:] = False
+        self.size = self.high = 0
+        self._free = []
+        self.centroids = self._list_rows = self._list_offsets = None
+        self._recent_count = 0
+        self._trained_size = 0
+
+    # Train once the index passes ivf_threshold, and again when the brute-force recent list
+    # has grown to an eighth of the trained size
+    def needs_training(self):
+        if self._training or self.size < self.ivf_threshold:
+            return False
+        return self.centroids is None or self._recent_count > max(1024, self._trained_size // 8)
+
+    # Function to copy what training needs, so it can run off the event loop
+    def training_snapshot(self):
+        self._training = True
+        rows = np.flatnonzero(self.valid[:self.high])
+        return rows, self.vectors[rows].copy(), self.generation[rows].copy()
+
+    @staticmethod
+    def train(snapshot, sample_size=20_000, seed=0):
+        rows, vectors, generations = snapshot
+        nlist = max(16, int(np.sqrt(len(rows))))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)]
+        centroids = train_centroids(sample, nlist, seed=seed)
+        assign = np.concatenate([np.argmax(chunk @ centroids.T, axis=1)
+                                 for chunk in np.array_split(vectors, max(1, len(vectors) // 16384))])
+        return rows, generations, centroids, assign
+
+    # Function to swap in a trained IVF layer; rows replaced or added since the snapshot
+    # go to the brute-force "recent" list
+    def install(self, trained):
+        rows, generations, centroids, assign = trained
+        current = self.valid[rows] & (self.generation[rows] == generations)
+        rows, assign = rows[current], assign[current]
+        order = np.argsort(assign, kind="stable")
+        self._list_rows = rows[order]
+        self._list_offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1))
+        in_lists = np.zeros(self.capacity, bool)
+        in_lists[self._list_rows] = True
+        recent = np.flatnonzero(self.valid[:self.high] & ~in_lists[:self.high])
+        self._recent[:len(recent)] = recent
+        self._recent_count = len(recent)
+        self.centroids = centroids
+        self._trained_size = len(rows)
+        self._training = False
+
+    def _candidates(self, query):
+        probes = np.argpartition(-(self.centroids @ query), min(self.nprobe, len(self.centroids) - 1))[:self.nprobe]
+        parts = [self._list_rows[self._list_offsets[p]:self._list_offsets[p + 1]] for p in probes]
+        parts.append(self._recent[:self._recent_count])
+        return np.concatenate(parts)
+
+    # Function to return (scores, slots) of the k best rows for each query; slot -1 = none.
+    # With partitions (one id per query), only rows of the query's partition can match
+    def search(self, queries, k=1, partitions=None):
+        queries = np.atleast_2d(queries)
+        scores = np.full((len(queries), k), -np.inf, np.float32)
+        slots = np.full((len(queries), k), -1, np.int64)
+        if self.size == 0:
+            return scores, slots
+        if self.centroids is None:
+            # Brute force: one (high x batch) product for the whole batch
+            sims = self.vectors[:self.high] @ queries.T
+            sims[~self.valid[:self.high]] = -np.inf
+            if partitions is not None:
+                sims[self.partition[:self.high, None] != np.asarray(partitions)[None, :]] = -np.inf
+            kk = min(k, self.high)
+            top = np.argpartition(-sims, kk - 1, axis=0)[:kk].T
+            top_scores = np.take_along_axis(sims.T, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            scores[:, :kk] = np.take_along_axis(top_scores, order, axis=1)
+            slots[:, :kk] = np.take_along_axis(top, order, axis=1)
+        else:
+            for i, query in enumerate(queries):
+                rows = self._candidates(query)
+                if not len(rows):
+                    continue
+                sims = self.vectors[rows] @ query
+                sims[~self.valid[rows]] = -np.inf
+                if partitions is not None:
+                    sims[self.partition[rows] != partitions[i]] = -np.inf
+                kk = min(k, len(rows))
+                top = np.argpartition(-sims, kk - 1)[:kk]
+                top = top[np.argsort(-sims[top])]
+                scores[i, :kk] = sims[top]
+                slots[i, :kk] = rows[top]
+        slots[~np.isfinite(scores)] = -1
+        return scores, slots
+
+# ----- response conversion -----
+
+# Function to assemble a chat.completion JSON body from a captured SSE stream
+def completion_from_sse(data):
+    content, first, finish_reason, usage = [], None, None, None
+    for line in data.split(b"\n"):
+        if not line.startswith(b"data:") or line[5:].strip() == b"[DONE]":
+            continue
+        chunk = json.loads(line[5:])
+        first = first or chunk
+        usage = chunk.get("usage") or usage
+        for choice in chunk.get("choices") or ():
+            content.append(choice.get("delta", {}).get("content") or "")
+            finish_reason = choice.get("finish_reason") or finish_reason
+    body = {"id": first.get("id"), "object": "chat.completion", "created": first.get("created"),
+            "model": first.get("model"), "choices": [{"index": 0, "finish_reason": finish_reason,
+                                                      "message": {"role": "assistant", "content": "".join(content)}}]}
+    if usage:
+        body["usage"] = usage
+    return json.dumps(body).encode("utf-8")
+
+# Function to replay a chat.completion JSON body as a (single content chunk) SSE stream
+def sse_from_completion(data):
+    body = json.loads(data)
+    choice = body["choices"][0]
+    base = {"id": body.get("id"), "object": "chat.completion.chunk", "created": body.get("created"),
+            "model": body.get("model")}
+    events = [
+        dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]),
+        dict(base, choices=[{"index": 0, "delta": {"content": choice["message"].get("content") or ""},
+                             "finish_reason": None}]),
+        dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": choice.get("finish_reason")}]),
+    ]
+    return b"".join(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n" for event in events) + b"data: [DONE]\n\n"
+
+# ----- cache -----
+
+class SemanticCache:
+    def __init__(self, embedder, similarity_threshold=0.95, ttl=3600.0, max_size=10_000, eviction="lru",
+                 ivf_threshold=100_000, nprobe=8):
+        if eviction not in ("lru", "lfu"):
+            raise ValueError(f"unknown eviction policy {eviction!r}")
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_size = max_size
+        self.eviction = eviction
+        self.index = VectorIndex(embedder.dim, max_size, ivf_threshold, nprobe)
+        self.entries = [None] * max_size      # slot -> (key hash, body, is_sse)
+        self.exact = {}                       # key hash -> slot
+        self.created = np.zeros(max_size)
+        self.last_used = np.zeros(max_size)
+        self.uses = np.zeros(max_size, np.int64)
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0,
+                      "embed_errors": 0}
+
+    @staticmethod
+    def key_hash(key_text, partition=0):
+        return hashlib.sha256(f"{partition}\n{key_text}".encode("utf-8")).hexdigest()
+
+    def _touch(self, slot, now):
+        self.last_used[slot] = now
+        self.uses[slot] += 1
+
+    def _drop(self, slot):
+        key_hash = self.entries[slot][0]
+        if self.exact.get(key_hash) == slot:
+            del self.exact[key_hash]
+        self.entries[slot] = None
+        self.index.remove(slot)
+
+    def _alive(self, slot, now):
+        if now - self.created[slot] <= self.ttl:
+            return True
+        self._drop(slot)
+        self.stats["expired"] += 1
+        return False
+
+    # Function for the exact-hash fast path; returns (slot, 1.0) or None
+    def get_exact(self, key_hash):
+        slot = self.exact.get(key_hash)
+        now = time.monotonic()
+        if slot is None or not self._alive(slot, now):
+            return None
+        self._touch(slot, now)
+        self.stats["exact_hits"] += 1
+        return slot, 1.0
+
+    # Function to find the best live match for each of a batch of unit vectors, within each
+    # query's partition if given; returns a list of (slot, similarity) or None per query
+    def search(self, vectors, count_misses=True, partitions=None):
+        now = time.monotonic()
+        scores, slots = self.index.search(vectors, k=4, partitions=partitions)
+        matches = []
+        for row_scores, row_slots in zip(scores, slots):
+            match = None
+            for score, slot in zip(row_scores, row_slots):
+                if slot < 0 or score < self.similarity_threshold:
+                    break
+                if self._alive(slot, now):
+                    match = (int(slot), float(score))
+                    break
+            if match is not None:
+                self._touch(match[0], now)
+                self.stats["semantic_hits"] += 1
+            elif count_misses:
+                self.stats["misses"] += 1
+            matches.append(match)
+        return matches
+
+    async def embed(self, texts):
+        return _normalize_rows(await self.embedder.embed(texts))
+
+    # Function to look one key text up in a partition: exact first, then semantic. Returns
+    # ((slot, similarity) or None, key hash, query vector or None)
+    async def lookup(self, key_text, partition=0):
+        key_hash = self.key_hash(key_text, partition)
+        hit = self.get_exact(key_hash)
+        if hit is not None:
+            return hit, key_hash, None
+        vector = (await self.embed([key_text]))[0]
+        return self.search(vector[None, :], partitions=[partition])[0], key_hash, vector
+
+    def body_for(self, slot, stream):
+        _, body, is_sse = self.entries[slot]
+        if is_sse == stream:
+            return body
+        return sse_from_completion(body) if stream else completion_from_sse(body)
+
+    def _make_room(self, now):
+        valid = np.flatnonzero(self.index.valid[:self.index.high])
+        expired = valid[now - self.created[valid] > self.ttl]
+        if len(expired):
+            victims = expired
+            self.stats["expired"] += len(victims)
+        else:
+            batch = min(max(1, self.max_size // 100), len(valid))
+            if self.eviction == "lru":
+                victims = valid[np.argpartition(self.last_used[valid], batch - 1)[:batch]]
+            else:
+                victims = valid[np.lexsort((self.last_used[valid], self.uses[valid]))[:batch]]
+            self.stats["evictions"] += len(victims)
+        for slot in victims:
+            self._drop(int(slot))
+
+    def put(self, key_hash, vector, body, is_sse, partition=0):
+        now = time.monotonic()
+        old = self.exact.get(key_hash)
+        if old is not None:
+            self._drop(old)
+        if self.index.size >= self.max_size:
+            self._make_room(now)
+        slot = self.index.add(vector, partition)
+        self.entries[slot] = (key_hash, body, is_sse)
+        self.exact[key_hash] = slot
+        self.created[slot] = self.last_used[slot] = now
+        self.uses[slot] = 0
+        self.stats["stores"] += 1
+        return slot
+
+    def clear(self):
+        self.index.clear()
+        self.entries = [None] * self.max_size
+        self.exact = {}
+
+    def summary(self):
+        lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+        hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+        return dict(self.stats, size=self.index.size, max_size=self.max_size, lookups=lookups,
+                    hit_rate=hits / lookups if lookups else 0.0, ivf=self.index.centroids is not None)
+
+# ----- gateway middleware -----
+
+class SemanticCacheMiddleware:
+    def __init__(self, cache, key_strategy="messages", excluded_models=()):
+        if key_strategy not in KEY_STRATEGIES:
+            raise ValueError(f"unknown cache key strategy {key_strategy!r}")
+        self.cache = cache
+        self.key_strategy = key_strategy
+        self.excluded_models = set(excluded_models)
+        self._training_task = None
+
+    async def on_request(self, ctx):
+        if ctx.model in self.excluded_models or ctx.payload.get("n", 1) != 1:
+            return None
+        key_text = cache_key_text(ctx.payload, self.key_strategy)
+        partition = cache_partition(ctx.payload)
+        try:
+            match, key_hash, vector = await self.cache.lookup(key_text, partition)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError):
+            # The embeddings endpoint failed or answered garbage: fail open, the backend
+            # serves the request and nothing is stored for it
+            self.cache.stats["embed_errors"] += 1
+            ctx.extra["cache"] = "error"
+            return None
+        if match is not None:
+            slot, similarity = match
+            ctx.extra["cache"] = "hit" if vector is None else "semantic-hit"
+            headers = {"X-Gateway-Cache": ctx.extra["cache"], "X-Gateway-Cache-Similarity": f"{similarity:.4f}"}
+            if ctx.stream:
+                return web.Response(body=self.cache.body_for(slot, True), headers=headers,
+                                    content_type="text/event-stream")
+            return web.Response(body=self.cache.body_for(slot, False), headers=headers,
+                                content_type="application/json")
+        ctx.extra["cache"] = "miss"
+        ctx.extra["cache_key"] = (key_hash, vector, partition)
+        if ctx.stream:
+            # Spec 5.5: a streamed answer is stored only once it has been collected in full
+            ctx.capture = []
+        return None
+
+    async def on_response(self, ctx):
+        key = ctx.extra.get("cache_key")
+        if key is None or ctx.status != 200:
+            return
+        key_hash, vector, partition = key
+        if ctx.stream:
+            body = b"".join(ctx.capture or ())
+            if not body.rstrip().endswith(b"[DONE]"):
+                return
+        else:
+            body = ctx.response_body
+            if body is None:
+                return
+        self.cache.put(key_hash, vector, body, ctx.stream, partition)
+        # needs_training is False while a training runs, so there is at most one at a time
+        if self.cache.index.needs_training():
+            self._training_task = asyncio.create_task(self._train())
+
+    # k-means over 100k+ rows takes a while; NumPy releases the GIL, so it runs on the
+    # executor in the background and no request waits for it
+    async def _train(self):
+        index = self.cache.index
+        snapshot = index.training_snapshot()
+        try:
+            trained = await asyncio.get_running_loop().run_in_executor(None, VectorIndex.train, snapshot)
+        except BaseException:
+            index._training = False
+            raise
+        index.install(trained)
+
+    async def close(self):
+        if self._training_task is not None:
+            self._training_task.cancel()
+        if hasattr(self.cache.embedder, "close"):
+            await self.cache.embedder.close()
+
+    async def clear(self, request):
+        self.cache.clear()
+        return web.json_response({"cleared": True})
+
+    async def cache_stats(self, request):
+        return web.json_response(self.cache.summary())
+
+    # Admin endpoints (spec 10.3), registered by the gateway
+    def add_routes(self, router):
+        router.add_delete("/admin/cache", self.clear)
+        router.add_get("/admin/cache/stats", self.cache_stats)
+
+# Function to build the middleware from the gateway's "caching" config section
+def cache_from_config(caching):
+    embedding = caching.get("embedding") or {}
+    if embedding.get("url"):
+        from LLMGateway import resolve_secret
+        embedder = EndpointEmbedder(embedding["url"],
+                                    {"Content-Type": "application/json",
+                                     "Authorization": f"Bearer {resolve_secret(embedding.get('api_key_ref'))}"},
+                                    embedding.get("model"), embedding["dim"])
+    else:
+        embedder = HashingEmbedder(embedding.get("dim", 512))
+    cache = SemanticCache(embedder, caching.get("similarity_threshold", 0.95), caching.get("ttl", 3600),
+                          caching.get("max_cache_size", 10_000), caching.get("eviction", "lru"),
+                          caching.get("ivf_threshold", 100_000), caching.get("nprobe", 8))
+    return SemanticCacheMiddleware(cache, caching.get("key_strategy", "messages"),
+                                   caching.get("excluded_models", ()))
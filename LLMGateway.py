@@ -0,0 +1,726 @@
+# Reference LLM gateway: the request flow of llm-gateway-spec/SKILL.md sections 2-3
+#
+# One asyncio (aiohttp) process exposing the OpenAI-compatible data plane:
+#   POST /v1/chat/completions   streaming (SSE) and non-streaming
+#   GET  /v1/models             registered models and aliases
+#   GET  /health, /ready        liveness; readiness = at least one backend not circuit-open
+#   GET  /metrics               Prometheus text: requests, in-flight, latency/TTFT/overhead quantiles
+#   GET  /admin/backends        per-backend health snapshot
+#   DELETE /admin/cache, GET /admin/cache/stats   when the semantic cache is enabled
+#   GET/PUT /admin/rate-limits[/{key}[/usage]]    when rate limiting is enabled
+#
+# Request flow (spec 2.1): Client -> middlewares (auth, rate limit, cache) ->
+# route -> load balance -> backend, then the response middlewares on the way back.
+# A middleware is any object with an async on_request(ctx) (return a web.Response to answer
+# without calling a backend) and/or an async on_response(ctx); it may also add admin routes
+# (add_routes(router)) and release resources (async close()).
+#
+# Routing (spec 3.2): model aliases, ordered rules matching the model or a header
+# ("x-tier: economy"), then backends registered for the model, then default_backend; the
+# fallback_chain is appended after the balanced candidates. Load balancing (spec 3.3):
+# round-robin, weighted (smooth weighted round-robin), priority (overflow to the next
+# priority only when max_concurrency / max_tpm is reached), least-tokens (lowest share of
+# max_tpm used over the last 60s) and session-affinity (rendezvous hash of x-session-id).
+# Health (spec 3.4): passive only, with the same circuit breaker as RegionRouter; a 429 or
+# 5xx before the first byte fails over to the next candidate.
+#
+# The hot path is kept cheap: one pooled aiohttp session per backend, the client's request
+# bytes forwarded unchanged unless the model name must be rewritten, and SSE chunks written
+# to the client as the exact bytes objects read from the upstream socket (never parsed;
+# completion tokens are estimated by counting "data:" events). Non-streaming responses carry
+# X-Gateway-Overhead-Ms, the time spent in the gateway outside the upstream call.
+#
+# Config is a dict shaped like spec 9.2 (gateway_config below), or a JSON file of the same
+# shape. API keys are "env:NAME" references or, for local mocks only, literal strings.
+#
+# Usage:
+#   python LLMGateway.py --config gateway.json
+#   python LLMGateway.py --regions --strategy least-tokens     (backends = AzureOpenAILatencyTest.regions)
+#   python GatewayBenchmark.py                                (added latency and RPS per core)
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import time
+
+import aiohttp
+from aiohttp import web
+
+from LatencyStats import LatencyHistogram
+from RetryPolicy import classify_outcome, parse_retry_after
+from TokenRateLimiter import estimate_prompt_tokens
+
+API_VERSION = "2024-12-01-preview"
+
+STRATEGIES = ("round-robin", "weighted", "priority", "least-tokens", "session-affinity")
+
+# Default configuration; load_config merges a JSON file over it
+gateway_config = {
+    "listen": "0.0.0.0:8080",
+    # Gateway-issued keys: {key: {"name": ..., "models": [...] or None for all}}. Empty disables auth.
+    "api_keys": {},
+    "backends": [
+        # {"name": "gpt-4o-eastus", "provider": "azure", "endpoint": "https://....openai.azure.com/",
+        #  "model": "gpt-4o", "deployment": "gpt-4o", "api_key_ref": "env:AZURE_OPENAI_KEY_EASTUS",
+        #  "priority": 1, "weight": 100, "max_tpm": 100000, "max_concurrency": None,
+        #  "region": "eastus", "tags": {}}
+    ],
+    "routing": {
+        "strategy": "weighted",
+        "aliases": {},              # {"default": "gpt-4o"}
+        "default_backend": None,
+        "fallback_chain": [],
+        "rules": [],                # [{"match": {"header": "x-tier: economy"}, "backends": [...]}]
+    },
+    "upstream": {
+        "pool_size": 256,           # keep-alive connections per backend
+        "timeout": 120.0,
+        "failure_threshold": 5,
+        "open_seconds": 30.0,
+        "api_version": API_VERSION,
+    },
+    # Token rate limits and quotas (spec 4), see TokenRateLimiter.py
+    "rate_limiting": {
+        "enabled": False,
+        "backend": "memory",        # or "redis://host:port" to share counters between gateways
+        "rules": [{"key": ["api_key"], "tpm": 100000, "rpm": 600}],
+        "overrides": [],            # [{"key_type": "api_key", "key_value": "premium-client", "tpm": 500000}]
+        "completion_reserve": 1.0,  # share of max_tokens reserved up front, corrected from usage
+        "max_keys": 1000000,
+        "failure_mode": "open",     # Redis unreachable: "open" admits uncounted, "closed" answers 503
+    },
+    # Semantic cache (spec 5), see GatewaySemanticCache.py
+    "caching": {
+        "enabled": False,
+        "similarity_threshold": 0.95,
+        "ttl": 3600,
+        "max_cache_size": 10000,
+        "eviction": "lru",
+        "key_strategy": "messages",
+        "excluded_models": [],
+        "embedding": {},            # {"url": ".../embeddings", "api_key_ref": ..., "model": ..., "dim": 1536}
+    },
+}
+
+# Failure outcomes that count against a backend's health; a 4xx is the client's problem
+BACKEND_FAILURES = ("throttled", "server_error", "timeout", "connection_error", "error")
+# Status logged when the client went away mid-stream (nginx's convention); not a backend failure
+CLIENT_CLOSED = 499
+
+# Function to build an OpenAI-format error response
+def error_response(status, message, error_type="invalid_request_error", code=None, headers=None):
+    return web.json_response({"error": {"message": message, "type": error_type, "param": None, "code": code}},
+                             status=status, headers=headers)
+
+def resolve_secret(ref):
+    if ref and ref.startswith("env:"):
+        return os.environ.get(ref[4:], "")
+    return ref or ""
+
+# Raised when a backend failed before anything was sent to the client, so the next
+# candidate can be tried
+class UpstreamError(Exception):
+    def __init__(self, backend, outcome, status=None, body=b"", retry_after=None):
+        super().__init__(f"{backend}: {outcome} {status or ''}".strip())
+        self.outcome = outcome
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+# Tokens per second over the last 60s, in a ring of per-second buckets
+class TokenWindow:
+    def __init__(self, seconds=60):
+        self.buckets = [0] * seconds
+        self.second = 0
+        self.total = 0
+
+    def _advance(self, now):
+        second = int(now)
+        elapsed = second - self.second
+        if elapsed <= 0:
+            return
+        size = len(self.buckets)
+        if elapsed >= size:
+            self.buckets = [0] * size
+            self.total = 0
+        else:
+            for s in range(self.second + 1, second + 1):
+                self.total -= self.buckets[s % size]
+                self.buckets[s % size] = 0
+        self.second = second
+
+    def add(self, tokens, now):
+        self._advance(now)
+        self.buckets[self.second % len(self.buckets)] += tokens
+        self.total += tokens
+
+    def tokens(self, now):
+        self._advance(now)
+        return self.total
+
+class Backend:
+    def __init__(self, spec, upstream):
+        self.name = spec["name"]
+        self.provider = spec.get("provider", "openai")
+        self.model = spec["model"]
+        self.priority = spec.get("priority", 1)
+        self.weight = spec.get("weight", 100)
+        self.max_tpm = spec.get("max_tpm")
+        self.max_concurrency = spec.get("max_concurrency")
+        self.region = spec.get("region")
+        self.tags = spec.get("tags") or {}
+        api_key = resolve_secret(spec.get("api_key_ref"))
+        endpoint = spec["endpoint"]
+        if self.provider == "azure":
+            deployment = spec.get("deployment", self.model)
+            self.url = (f"{endpoint.rstrip('/')}/openai/deployments/{deployment}/chat/completions"
+                        f"?api-version={upstream['api_version']}")
+            self.headers = {"Content-Type": "application/json", "api-key": api_key}
+        elif self.provider in ("openai", "custom"):
+            self.url = f"{endpoint.rstrip('/')}/chat/completions"
+            self.headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        else:
+            raise ValueError(f"backend {self.name}: provider {self.provider!r} is not OpenAI-compatible")
+        # Azure takes the model from the deployment in the URL; others need it in the body
+        self.rewrite_model = self.provider != "azure"
+        self.failure_threshold = upstream["failure_threshold"]
+        self.open_seconds = upstream["open_seconds"]
+        self.session = None
+        # Health and load
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.status_counts = {}
+        self.consecutive_failures = 0
+        self.circuit = "closed"
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.token_window = TokenWindow()
+        self.latency = LatencyHistogram()
+        self.ttft = LatencyHistogram()
+
+    # Whether the circuit lets a request through now (moves open -> half-open on timeout)
+    def available(self, now):
+        if self.circuit == "open":
+            if now < self.open_until:
+                return False
+            self.circuit = "half-open"
+        return not (self.circuit == "half-open" and self.trial_in_flight)
+
+    def has_capacity(self, now):
+        if self.max_concurrency is not None and self.in_flight >= self.max_concurrency:
+            return False
+        return self.max_tpm is None or self.token_window.tokens(now) < self.max_tpm
+
+    def token_load(self, now):
+        tokens = self.token_window.tokens(now)
+        return tokens / self.max_tpm if self.max_tpm else float(tokens)
+
+    def begin(self, prompt_tokens):
+        self.in_flight += 1
+        self.requests += 1
+        if self.circuit == "half-open":
+            self.trial_in_flight = True
+        self.token_window.add(prompt_tokens, time.monotonic())
+
+    def finish(self, outcome, status, completion_tokens=0, retry_after=None):
+        now = time.monotonic()
+        self.in_flight -= 1
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if completion_tokens:
+            self.token_window.add(completion_tokens, now)
+        if self.circuit == "half-open":
+            self.trial_in_flight = False
+        if outcome not in BACKEND_FAILURES:
+            self.consecutive_failures = 0
+            self.circuit = "closed"
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.circuit == "half-open" or self.consecutive_failures >= self.failure_threshold:
+            self.circuit = "open"
+            self.open_until = now + max(self.open_seconds, retry_after or 0)
+
+    def snapshot(self, now):
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "region": self.region,
+            "priority": self.priority,
+            "weight": self.weight,
+            "circuit": self.circuit,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "tokens_last_minute": self.token_window.tokens(now),
+            "p50": self.latency.quantile(0.5),
+            "p99": self.latency.quantile(0.99),
+        }
+
+class LoadBalancer:
+    def __init__(self, strategy="weighted"):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"unknown load balancing strategy {strategy!r}")
+        self.strategy = strategy
+        self._counter = itertools.count()
+        self._current_weights = {}
+
+    # Smooth weighted round-robin (as in nginx): deterministic, and spreads a heavy backend's
+    # turns out instead of sending them back to back
+    def _weighted_pick(self, backends):
+        total = 0
+        best = None
+        for backend in backends:
+            weight = self._current_weights.get(backend.name, 0) + backend.weight
+            self._current_weights[backend.name] = weight
+            total += backend.weight
+            if best is None or weight > self._current_weights[best.name]:
+                best = backend
+        self._current_weights[best.name] -= total
+        return best
+
+    def _weighted_order(self, backends):
+        if len(backends) < 2:
+            return list(backends)
+        first = self._weighted_pick(backends)
+        return [first] + sorted((b for b in backends if b is not first), key=lambda b: -b.weight)
+
+    # Function to order the available candidates, best first
+    def order(self, backends, now, session_id=None):
+        if len(backends) < 2:
+            return list(backends)
+        strategy = self.strategy
+        if strategy == "round-robin":
+            start = next(self._counter) % len(backends)
+            return backends[start:] + backends[:start]
+        if strategy == "weighted" or (strategy == "session-affinity" and not session_id):
+            return self._weighted_order(backends)
+        if strategy == "priority":
+            ordered, overflow = [], []
+            for priority in sorted({b.priority for b in backends}):
+                group = [b for b in backends if b.priority == priority]
+                group = self._weighted_order(group)
+                ordered += [b for b in group if b.has_capacity(now)]
+                overflow += [b for b in group if not b.has_capacity(now)]
+            return ordered + overflow
+        if strategy == "least-tokens":
+            return sorted(backends, key=lambda b: (b.token_load(now), b.in_flight))
+        # session-affinity: rendezvous hashing keeps a session on the same backend while it is
+        # healthy and moves only that backend's sessions when it is not
+        def score(backend):
+            return hashlib.blake2b(f"{session_id}:{backend.name}".encode(), digest_size=8).digest()
+        return sorted(backends, key=score, reverse=True)
+
+class Router:
+    def __init__(self, backends, routing):
+        self.backends = {b.name: b for b in backends}
+        self.aliases = routing.get("aliases") or {}
+        self.default_backend = routing.get("default_backend")
+        self.fallback_chain = [self.backends[name] for name in routing.get("fallback_chain") or []]
+        self.rules = []
+        for rule in routing.get("rules") or []:
+            match = dict(rule["match"])
+            if "header" in match:
+                name, _, value = match.pop("header").partition(":")
+                match["header"] = (name.strip().lower(), value.strip())
+            self.rules.append((match, [self.backends[name] for name in rule["backends"]]))
+        self.by_model = {}
+        for backend in backends:
+            self.by_model.setdefault(backend.model, []).append(backend)
+        self.balancer = LoadBalancer(routing.get("strategy", "weighted"))
+
+    def models(self):
+        return sorted(set(self.by_model) | set(self.aliases))
+
+    def _matching(self, model, headers):
+        for match, backends in self.rules:
+            if "model" in match and match["model"] != model:
+                continue
+            if "header" in match and headers.get(match["header"][0]) != match["header"][1]:
+                continue
+            return backends
+        if model in self.by_model:
+            return self.by_model[model]
+        if model in self.backends:
+            return [self.backends[model]]
+        if self.default_backend:
+            return [self.backends[self.default_backend]]
+        return []
+
+    # Function to return (resolved model, backends to try in order); no backends means the
+    # model is unknown, all-circuit-open backends come back filtered out
+    def candidates(self, model, headers):
+        model = self.aliases.get(model, model)
+        matching = self._matching(model, headers)
+        if not matching:
+            return model, None
+        now = time.monotonic()
+        ordered = self.balancer.order([b for b in matching if b.available(now)], now,
+                                      headers.get("x-session-id"))
+        seen = {b.name for b in matching}
+        ordered += [b for b in self.fallback_chain if b.name not in seen and b.available(now)]
+        return model, ordered
+
+# Per-request state shared with the middlewares
+class RequestContext:
+    __slots__ = ("request", "body", "payload", "model", "stream", "api_key", "backend", "status",
+                 "prompt_tokens", "completion_tokens", "usage", "start", "ttft", "latency", "capture",
+                 "response_body", "extra")
+
+    def __init__(self, request, body, payload):
+        self.request = request
+        self.body = body
+        self.payload = payload
+        self.model = payload.get("model")
+        self.stream = bool(payload.get("stream"))
+        self.api_key = None
+        self.backend = None
+        self.status = None
+        self.prompt_tokens = estimate_prompt_tokens(payload.get("messages"))
+        self.completion_tokens = 0
+        self.usage = None
+        self.start = time.perf_counter()
+        self.ttft = None
+        self.latency = None
+        # Set to a list by a middleware to receive every streamed chunk (e.g. for caching)
+        self.capture = None
+        self.response_body = None
+        self.extra = {}
+
+# API key authentication (spec 6.1/6.3): Authorization: Bearer <key> or api-key: <key>
+class ApiKeyAuth:
+    def __init__(self, keys):
+        self.keys = keys
+
+    async def on_request(self, ctx):
+        headers = ctx.request.headers
+        key = headers.get("api-key")
+        if key is None:
+            auth = headers.get("Authorization", "")
+            key = auth[7:] if auth.startswith("Bearer ") else None
+        tenant = self.keys.get(key) if key else None
+        if tenant is None:
+            return error_response(401, "Invalid or missing API key", "authentication_error", "invalid_api_key")
+        allowed = tenant.get("models")
+        if allowed is not None and ctx.model not in allowed:
+            return error_response(403, f"API key may not use model {ctx.model!r}", "permission_error",
+                                  "model_not_allowed")
+        ctx.api_key = key
+        return None
+
+# One JSON log line per request to stdout (spec 7.2)
+class JsonLogger:
+    async def on_response(self, ctx):
+        print(json.dumps({
+            "timestamp": time.time(),
+            "api_key_id": (ctx.api_key or "")[:4] + "***" if ctx.api_key else None,
+            "model": ctx.model,
+            "backend_endpoint": ctx.backend.name if ctx.backend else None,
+            "stream": ctx.stream,
+            "prompt_tokens": ctx.prompt_tokens,
+            "completion_tokens": ctx.completion_tokens,
+            "latency_ms": round(ctx.latency * 1000, 2) if ctx.latency is not None else None,
+            "ttft_ms": round(ctx.ttft * 1000, 2) if ctx.ttft is not None else None,
+            "status_code": ctx.status,
+        }), flush=True)
+
+class Gateway:
+    def __init__(self, config=None, middlewares=()):
+        config = config or gateway_config
+        self.config = config
+        upstream = dict(gateway_config["upstream"], **config.get("upstream", {}))
+        self.upstream = upstream
+        self.backends = [Backend(spec, upstream) for spec in config["backends"]]
+        self.router = Router(self.backends, dict(gateway_config["routing"], **config.get("routing", {})))
+        self.middlewares = list(middlewares)
+        if config.get("api_keys"):
+            self.middlewares.insert(0, ApiKeyAuth(config["api_keys"]))
+        self.request_hooks = [m for m in self.middlewares if hasattr(m, "on_request")]
+        self.response_hooks = [m for m in self.middlewares if hasattr(m, "on_response")]
+        self.requests = {}
+        self.overhead = LatencyHistogram()
+        self.latency = LatencyHistogram()
+        self.ttft = LatencyHistogram()
+
+    async def start(self, app):
+        timeout = aiohttp.ClientTimeout(total=self.upstream["timeout"])
+        for backend in self.backends:
+            connector = aiohttp.TCPConnector(limit=self.upstream["pool_size"], ttl_dns_cache=300)
+            backend.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self, app):
+        for backend in self.backends:
+            if backend.session is not None:
+                await backend.session.close()
+        for middleware in self.middlewares:
+            if hasattr(middleware, "close"):
+                await middleware.close()
+
+    # Function to send the request to one backend and relay the answer. Raises UpstreamError
+    # when the backend failed before the client saw anything, so the caller can fail over; a
+    # stream that breaks after that is ended and returned with ctx.extra["status"] set.
+    async def forward(self, ctx, backend):
+        body = ctx.body
+        if backend.rewrite_model and ctx.payload.get("model") != backend.model:
+            body = json.dumps(dict(ctx.payload, model=backend.model)).encode("utf-8")
+        backend.begin(ctx.prompt_tokens)
+        upstream_start = time.perf_counter()
+        outcome, status, retry_after = "error", 502, None
+        response, events = None, 0
+        try:
+            async with backend.session.post(backend.url, data=body, headers=backend.headers) as upstream:
+                status = upstream.status
+                if status != 200:
+                    data = await upstream.read()
+                    outcome = classify_outcome(status)
+                    retry_after = parse_retry_after(upstream.headers)
+                    if outcome in BACKEND_FAILURES:
+                        raise UpstreamError(backend.name, outcome, status, data, retry_after)
+                    # Client errors are the caller's to see
+                    return web.Response(status=status, body=data, content_type="application/json")
+
+                if ctx.stream:
+                    # Headers go to the client with the first chunk, so until then a failure
+                    # can still fail over to the next backend
+                    response = web.StreamResponse(headers={"Content-Type": "text/event-stream",
+                                                           "Cache-Control": "no-cache",
+                                                           "X-Gateway-Backend": backend.name})
+                    capture = ctx.capture
+                    client_closed = False
+                    async for chunk in upstream.content.iter_any():
+                        if ctx.ttft is None:
+                            ctx.ttft = time.perf_counter() - ctx.start
+                        events += chunk.count(b"data:")
+                        if capture is not None:
+                            capture.append(chunk)
+                        # Downstream write errors are the client's, kept apart from upstream
+                        # read errors so a disconnect never counts against the backend
+                        try:
+                            if not response.prepared:
+                                await response.prepare(ctx.request)
+                            await response.write(chunk)
+                        except ConnectionResetError:
+                            client_closed = True
+                            break
+                    if not client_closed:
+                        try:
+                            if not response.prepared:
+                                await response.prepare(ctx.request)
+                            await response.write_eof()
+                        except ConnectionResetError:
+                            client_closed = True
+                    # Role chunk, finish chunk and [DONE] carry no tokens
+                    ctx.completion_tokens = max(events - 3, 0)
+                    outcome = "client_closed" if client_closed else "success"
+                    if client_closed:
+                        ctx.extra["status"] = CLIENT_CLOSED
+                    return response
+
+                data = await upstream.read()
+                upstream_time = time.perf_counter() - upstream_start
+                ctx.response_body = data
+                try:
+                    ctx.usage = json.loads(data).get("usage")
+                except ValueError:
+                    ctx.usage = None
+                if ctx.usage:
+                    ctx.completion_tokens = ctx.usage.get("completion_tokens", 0)
+                outcome = "success"
+                overhead = time.perf_counter() - ctx.start - upstream_time
+                self.overhead.record(overhead)
+                return web.Response(body=data, content_type="application/json",
+                                    headers={"X-Gateway-Backend": backend.name,
+                                             "X-Gateway-Overhead-Ms": f"{overhead * 1000:.3f}"})
+        except UpstreamError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            outcome = classify_outcome(None, e)
+            if response is None or not response.prepared:
+                raise UpstreamError(backend.name, outcome) from e
+            # Already streaming: nothing to fail over to. End the stream (the client sees it
+            # stop without [DONE]) and let _respond record the request as failed
+            try:
+                await response.write_eof()
+            except ConnectionResetError:
+                pass
+            # No finish chunk or [DONE] arrived; only the role chunk carries no tokens
+            ctx.completion_tokens = max(events - 1, 0)
+            ctx.extra["status"] = 502
+            return response
+        finally:
+            backend.finish(outcome, status, ctx.completion_tokens, retry_after)
+            if outcome == "success":
+                backend.latency.record(time.perf_counter() - upstream_start)
+                if ctx.ttft is not None:
+                    backend.ttft.record(ctx.ttft)
+
+    async def _respond(self, ctx, response):
+        # forward() sets extra["status"] when a stream that already went out as 200 failed
+        ctx.status = ctx.extra.get("status", response.status)
+        ctx.latency = time.perf_counter() - ctx.start
+        key = (ctx.backend.name if ctx.backend else "-", ctx.status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if ctx.status == 200:
+            self.latency.record(ctx.latency)
+            if ctx.ttft is not None:
+                self.ttft.record(ctx.ttft)
+        for middleware in self.response_hooks:
+            await middleware.on_response(ctx)
+        return response
+
+    async def chat_completions(self, request):
+        body = await request.read()
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return error_response(400, "Request body is not valid JSON")
+        if not isinstance(payload, dict) or not payload.get("messages"):
+            return error_response(400, "'messages' is required")
+        ctx = RequestContext(request, body, payload)
+
+        for middleware in self.request_hooks:
+            response = await middleware.on_request(ctx)
+            if response is not None:
+                return await self._respond(ctx, response)
+
+        ctx.model, candidates = self.router.candidates(ctx.model, request.headers)
+        if candidates is None:
+            return await self._respond(ctx, error_response(404, f"The model {ctx.model!r} does not exist",
+                                                           code="model_not_found"))
+        last_error = None
+        for backend in candidates:
+            ctx.backend = backend
+            try:
+                response = await self.forward(ctx, backend)
+            except UpstreamError as e:
+                last_error = e
+                continue
+            return await self._respond(ctx, response)
+
+        ctx.backend = None
+        if last_error is None:
+            return await self._respond(ctx, error_response(503, "No healthy backend for this model",
+                                                           "service_unavailable", "no_backend"))
+        if last_error.outcome == "throttled":
+            retry_after = last_error.retry_after or 1
+            return await self._respond(ctx, error_response(429, "All backends are rate limited", "rate_limit_error",
+                                                           "rate_limit_exceeded",
+                                                           {"Retry-After": str(max(int(retry_after), 1))}))
+        return await self._respond(ctx, error_response(502, f"All backends failed ({last_error})", "upstream_error",
+                                                       last_error.outcome))
+
+    async def list_models(self, request):
+        return web.json_response({"object": "list", "data": [
+            {"id": model, "object": "model", "owned_by": "gateway"} for model in self.router.models()]})
+
+    async def health(self, request):
+        return web.json_response({"status": "ok"})
+
+    async def ready(self, request):
+        now = time.monotonic()
+        ready = any(b.circuit != "open" or now >= b.open_until for b in self.backends)
+        return web.json_response({"ready": ready}, status=200 if ready else 503)
+
+    async def admin_backends(self, request):
+        now = time.monotonic()
+        return web.json_response({b.name: b.snapshot(now) for b in self.backends})
+
+    # Prometheus exposition format (spec 7.1)
+    async def metrics(self, request):
+        lines = ["# TYPE gateway_requests_total counter"]
+        for (backend, status), count in sorted(self.requests.items(), key=str):
+            lines.append(f'gateway_requests_total{{backend="{backend}",status_code="{status}"}} {count}')
+        lines.append("# TYPE gateway_backend_in_flight gauge")
+        lines += [f'gateway_backend_in_flight{{backend="{b.name}"}} {b.in_flight}' for b in self.backends]
+        lines.append("# TYPE gateway_backend_circuit_open gauge")
+        lines += [f'gateway_backend_circuit_open{{backend="{b.name}"}} {int(b.circuit == "open")}'
+                  for b in self.backends]
+        for name, histogram in (("latency", self.latency), ("ttft", self.ttft), ("overhead", self.overhead)):
+            lines.append(f"# TYPE gateway_{name}_seconds summary")
+            if histogram.count:
+                for q, value in zip((0.5, 0.95, 0.99), histogram.quantiles((0.5, 0.95, 0.99))):
+                    lines.append(f'gateway_{name}_seconds{{quantile="{q}"}} {value:.6f}')
+            lines.append(f"gateway_{name}_seconds_count {histogram.count}")
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+    def create_app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app["gateway"] = self
+        app.on_startup.append(self.start)
+        app.on_cleanup.append(self.close)
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_get("/v1/models", self.list_models)
+        app.router.add_get("/health", self.health)
+        app.router.add_get("/ready", self.ready)
+        app.router.add_get("/metrics", self.metrics)
+        app.router.add_get("/admin/backends", self.admin_backends)
+        for middleware in self.middlewares:
+            if hasattr(middleware, "add_routes"):
+                middleware.add_routes(app.router)
+        return app
+
+# Function to load a JSON config file over the defaults
+def load_config(path=None):
+    config = json.loads(json.dumps(gateway_config))
+    if path:
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+# Function to turn a regions dict (the AzureOpenAILatencyTest.regions shape) into backends.
+# Azure regions serve `model`; Databricks and OpenAI-compatible entries are registered under
+# their own model name. Anthropic-style entries are skipped (not OpenAI-compatible).
+def backends_from_regions(regions, model="gpt-4o"):
+    backends = []
+    for name, config in regions.items():
+        provider = config.get("provider", "azure")
+        if provider == "azure":
+            backends.append({"name": name, "provider": "azure", "endpoint": config["endpoint"], "model": model,
+                             "deployment": config["deployment"], "api_key_ref": config["api_key"], "region": name})
+        elif provider in ("databricks", "openai"):
+            endpoint = config["endpoint"] + ("serving-endpoints/" if provider == "databricks" else "")
+            backends.append({"name": name, "provider": "openai", "endpoint": endpoint, "model": config["deployment"],
+                             "api_key_ref": config["api_key"], "region": name})
+    return backends
+
+# Function to run the gateway in the current process until interrupted
+def run_gateway(config, host="0.0.0.0", port=8080, log_requests=False):
+    middlewares = [JsonLogger()] if log_requests else []
+    # Rate limits run before the cache, so cached answers still count against them
+    if config.get("rate_limiting", {}).get("enabled"):
+        from TokenRateLimiter import limiter_from_config
+        middlewares.append(limiter_from_config(config["rate_limiting"]))
+    if config.get("caching", {}).get("enabled"):
+        from GatewaySemanticCache import cache_from_config
+        middlewares.append(cache_from_config(config["caching"]))
+    gateway = Gateway(config, middlewares)
+    print(f"Gateway on http://{host}:{port}/v1 with {len(gateway.backends)} backends "
+          f"({gateway.router.balancer.strategy})")
+    web.run_app(gateway.create_app(), host=host, port=port, access_log=None, backlog=4096, print=None)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM gateway")
+    parser.add_argument("--config", help="JSON config file (same shape as gateway_config)")
+    parser.add_argument("--regions", action="store_true",
+                        help="use AzureOpenAILatencyTest.regions as the backends")
+    parser.add_argument("--strategy", choices=STRATEGIES, default=None)
+    parser.add_argument("--listen", default=None, help="host:port (default from config)")
+    parser.add_argument("--log-requests", action="store_true", help="one JSON log line per request")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.regions:
+        from AzureOpenAILatencyTest import regions
+        config["backends"] = backends_from_regions(regions)
+    if args.strategy:
+        config["routing"]["strategy"] = args.strategy
+    host, port = (args.listen or config["listen"]).rsplit(":", 1)
+    run_gateway(config, host, int(port), args.log_requests)
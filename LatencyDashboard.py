@@ -0,0 +1,153 @@
+# Live terminal view of a running benchmark
+#
+# LiveStats keeps, per region, one LatencyHistogram per wall-clock second for the last
+# window_s seconds, so the rolling percentiles cost the same at minute 1 and hour 10.
+# TerminalDashboard redraws a per-region table from it once a second on a background
+# thread: RPS, in-flight, rolling p50/p95/p99, error rate and 429 count.
+
+import sys
+import threading
+import time
+
+from LatencyStats import LatencyHistogram
+
+# Function to tell whether a result was throttled by the service
+def is_throttled(result):
+    return result.get("status_code") == 429 or "429" in str(result.get("status", ""))
+
+class LiveStats:
+    def __init__(self, window_s=10):
+        self.window_s = window_s
+        self.start_time = time.monotonic()
+        # region -> {second: [histogram, completed, errors, throttled]}
+        self._slots = {}
+        # region -> [in_flight, total_completed, total_errors, total_throttled]
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def _region_totals(self, region):
+        totals = self._totals.get(region)
+        if totals is None:
+            totals = self._totals[region] = [0, 0, 0, 0]
+            self._slots[region] = {}
+        return totals
+
+    def request_started(self, region):
+        with self._lock:
+            self._region_totals(region)[0] += 1
+
+    def request_finished(self, result):
+        second = int(time.monotonic())
+        region = result["region"]
+        throttled = is_throttled(result)
+        with self._lock:
+            totals = self._region_totals(region)
+            totals[0] -= 1
+            totals[1] += 1
+            slots = self._slots[region]
+            slot = slots.get(second)
+            if slot is None:
+                slot = slots[second] = [LatencyHistogram(), 0, 0, 0]
+                # Drop seconds that have left the window
+                for old in [s for s in slots if s <= second - self.window_s]:
+                    del slots[old]
+            slot[1] += 1
+            if result.get("latency") is not None and result.get("status") == "success":
+                slot[0].record(result["latency"])
+            else:
+                slot[2] += 1
+                totals[2] += 1
+            if throttled:
+                slot[3] += 1
+                totals[3] += 1
+
+    # Per-region rolling figures for the last window_s seconds
+    def snapshot(self):
+        now = time.monotonic()
+        window = min(self.window_s, max(now - self.start_time, 1e-9))
+        since = int(now) - self.window_s
+        rows = {}
+        with self._lock:
+            for region, (in_flight, completed, errors, throttled) in self._totals.items():
+                histogram = LatencyHistogram()
+                window_completed = window_errors = window_throttled = 0
+                for second, (slot_histogram, slot_completed, slot_errors, slot_throttled) in self._slots[region].items():
+                    if second > since:
+                        histogram.merge(slot_histogram)
+                        window_completed += slot_completed
+                        window_errors += slot_errors
+                        window_throttled += slot_throttled
+                rows[region] = {
+                    "rps": window_completed / window,
+                    "in_flight": in_flight,
+                    "p50": histogram.percentile(50),
+                    "p95": histogram.percentile(95),
+                    "p99": histogram.percentile(99),
+                    "error_rate": window_errors / window_completed if window_completed else 0.0,
+                    "throttled": window_throttled,
+                    "total_completed": completed,
+                    "total_errors": errors,
+                    "total_throttled": throttled,
+                }
+        return rows
+
+# Function to render a snapshot as a fixed-width table
+def format_snapshot(rows, elapsed, window_s):
+    minutes, seconds = divmod(int(elapsed), 60)
+    hours, minutes = divmod(minutes, 60)
+    lines = [
+        f"Live latency (rolling {window_s}s window)   elapsed {hours:02d}:{minutes:02d}:{seconds:02d}",
+        "",
+        f"{'Region':<16}{'RPS':>8}{'In-flight':>11}{'p50':>9}{'p95':>9}{'p99':>9}{'Err%':>8}{'429s':>7}{'Total':>9}{'Total 429':>11}",
+    ]
+
+    def fmt(value):
+        return f"{value:.3f}s" if value is not None else "-"
+
+    for region, row in rows.items():
+        lines.append(
+            f"{region:<16}{row['rps']:>8.2f}{row['in_flight']:>11}{fmt(row['p50']):>9}{fmt(row['p95']):>9}"
+            f"{fmt(row['p99']):>9}{row['error_rate']*100:>7.1f}%{row['throttled']:>7}"
+            f"{row['total_completed']:>9}{row['total_throttled']:>11}"
+        )
+    return "\n".join(lines)
+
+class TerminalDashboard:
+    def __init__(self, live_stats, interval=1.0, stream=None):
+        self.live_stats = live_stats
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._stop = threading.Event()
+        self._thread = None
+
+    def render(self):
+        text = format_snapshot(self.live_stats.snapshot(), time.monotonic() - self.live_stats.start_time,
+                               self.live_stats.window_s)
+        if self.stream.isatty():
+            # Home the cursor and clear the screen so the table redraws in place
+            self.stream.write("\033[H\033[J" + text + "\n")
+        else:
+            self.stream.write(text + "\n\n")
+        self.stream.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.render()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="latency-dashboard", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        # Leave the final state on screen
+        self.render()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,332 @@
+# Append-only columnar store of per-request results, and run-over-run comparison
+#
+# ResultWriter streams result dicts into one Parquet file per run, under a date partition:
+#   <store>/date=2025-01-31/run-<run_id>.parquet
+# with one row per request. Rows are buffered and flushed as Parquet row groups, so a
+# daily run costs a few bytes per request on disk instead of a rewritten JSON file.
+#
+# The compare and trend commands load any number of runs back with pyarrow.dataset (only
+# the needed columns and dates are read) and aggregate with vectorized pandas/NumPy:
+#   - compare: latest run vs. the runs of the previous N days, per region, with a
+#     Mann-Whitney U test on latency and TTFT; a region is flagged as a regression when
+#     the shift is significant (p < alpha) and its median is at least min_effect slower.
+#     The error rate (share of requests that did not succeed) gets a two-proportion z-test,
+#     flagged when significant and at least min_error_delta (absolute) higher
+#   - trend: weekly p50/p95/p99 and success rate per region
+#
+# Usage:
+#   python LatencyResultStore.py compare --store latency_results --baseline-days 7
+#   python LatencyResultStore.py trend --store latency_results --weeks 8
+#   python LatencyResultStore.py import-json latency_test_results.json --store latency_results
+#
+# Needs: pip install pyarrow pandas numpy
+
+import argparse
+import json
+import math
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from LatencyStats import status_class
+
+# One row per request
+RESULT_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("region", pa.string()),
+    ("deployment", pa.string()),
+    ("connection_mode", pa.string()),
+    ("prompt_length", pa.int32()),
+    ("prompt_tokens", pa.int32()),
+    ("completion_tokens", pa.int32()),
+    ("ttft", pa.float64()),
+    ("latency", pa.float64()),
+    ("status", pa.string()),        # "success" or the outcome class (throttled, timeout, ...)
+    ("status_code", pa.int16()),
+    ("attempts", pa.int16()),
+])
+
+# Metrics compared between runs
+COMPARE_METRICS = ("latency", "ttft")
+
+# started (a UTC datetime, default now) picks the run's date= partition; pass it, and a
+# timestamp per add_result, when storing a run recorded earlier
+class ResultWriter:
+    def __init__(self, store_dir="latency_results", run_id=None, batch_size=1000, started=None):
+        started = started or datetime.now(timezone.utc)
+        self.run_id = run_id or started.strftime("%Y%m%dT%H%M%SZ-") + uuid.uuid4().hex[:6]
+        self.batch_size = batch_size
+        partition = os.path.join(store_dir, f"date={started.astimezone(timezone.utc):%Y-%m-%d}")
+        os.makedirs(partition, exist_ok=True)
+        self.path = os.path.join(partition, f"run-{self.run_id}.parquet")
+        self._rows = {name: [] for name in RESULT_SCHEMA.names}
+        self._writer = None
+        self.rows_written = 0
+        self._lock = threading.Lock()
+
+    # Record one result dict as produced by test_latency / send_request; safe from any thread
+    def add_result(self, result, timestamp=None):
+        row = {
+            "run_id": self.run_id,
+            "timestamp": timestamp or datetime.now(timezone.utc),
+            "region": result["region"],
+            "deployment": result.get("deployment"),
+            "connection_mode": result.get("connection_mode"),
+            "prompt_length": result.get("prompt_length"),
+            "prompt_tokens": result.get("prompt_tokens"),
+            "completion_tokens": result.get("completion_tokens"),
+            "ttft": result.get("ttft"),
+            "latency": result.get("latency"),
+            "status": status_class(result),
+            "status_code": result.get("status_code"),
+            "attempts": result.get("attempts"),
+        }
+        with self._lock:
+            for name, value in row.items():
+                self._rows[name].append(value)
+            if len(self._rows["run_id"]) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._rows["run_id"]:
+            return
+        table = pa.Table.from_pydict(self._rows, schema=RESULT_SCHEMA)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, RESULT_SCHEMA, compression="zstd")
+        self._writer.write_table(table)
+        self.rows_written += table.num_rows
+        self._rows = {name: [] for name in RESULT_SCHEMA.names}
+
+    # Flush the remaining rows and finalize the file (it is unreadable until closed)
+    def close(self):
+        with self._lock:
+            self._flush()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        print(f"{self.rows_written} results stored in '{self.path}' (run {self.run_id})")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Function to load stored results as a DataFrame, reading only the partitions since
+# `since` (a datetime) and only the requested columns
+def load_results(store_dir="latency_results", since=None, columns=None):
+    dataset = ds.dataset(store_dir, format="parquet", partitioning="hive", schema=RESULT_SCHEMA)
+    expression = None
+    if since is not None:
+        expression = ds.field("timestamp") >= pa.scalar(since, type=pa.timestamp("ms", tz="UTC"))
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+# Function to summarize every (run, region) in one vectorized pass
+def summarize_runs(df):
+    grouped = df.groupby(["run_id", "region"], sort=False)
+    summary = pd.DataFrame({
+        "started": grouped["timestamp"].min(),
+        "requests": grouped.size(),
+        "success_rate": grouped["status"].agg(lambda s: (s == "success").mean()),
+    })
+    successes = df[df["status"] == "success"].groupby(["run_id", "region"], sort=False)
+    for metric in COMPARE_METRICS:
+        quantiles = successes[metric].quantile([0.5, 0.95, 0.99]).unstack()
+        quantiles.columns = [f"{metric}_p{int(q * 100)}" for q in quantiles.columns]
+        summary = summary.join(quantiles)
+    return summary.sort_values("started")
+
+# Function for a two-sided Mann-Whitney U test (normal approximation with tie
+# correction), vectorized over the ranks. Returns (U, p_value); fine for the sample
+# sizes a benchmark run produces (tens of values and up).
+def mann_whitney_u(x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n1, n2 = len(x), len(y)
+    if n1 == 0 or n2 == 0:
+        return None, None
+    ranks = pd.Series(np.concatenate([x, y])).rank(method="average").to_numpy()
+    u1 = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    _, tie_counts = np.unique(ranks, return_counts=True)
+    tie_term = (tie_counts ** 3 - tie_counts).sum() / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return u1, 1.0
+    z = (u1 - n1 * n2 / 2) / sigma
+    return u1, math.erfc(abs(z) / math.sqrt(2))
+
+# Function for a two-sided two-proportion z-test (pooled). Returns (z, p_value)
+def two_proportion_z(count1, n1, count2, n2):
+    if n1 == 0 or n2 == 0:
+        return None, None
+    pooled = (count1 + count2) / (n1 + n2)
+    sigma = math.sqrt(pooled * (1 - pooled) * (1 / n1 + 1 / n2))
+    if sigma == 0:
+        return 0.0, 1.0
+    z = (count1 / n1 - count2 / n2) / sigma
+    return z, math.erfc(abs(z) / math.sqrt(2))
+
+# Compare the latest run (or current_run) against every run of the baseline_days before
+# it. Returns one row per (region, metric) with medians, shift, p-value and the verdict;
+# the "error_rate" row carries the two rates instead, and its shift is their difference.
+def compare_runs(df, current_run=None, baseline_days=7, alpha=0.01, min_effect=0.05, min_error_delta=0.01):
+    started = df.groupby("run_id")["timestamp"].min().sort_values()
+    if started.empty:
+        raise ValueError("no runs in the store")
+    current_run = current_run or started.index[-1]
+    current_start = started[current_run]
+    baseline_runs = started[(started < current_start) &
+                            (started >= current_start - timedelta(days=baseline_days))].index
+    current_all = df[df["run_id"] == current_run]
+    baseline_all = df[df["run_id"].isin(baseline_runs)]
+    successes = df[df["status"] == "success"]
+    current = successes[successes["run_id"] == current_run]
+    baseline = successes[successes["run_id"].isin(baseline_runs)]
+
+    rows = []
+    for region in sorted(current_all["region"].unique()):
+        now_failed = current_all.loc[current_all["region"] == region, "status"] != "success"
+        base_failed = baseline_all.loc[baseline_all["region"] == region, "status"] != "success"
+        if len(base_failed):
+            now_rate, base_rate = now_failed.mean(), base_failed.mean()
+            _, p_value = two_proportion_z(now_failed.sum(), len(now_failed), base_failed.sum(), len(base_failed))
+            shift = now_rate - base_rate
+            significant = p_value < alpha and abs(shift) >= min_error_delta
+            rows.append({
+                "region": region,
+                "metric": "error_rate",
+                "baseline_runs": len(baseline_runs),
+                "baseline_n": len(base_failed),
+                "current_n": len(now_failed),
+                "baseline_rate": base_rate,
+                "current_rate": now_rate,
+                "shift": shift,
+                "p_value": p_value,
+                "verdict": ("regression" if shift > 0 else "improvement") if significant else "no change",
+            })
+        for metric in COMPARE_METRICS:
+            now_values = current.loc[current["region"] == region, metric].dropna().to_numpy()
+            base_values = baseline.loc[baseline["region"] == region, metric].dropna().to_numpy()
+            if len(now_values) == 0 or len(base_values) == 0:
+                continue
+            _, p_value = mann_whitney_u(now_values, base_values)
+            now_median, base_median = np.median(now_values), np.median(base_values)
+            shift = now_median / base_median - 1 if base_median else float("nan")
+            significant = p_value < alpha and abs(shift) >= min_effect
+            rows.append({
+                "region": region,
+                "metric": metric,
+                "baseline_runs": len(baseline_runs),
+                "baseline_n": len(base_values),
+                "current_n": len(now_values),
+                "baseline_p50": base_median,
+                "current_p50": now_median,
+                "baseline_p95": np.percentile(base_values, 95),
+                "current_p95": np.percentile(now_values, 95),
+                "shift": shift,
+                "p_value": p_value,
+                "verdict": ("regression" if shift > 0 else "improvement") if significant else "no change",
+            })
+    return current_run, pd.DataFrame(rows)
+
+# Function to compute weekly latency percentiles and success rate per region
+def weekly_trend(df):
+    df = df.assign(week=df["timestamp"].dt.tz_localize(None).dt.to_period("W").dt.start_time)
+    grouped = df.groupby(["region", "week"])
+    trend = pd.DataFrame({
+        "runs": grouped["run_id"].nunique(),
+        "requests": grouped.size(),
+        "success_rate": grouped["status"].agg(lambda s: (s == "success").mean()),
+    })
+    quantiles = df[df["status"] == "success"].groupby(["region", "week"])["latency"].quantile([0.5, 0.95, 0.99]).unstack()
+    quantiles.columns = [f"p{int(q * 100)}" for q in quantiles.columns]
+    return trend.join(quantiles)
+
+# Print the comparison; returns True when any region regressed
+def print_comparison(current_run, comparison):
+    print(f"\n===== RUN {current_run} VS. BASELINE =====")
+    if comparison.empty:
+        print("No baseline runs with matching regions to compare against.")
+        return False
+    for _, row in comparison.iterrows():
+        flag = "  <-- REGRESSION" if row["verdict"] == "regression" else ""
+        if row["metric"] == "error_rate":
+            print(f"  {row['region']:<16} {'errors':<8} {row['baseline_rate']*100:.2f}% -> {row['current_rate']*100:.2f}% "
+                  f"({row['shift']*100:+.2f} pts, {row['baseline_n']} -> {row['current_n']} requests), "
+                  f"p={row['p_value']:.2g} [{row['verdict']}]{flag}")
+            continue
+        print(f"  {row['region']:<16} {row['metric']:<8} p50 {row['baseline_p50']:.4f}s -> {row['current_p50']:.4f}s "
+              f"({row['shift']*100:+.1f}%), p95 {row['baseline_p95']:.4f}s -> {row['current_p95']:.4f}s, "
+              f"p={row['p_value']:.2g} [{row['verdict']}]{flag}")
+    return bool((comparison["verdict"] == "regression").any())
+
+# Function to parse a date or ISO datetime; naive values are taken as local time, like
+# the test_time that AzureOpenAILatencyTest writes
+def parse_time(text):
+    return datetime.fromisoformat(text).astimezone(timezone.utc)
+
+# Function to import the raw_data of an old latency_test_results.json as one run. The rows
+# are stamped with `when` (a UTC datetime), else the file's test_time, else its mtime, so an
+# old run is filed under its own date instead of becoming the latest one.
+def import_json(path, store_dir="latency_results", when=None):
+    with open(path) as f:
+        data = json.load(f)
+    if when is None:
+        if data.get("test_time"):
+            when = parse_time(data["test_time"])
+        else:
+            when = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+    run_id = "imported-" + os.path.splitext(os.path.basename(path))[0]
+    with ResultWriter(store_dir, run_id=run_id, started=when) as writer:
+        for result in data.get("raw_data", []):
+            writer.add_result(result, timestamp=when)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stored latency results: compare runs and show trends")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    compare = sub.add_parser("compare", help="latest run vs. the previous days, flagging significant regressions")
+    compare.add_argument("--store", default="latency_results")
+    compare.add_argument("--run", default=None, help="run id to check (default: latest)")
+    compare.add_argument("--baseline-days", type=int, default=7)
+    compare.add_argument("--alpha", type=float, default=0.01)
+    compare.add_argument("--min-effect", type=float, default=0.05, help="smallest median shift worth flagging")
+    compare.add_argument("--min-error-delta", type=float, default=0.01,
+                         help="smallest error rate increase (absolute, 0.01 = 1 point) worth flagging")
+
+    trend = sub.add_parser("trend", help="weekly percentiles per region")
+    trend.add_argument("--store", default="latency_results")
+    trend.add_argument("--weeks", type=int, default=8)
+
+    importer = sub.add_parser("import-json", help="convert an old latency_test_results.json into a stored run")
+    importer.add_argument("path")
+    importer.add_argument("--store", default="latency_results")
+    importer.add_argument("--date", type=parse_time, default=None,
+                          help="when the run was recorded, e.g. 2025-01-31 (default: the file's test_time, else its mtime)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        # Read only what the comparison window needs (+1 day so the latest run's own day is covered)
+        since = datetime.now(timezone.utc) - timedelta(days=args.baseline_days + 1) if args.run is None else None
+        results = load_results(args.store, since, ["run_id", "timestamp", "region", "status", "latency", "ttft"])
+        current_run, comparison = compare_runs(results, args.run, args.baseline_days, args.alpha, args.min_effect,
+                                                 args.min_error_delta)
+        print(summarize_runs(results).tail(3 * max(results["region"].nunique(), 1)).to_string())
+        regressed = print_comparison(current_run, comparison)
+        # Non-zero exit so a scheduled job can alert on it
+        raise SystemExit(1 if regressed else 0)
+    elif args.command == "trend":
+        since = datetime.now(timezone.utc) - timedelta(weeks=args.weeks)
+        results = load_results(args.store, since, ["run_id", "timestamp", "region", "status", "latency"])
+        print(weekly_trend(results).to_string(float_format=lambda v: f"{v:.4f}"))
+    else:
+        import_json(args.path, args.store, args.date)
@@ -0,0 +1,317 @@
+# Streaming, constant-memory latency statistics for the benchmarks
+#
+# LatencyHistogram is a log-bucketed histogram (the DDSketch layout): every value lands in
+# bucket ceil(log_gamma(value)), so any reported quantile is within RELATIVE_ACCURACY of
+# the true value no matter how many samples were recorded. 1µs..1h needs ~1100 buckets at
+# 1% accuracy, and two histograms merge by adding bucket counts, which is what lets thread
+# pools, worker processes and separate hosts each aggregate locally and combine at the end.
+#
+# LatencyAggregator keeps one histogram per (metric, region, prompt_length, status) key and
+# is fed one result dict at a time as futures complete, plus a timeline of per-interval
+# latency histograms for plotting latency over the run.
+#
+# Reporting converts a histogram into NumPy arrays once (to_arrays) and answers every
+# percentile / CDF query from those with cumsum + searchsorted, so report cost depends on
+# the number of buckets, not on the number of samples.
+
+import math
+import threading
+import time
+
+import numpy as np
+
+RELATIVE_ACCURACY = 0.01
+
+# Percentiles reported by summaries
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+class LatencyHistogram:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value, count=1):
+        if value < 0:
+            raise ValueError(f"cannot record negative value {value}")
+        if value == 0:
+            self.zero_count += count
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.total_squares += value * value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("cannot merge histograms with different relative accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    # Value at quantile q (0..1), None when empty. Exact at the extremes, within
+    # relative_accuracy elsewhere.
+    def quantile(self, q):
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def percentile(self, p):
+        return self.quantile(p / 100)
+
+    # (values, counts) as sorted NumPy arrays: one entry per non-empty bucket, the bucket's
+    # representative value clamped to [min, max], and the zero bucket first when present
+    def to_arrays(self):
+        indexes = np.fromiter(sorted(self.buckets), dtype=np.int64, count=len(self.buckets))
+        counts = np.fromiter((self.buckets[i] for i in indexes.tolist()), dtype=np.int64, count=len(indexes))
+        values = 2 * self.gamma ** indexes.astype(float) / (self.gamma + 1)
+        if len(values):
+            values = np.clip(values, self.min, self.max)
+        if self.zero_count:
+            values = np.concatenate(([0.0], values))
+            counts = np.concatenate(([self.zero_count], counts))
+        return values, counts
+
+    # Vectorized quantile for many q at once; same results as quantile(q) for each
+    def quantiles(self, qs, arrays=None):
+        qs = np.asarray(qs, dtype=float)
+        if self.count == 0:
+            return np.full(qs.shape, np.nan)
+        values, counts = arrays if arrays is not None else self.to_arrays()
+        positions = np.searchsorted(np.cumsum(counts), qs * (self.count - 1), side="right")
+        result = values[np.minimum(positions, len(values) - 1)]
+        result = np.where(qs <= 0, self.min, result)
+        return np.where(qs >= 1, self.max, result)
+
+    # Empirical CDF as (values, cumulative fraction) arrays, ready for a step plot
+    def cdf(self):
+        values, counts = self.to_arrays()
+        return values, np.cumsum(counts) / max(self.count, 1)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def stdev(self):
+        if self.count < 2:
+            return 0
+        variance = (self.total_squares - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0))
+
+    # Same keys as the list-based statistics analyze_results used to print, plus p50..p99.9
+    def summary(self):
+        if self.count == 0:
+            return None
+        percentiles = self.quantiles([p / 100 for p in PERCENTILES])
+        stats = {
+            "min": self.min,
+            "max": self.max,
+            "avg": self.mean,
+            "median": self.quantile(0.5),
+            "std_dev": self.stdev,
+            "sample_size": self.count,
+        }
+        for p, value in zip(PERCENTILES, percentiles.tolist()):
+            stats[f"p{p:g}"] = value
+        return stats
+
+    # Compact JSON-serialisable snapshot, for shipping between processes
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "buckets": [[index, count] for index, count in sorted(self.buckets.items())],
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+            "total_squares": self.total_squares,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["relative_accuracy"])
+        histogram.buckets = {index: count for index, count in data["buckets"]}
+        histogram.zero_count = data["zero_count"]
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.total_squares = data["total_squares"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+# Metrics taken from a result dict. inter_token_gaps is a list per request; the others
+# are single values (None when not measured).
+RESULT_METRICS = ("latency", "dns_time", "connect_time", "tls_time", "ttft", "inter_token_gaps", "tokens_per_sec",
+                  "prompt_tokens", "completion_tokens", "attempts", "retry_wait", "throttle_wait",
+                  "first_attempt_latency")
+
+# Function to reduce a result's status to a bounded key: "success" or its outcome class
+# ("error: <message>" would give every distinct exception text its own histogram)
+def status_class(result):
+    if result.get("status", "success") == "success":
+        return "success"
+    return result.get("error_type") or "error"
+
+# Fields of the histogram key, in order, for histograms_by
+KEY_FIELDS = ("metric", "region", "prompt_length", "status")
+
+class LatencyAggregator:
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, timeline_interval=10):
+        self.relative_accuracy = relative_accuracy
+        # (metric, region, prompt_length, status) -> LatencyHistogram
+        self.histograms = {}
+        # (region, status) -> request count, including failures that have no latency
+        self.counts = {}
+        # (interval start as epoch seconds, region) -> [success latency histogram, failures].
+        # Wall-clock intervals line up across worker processes and hosts, so timelines merge.
+        self.timeline_interval = timeline_interval
+        self.timeline = {}
+        self._lock = threading.Lock()
+
+    # Record one result dict as produced by test_latency; safe to call from any thread
+    def add_result(self, result):
+        region = result["region"]
+        prompt_length = result.get("prompt_length")
+        status = status_class(result)
+        interval = int(time.time() // self.timeline_interval) * self.timeline_interval
+        with self._lock:
+            self.counts[(region, status)] = self.counts.get((region, status), 0) + 1
+            slot = self.timeline.get((interval, region))
+            if slot is None:
+                slot = self.timeline[(interval, region)] = [LatencyHistogram(self.relative_accuracy), 0]
+            if status == "success" and result.get("latency") is not None:
+                slot[0].record(result["latency"])
+            else:
+                slot[1] += 1
+            for metric in RESULT_METRICS:
+                value = result.get(metric)
+                if value is None or (metric == "inter_token_gaps" and not value):
+                    continue
+                key = (metric, region, prompt_length, status)
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    histogram = self.histograms[key] = LatencyHistogram(self.relative_accuracy)
+                if metric == "inter_token_gaps":
+                    for gap in value:
+                        histogram.record(gap)
+                else:
+                    histogram.record(value)
+
+    def merge(self, other):
+        with self._lock:
+            for key, histogram in other.histograms.items():
+                if key in self.histograms:
+                    self.histograms[key].merge(histogram)
+                else:
+                    self.histograms[key] = LatencyHistogram(histogram.relative_accuracy).merge(histogram)
+            for key, count in other.counts.items():
+                self.counts[key] = self.counts.get(key, 0) + count
+            for key, (histogram, failures) in other.timeline.items():
+                slot = self.timeline.get(key)
+                if slot is None:
+                    slot = self.timeline[key] = [LatencyHistogram(histogram.relative_accuracy), 0]
+                slot[0].merge(histogram)
+                slot[1] += failures
+        return self
+
+    # Merged histogram over every key matching the given filters (None matches anything)
+    def histogram(self, metric="latency", region=None, prompt_length=None, status="success"):
+        merged = LatencyHistogram(self.relative_accuracy)
+        with self._lock:
+            for (m, r, p, s), histogram in self.histograms.items():
+                if m == metric and region in (None, r) and prompt_length in (None, p) and status in (None, s):
+                    merged.merge(histogram)
+        return merged
+
+    # Merged histograms for every group of the given key fields in one pass over the keys,
+    # e.g. histograms_by("latency", ("region", "prompt_length")) -> {(region, length): histogram}
+    def histograms_by(self, metric="latency", by=("region",), status="success"):
+        positions = [KEY_FIELDS.index(field) for field in by]
+        groups = {}
+        with self._lock:
+            for key, histogram in self.histograms.items():
+                if key[0] != metric or status not in (None, key[3]):
+                    continue
+                group = tuple(key[i] for i in positions)
+                merged = groups.get(group)
+                if merged is None:
+                    merged = groups[group] = LatencyHistogram(self.relative_accuracy)
+                merged.merge(histogram)
+        return groups
+
+    # Per-interval latency percentiles and failure rate for one region, as NumPy arrays:
+    # (interval start epoch seconds, percentiles with one column per entry of qs, failure rate)
+    def timeline_arrays(self, region, qs=(0.5, 0.95, 0.99)):
+        with self._lock:
+            slots = sorted((interval, histogram, failures)
+                           for (interval, r), (histogram, failures) in self.timeline.items() if r == region)
+        times = np.array([interval for interval, _, _ in slots], dtype=float)
+        percentiles = np.array([histogram.quantiles(qs) for _, histogram, _ in slots]).reshape(len(slots), len(qs))
+        totals = np.array([histogram.count + failures for _, histogram, failures in slots], dtype=float)
+        failures = np.array([failures for _, _, failures in slots], dtype=float)
+        return times, percentiles, np.divide(failures, totals, out=np.zeros_like(totals), where=totals > 0)
+
+    def regions(self):
+        with self._lock:
+            return sorted({region for region, _ in self.counts})
+
+    def prompt_lengths(self, metric="latency"):
+        with self._lock:
+            return sorted({p for m, _, p, _ in self.histograms if m == metric and p is not None})
+
+    def request_count(self, region=None, status=None):
+        with self._lock:
+            return sum(count for (r, s), count in self.counts.items()
+                       if region in (None, r) and status in (None, s))
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "relative_accuracy": self.relative_accuracy,
+                "histograms": [[list(key), histogram.to_dict()] for key, histogram in self.histograms.items()],
+                "counts": [[list(key), count] for key, count in self.counts.items()],
+                "timeline_interval": self.timeline_interval,
+                "timeline": [[list(key), histogram.to_dict(), failures]
+                             for key, (histogram, failures) in self.timeline.items()],
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregator = cls(data["relative_accuracy"], data.get("timeline_interval", 10))
+        aggregator.histograms = {tuple(key): LatencyHistogram.from_dict(h) for key, h in data["histograms"]}
+        aggregator.counts = {tuple(key): count for key, count in data["counts"]}
+        aggregator.timeline = {tuple(key): [LatencyHistogram.from_dict(h), failures]
+                               for key, h, failures in data.get("timeline", [])}
+        return aggregator
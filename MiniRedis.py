@@ -0,0 +1,164 @@
+# Minimal Redis-compatible server for exercising TokenRateLimiter's Redis backend offline
+#
+# Speaks RESP2 over TCP and implements only the commands the limiter (and a quick redis-cli
+# check) needs: PING, GET, SET [EX], MGET, INCR, INCRBY, DECRBY, EXPIRE, TTL, DEL, DBSIZE,
+# FLUSHALL. Keys expire lazily on access plus a background sweep of 200 keys every 100ms,
+# like Redis. Single process, in memory, no persistence: a stand-in, not a cache to deploy.
+#
+# Usage:
+#   python MiniRedis.py --port 6399
+#   then point the gateway's rate_limiting.backend at "redis://127.0.0.1:6399"
+
+import argparse
+import asyncio
+import itertools
+import threading
+import time
+
+class MiniRedis:
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.commands = 0
+
+    def _live(self, key, now):
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= now:
+            del self.expires[key]
+            self.data.pop(key, None)
+            return False
+        return key in self.data
+
+    # Function to check the next `sample` keys with a TTL; live ones go to the back of the
+    # queue, so repeated sweeps cycle through every key
+    def sweep(self, sample=200):
+        now = time.monotonic()
+        for key in list(itertools.islice(self.expires, sample)):
+            deadline = self.expires.pop(key)
+            if deadline <= now:
+                self.data.pop(key, None)
+            else:
+                self.expires[key] = deadline
+
+    def _incr(self, key, amount, now):
+        value = int(self.data[key]) + amount if self._live(key, now) else amount
+        self.data[key] = str(value).encode()
+        return value
+
+    # Function to run one command; returns the reply value (Exception = error reply)
+    def execute(self, args):
+        self.commands += 1
+        now = time.monotonic()
+        name = args[0].upper()
+        try:
+            if name == b"PING":
+                return args[1] if len(args) > 1 else "PONG"
+            if name == b"GET":
+                return self.data[args[1]] if self._live(args[1], now) else None
+            if name == b"SET":
+                self.data[args[1]] = args[2]
+                self.expires.pop(args[1], None)
+                if len(args) >= 5 and args[3].upper() == b"EX":
+                    self.expires[args[1]] = now + int(args[4])
+                return "OK"
+            if name == b"MGET":
+                return [self.data[key] if self._live(key, now) else None for key in args[1:]]
+            if name == b"INCR":
+                return self._incr(args[1], 1, now)
+            if name == b"INCRBY":
+                return self._incr(args[1], int(args[2]), now)
+            if name == b"DECRBY":
+                return self._incr(args[1], -int(args[2]), now)
+            if name == b"EXPIRE":
+                if not self._live(args[1], now):
+                    return 0
+                self.expires[args[1]] = now + int(args[2])
+                return 1
+            if name == b"TTL":
+                if not self._live(args[1], now):
+                    return -2
+                deadline = self.expires.get(args[1])
+                return -1 if deadline is None else int(deadline - now)
+            if name == b"DEL":
+                removed = 0
+                for key in args[1:]:
+                    if self._live(key, now):
+                        removed += 1
+                    self.data.pop(key, None)
+                    self.expires.pop(key, None)
+                return removed
+            if name == b"DBSIZE":
+                return len(self.data)
+            if name == b"FLUSHALL":
+                self.data.clear()
+                self.expires.clear()
+                return "OK"
+        except (IndexError, ValueError):
+            return ValueError(f"ERR wrong arguments for '{name.decode().lower()}' command")
+        return ValueError(f"ERR unknown command '{name.decode(errors='replace')}'")
+
+def encode_reply(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, Exception):
+        return b"-" + str(value).encode() + b"\r\n"
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, int):
+        return b":" + str(value).encode() + b"\r\n"
+    if isinstance(value, list):
+        return b"*" + str(len(value)).encode() + b"\r\n" + b"".join(encode_reply(v) for v in value)
+    return b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n"
+
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # Inline command (e.g. typed into telnet)
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+async def handle_client(store, reader, writer):
+    try:
+        while True:
+            args = await read_command(reader)
+            if args is None:
+                break
+            if not args:
+                continue
+            writer.write(encode_reply(store.execute(args)))
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve(host="127.0.0.1", port=6399, ready=None):
+    store = MiniRedis()
+    server = await asyncio.start_server(lambda r, w: handle_client(store, r, w), host, port, backlog=1024)
+    if ready is not None:
+        ready.set()
+    async with server:
+        while True:
+            await asyncio.sleep(0.1)
+            store.sweep()
+
+# Function to run the server on a daemon thread (for scripts and benchmarks); returns its URL
+def start_in_thread(host="127.0.0.1", port=6399):
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(serve(host, port, ready)), name="mini-redis", daemon=True).start()
+    ready.wait()
+    return f"redis://{host}:{port}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal Redis-compatible server (RESP2)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    args = parser.parse_args()
+    print(f"MiniRedis on redis://{args.host}:{args.port}")
+    asyncio.run(serve(args.host, args.port))
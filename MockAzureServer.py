@@ -0,0 +1,489 @@
+# Offline stand-in for the Azure endpoints the benchmarks call
+#
+# Serves, per simulated "region" (the first path segment):
+#   - Azure OpenAI chat completions, streaming (SSE) and not:
+#       POST /<region>/openai/deployments/<deployment>/chat/completions
+#   - Databricks model serving (OpenAI-compatible, as used by CallAzureDatabricksClaudeLLM):
+#       POST /<region>/serving-endpoints/chat/completions
+#       POST /<region>/serving-endpoints/<endpoint>/invocations
+#   - Anthropic Messages API, streaming (typed SSE events) and not:
+#       POST /<region>/v1/messages
+#   - Azure AI Agents assistants/threads/messages/runs, as used by AzureAgent:
+#       /<region>/api/projects/<project>/{assistants,assistants/<id>,threads,threads/<id>/messages,threads/<id>/runs,...}
+#   - GET /_mock/stats: per-region request, throttle, error and in-flight counters
+#
+# Every region has a profile of latency distributions (TTFT, non-streaming latency, agent
+# run time), a token rate and a completion length, plus 429 injection (a fixed rate and/or
+# a concurrency cap, both answered with retry-after-ms) and random 5xx failures. A
+# distribution is a number (constant) or a dict:
+#   {"dist": "constant", "value": v}          {"dist": "uniform", "low": a, "high": b}
+#   {"dist": "normal", "mean": m, "sd": s}    {"dist": "lognormal", "median": m, "sigma": s}
+#   {"dist": "exponential", "mean": m}        {"dist": "cycle", "values": [v1, v2, ...]}
+# "cycle" hands out its values in order, so a run of len(values) requests has exactly
+# that distribution; point the stats engine at it to check reported percentiles.
+#
+# Usage:
+#   python MockAzureServer.py --port 8800 [--config profiles.json] [--seed 1]
+#   then set each region's endpoint in AzureOpenAILatencyTest.regions to the printed URL,
+#   e.g. "http://127.0.0.1:8800/eastus/". Zero-latency profiles measure the harness's
+#   own maximum throughput.
+#
+# Speech-to-text is not simulated: the Speech SDK talks a proprietary websocket protocol.
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+# Profile fields; each region's config is merged over these
+DEFAULT_PROFILE = {
+    "ttft": {"dist": "lognormal", "median": 0.35, "sigma": 0.3},  # seconds to first token
+    "latency": None,             # non-streaming total; None = ttft + completion_tokens / tokens_per_sec
+    "tokens_per_sec": 80.0,      # streaming token rate; 0 sends all tokens at once
+    "completion_tokens": 100,    # tokens generated, capped by the request's max_tokens
+    "throttle_rate": 0.0,        # share of requests answered 429
+    "max_concurrency": None,     # requests in flight beyond this are answered 429
+    "retry_after_ms": 1000,      # sent with every 429
+    "error_rate": 0.0,           # share of requests answered error_status
+    "error_status": 500,
+    "run_seconds": {"dist": "lognormal", "median": 20.0, "sigma": 0.5},  # agent run duration
+    "queue_seconds": 1.0,        # agent run time spent "queued" before "in_progress"
+}
+
+# Default simulated regions, one per entry in AzureOpenAILatencyTest.regions
+mock_regions = {
+    "eastus": {"ttft": {"dist": "lognormal", "median": 0.30, "sigma": 0.25}},
+    "westus": {"ttft": {"dist": "lognormal", "median": 0.40, "sigma": 0.30}},
+    "japaneast": {"ttft": {"dist": "lognormal", "median": 0.55, "sigma": 0.35}, "throttle_rate": 0.02},
+}
+
+FILLER_WORDS = "the model is simulating a reply so the client has tokens to time".split()
+
+# Placeholders for the ARM path of agent connection IDs
+MOCK_SUBSCRIPTION = "00000000-0000-0000-0000-000000000000"
+MOCK_RESOURCE_GROUP = "mock-rg"
+
+# Function to build a sampler (a no-argument callable) for one distribution spec
+def make_sampler(spec, rng):
+    if spec is None:
+        return None
+    if isinstance(spec, (int, float)):
+        return lambda: float(spec)
+    kind = spec.get("dist", "constant")
+    if kind == "constant":
+        return lambda: float(spec["value"])
+    if kind == "uniform":
+        return lambda: rng.uniform(spec["low"], spec["high"])
+    if kind == "normal":
+        return lambda: max(rng.gauss(spec["mean"], spec["sd"]), 0.0)
+    if kind == "lognormal":
+        mu = math.log(spec["median"])
+        return lambda: rng.lognormvariate(mu, spec["sigma"])
+    if kind == "exponential":
+        return lambda: rng.expovariate(1.0 / spec["mean"])
+    if kind == "cycle":
+        values = itertools.cycle([float(v) for v in spec["values"]])
+        return lambda: next(values)
+    raise ValueError(f"unknown distribution {kind!r}")
+
+def _new_id(prefix):
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+# Function to estimate prompt tokens the way the benchmark's fallback does (~4 chars/token)
+def _prompt_tokens(messages):
+    text = "".join(m.get("content") if isinstance(m.get("content"), str) else json.dumps(m.get("content"))
+                   for m in messages or [])
+    return max(1, len(text) // 4)
+
+class MockRegion:
+    def __init__(self, name, profile, seed=None):
+        self.name = name
+        self.profile = dict(DEFAULT_PROFILE, **profile)
+        self.rng = random.Random(f"{seed}:{name}") if seed is not None else random.Random()
+        self.samplers = {field: make_sampler(self.profile[field], self.rng)
+                         for field in ("ttft", "latency", "run_seconds", "queue_seconds")}
+        self.stats = {"requests": 0, "throttled": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+        # Agents state
+        self.assistants = {}
+        self.threads = {}   # thread id -> list of messages, oldest first
+        self.runs = {}      # run id -> run dict (plus private "_ends_at"/"_starts_at")
+
+    def sample(self, field):
+        sampler = self.samplers[field]
+        return sampler() if sampler is not None else None
+
+    # Function to decide whether this request is throttled or failed; returns an error
+    # response, or None to serve it normally. Called with the request already in flight.
+    def inject_failure(self):
+        profile = self.profile
+        cap = profile["max_concurrency"]
+        if (cap is not None and self.stats["in_flight"] > cap) or self.rng.random() < profile["throttle_rate"]:
+            self.stats["throttled"] += 1
+            retry_after_ms = profile["retry_after_ms"]
+            return web.json_response(
+                {"error": {"code": "429", "message": "Rate limit is exceeded. Try again later."}},
+                status=429,
+                headers={"retry-after-ms": str(retry_after_ms), "retry-after": str(math.ceil(retry_after_ms / 1000))},
+            )
+        if self.rng.random() < profile["error_rate"]:
+            self.stats["errors"] += 1
+            return web.json_response({"error": {"code": "InternalServerError", "message": "Injected failure"}},
+                                     status=profile["error_status"])
+        return None
+
+# ----- chat completions (Azure OpenAI, Databricks serving and Anthropic messages) -----
+
+def _completion_text(tokens):
+    return " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(tokens))
+
+async def chat_completions(request):
+    region = request["region"]
+    body = await request.json()
+    model = request.match_info.get("deployment") or request.match_info.get("endpoint") or body.get("model", "mock")
+    prompt_tokens = _prompt_tokens(body.get("messages"))
+    completion_tokens = min(int(region.profile["completion_tokens"]), int(body.get("max_tokens") or 1 << 30))
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+             "total_tokens": prompt_tokens + completion_tokens}
+    completion_id = _new_id("chatcmpl")
+    created = int(time.time())
+    tokens_per_sec = region.profile["tokens_per_sec"]
+    ttft = region.sample("ttft")
+
+    if not body.get("stream"):
+        latency = region.sample("latency")
+        if latency is None:
+            latency = ttft + (completion_tokens / tokens_per_sec if tokens_per_sec else 0.0)
+        await asyncio.sleep(latency)
+        return web.json_response({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "length",
+                         "message": {"role": "assistant", "content": _completion_text(completion_tokens)}}],
+            "usage": usage,
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    def event(choices, **extra):
+        chunk = dict(id=completion_id, object="chat.completion.chunk", created=created, model=model,
+                     choices=choices, **extra)
+        return b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n"
+
+    await asyncio.sleep(ttft)
+    await response.write(event([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]))
+    # Tokens are paced against the clock, so per-write overhead does not slow the rate down
+    start = time.monotonic()
+    for i in range(completion_tokens):
+        if tokens_per_sec and i:
+            delay = start + i / tokens_per_sec - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        word = FILLER_WORDS[i % len(FILLER_WORDS)]
+        await response.write(event([{"index": 0, "delta": {"content": word if i == 0 else " " + word},
+                                     "finish_reason": None}]))
+    await response.write(event([{"index": 0, "delta": {}, "finish_reason": "length"}]))
+    if (body.get("stream_options") or {}).get("include_usage"):
+        await response.write(event([], usage=usage))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+async def anthropic_messages(request):
+    region = request["region"]
+    body = await request.json()
+    model = body.get("model", "mock")
+    messages = list(body.get("messages") or [])
+    if body.get("system"):
+        messages.insert(0, {"role": "system", "content": body["system"]})
+    input_tokens = _prompt_tokens(messages)
+    output_tokens = min(int(region.profile["completion_tokens"]), int(body.get("max_tokens") or 1 << 30))
+    message_id = _new_id("msg")
+    tokens_per_sec = region.profile["tokens_per_sec"]
+    ttft = region.sample("ttft")
+
+    if not body.get("stream"):
+        latency = region.sample("latency")
+        if latency is None:
+            latency = ttft + (output_tokens / tokens_per_sec if tokens_per_sec else 0.0)
+        await asyncio.sleep(latency)
+        return web.json_response({
+            "id": message_id, "type": "message", "role": "assistant", "model": model,
+            "content": [{"type": "text", "text": _completion_text(output_tokens)}],
+            "stop_reason": "max_tokens", "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+
+    def event(kind, **data):
+        return f"event: {kind}\ndata: {json.dumps(dict(type=kind, **data))}\n\n".encode("utf-8")
+
+    await asyncio.sleep(ttft)
+    await response.write(event("message_start", message={
+        "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+        "stop_reason": None, "usage": {"input_tokens": input_tokens, "output_tokens": 1}}))
+    await response.write(event("content_block_start", index=0, content_block={"type": "text", "text": ""}))
+    start = time.monotonic()
+    for i in range(output_tokens):
+        if tokens_per_sec and i:
+            delay = start + i / tokens_per_sec - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        word = FILLER_WORDS[i % len(FILLER_WORDS)]
+        await response.write(event("content_block_delta", index=0,
+                                   delta={"type": "text_delta", "text": word if i == 0 else " " + word}))
+    await response.write(event("content_block_stop", index=0))
+    await response.write(event("message_delta", delta={"stop_reason": "max_tokens", "stop_sequence": None},
+                               usage={"output_tokens": output_tokens}))
+    await response.write(event("message_stop"))
+    await response.write_eof()
+    return response
+
+# ----- Azure AI Agents -----
+
+def _message(thread_id, role, text, run_id=None, assistant_id=None):
+    return {
+        "id": _new_id("msg"),
+        "object": "thread.message",
+        "created_at": int(time.time()),
+        "thread_id": thread_id,
+        "role": role,
+        "content": [{"type": "text", "text": {"value": text, "annotations": []}}],
+        "assistant_id": assistant_id,
+        "run_id": run_id,
+        "attachments": [],
+        "metadata": {},
+    }
+
+# Function to advance a run to the status it should have by now; on completion the
+# agent's reply is appended to the thread exactly once
+def _refresh_run(region, run):
+    now = time.time()
+    if run["status"] == "queued" and now >= run["_starts_at"]:
+        run["status"] = "in_progress"
+        run["started_at"] = int(run["_starts_at"])
+    if run["status"] == "in_progress" and now >= run["_ends_at"]:
+        run["completed_at"] = int(run["_ends_at"])
+        if run["_fails"]:
+            run["status"] = "failed"
+            run["failed_at"] = run.pop("completed_at")
+            run["last_error"] = {"code": "server_error", "message": "Injected run failure"}
+        else:
+            run["status"] = "completed"
+            region.threads[run["thread_id"]].append(_message(
+                run["thread_id"], "assistant", _completion_text(int(region.profile["completion_tokens"])),
+                run_id=run["id"], assistant_id=run["assistant_id"]))
+    return {key: value for key, value in run.items() if not key.startswith("_")}
+
+def _thread_or_404(region, thread_id):
+    if thread_id not in region.threads:
+        raise web.HTTPNotFound(text=json.dumps({"error": {"code": "NotFound", "message": f"No thread {thread_id}"}}),
+                               content_type="application/json")
+    return region.threads[thread_id]
+
+async def create_assistant(request):
+    region = request["region"]
+    body = await request.json()
+    assistant = dict(body, id=_new_id("asst"), object="assistant", created_at=int(time.time()))
+    region.assistants[assistant["id"]] = assistant
+    return web.json_response(assistant)
+
+async def get_assistant(request):
+    region = request["region"]
+    assistant_id = request.match_info["assistant_id"]
+    if assistant_id not in region.assistants:
+        raise web.HTTPNotFound(text=json.dumps({"error": {"code": "NotFound", "message": f"No assistant {assistant_id}"}}),
+                               content_type="application/json")
+    return web.json_response(region.assistants[assistant_id])
+
+async def create_thread(request):
+    region = request["region"]
+    thread_id = _new_id("thread")
+    region.threads[thread_id] = []
+    return web.json_response({"id": thread_id, "object": "thread", "created_at": int(time.time()), "metadata": {}})
+
+async def create_message(request):
+    region = request["region"]
+    thread_id = request.match_info["thread_id"]
+    messages = _thread_or_404(region, thread_id)
+    body = await request.json()
+    content = body.get("content")
+    message = _message(thread_id, body.get("role", "user"), content if isinstance(content, str) else json.dumps(content))
+    messages.append(message)
+    return web.json_response(message)
+
+async def list_messages(request):
+    region = request["region"]
+    thread_id = request.match_info["thread_id"]
+    messages = _thread_or_404(region, thread_id)
+    # Refresh the thread's runs so polling messages alone also sees completed replies
+    for run in region.runs.values():
+        if run["thread_id"] == thread_id:
+            _refresh_run(region, run)
+    data = list(messages) if request.query.get("order") == "asc" else list(reversed(messages))
+    limit = int(request.query.get("limit", 20))
+    return web.json_response({
+        "object": "list",
+        "data": data[:limit],
+        "first_id": data[0]["id"] if data else None,
+        "last_id": data[:limit][-1]["id"] if data else None,
+        "has_more": len(data) > limit,
+    })
+
+async def create_run(request):
+    region = request["region"]
+    thread_id = request.match_info["thread_id"]
+    _thread_or_404(region, thread_id)
+    body = await request.json()
+    now = time.time()
+    starts_at = now + region.sample("queue_seconds")
+    run = {
+        "id": _new_id("run"),
+        "object": "thread.run",
+        "thread_id": thread_id,
+        "assistant_id": body.get("assistant_id"),
+        "status": "queued",
+        "created_at": int(now),
+        "started_at": None,
+        "completed_at": None,
+        "last_error": None,
+        "_starts_at": starts_at,
+        "_ends_at": starts_at + region.sample("run_seconds"),
+        "_fails": region.rng.random() < region.profile["error_rate"],
+    }
+    region.runs[run["id"]] = run
+    return web.json_response(_refresh_run(region, run))
+
+async def get_run(request):
+    region = request["region"]
+    run = region.runs.get(request.match_info["run_id"])
+    if run is None:
+        raise web.HTTPNotFound()
+    return web.json_response(_refresh_run(region, run))
+
+# Connection IDs have the ARM resource ID shape the Bing grounding tool expects; the
+# region stands in for the AI Services account
+async def get_connection(request):
+    name = request.match_info["name"]
+    connection_id = (f"/subscriptions/{MOCK_SUBSCRIPTION}/resourceGroups/{MOCK_RESOURCE_GROUP}"
+                     f"/providers/Microsoft.CognitiveServices/accounts/{request['region'].name}"
+                     f"/projects/{request.match_info['project']}/connections/{name}")
+    return web.json_response({"id": connection_id, "name": name, "type": "ApiKey"})
+
+# ----- server -----
+
+# Resolves the region, tracks in-flight counts and applies failure injection. Agent
+# reads (GET) are never throttled so polling loops see consistent state.
+@web.middleware
+async def region_middleware(request, handler):
+    if request.path.startswith("/_mock/"):
+        return await handler(request)
+    name = request.match_info.get("region")
+    region = request.app["regions"].get(name)
+    if region is None:
+        raise web.HTTPNotFound(text=f"unknown mock region {name!r}")
+    request["region"] = region
+    stats = region.stats
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    try:
+        if request.method == "POST":
+            failure = region.inject_failure()
+            if failure is not None:
+                return failure
+        return await handler(request)
+    finally:
+        stats["in_flight"] -= 1
+
+async def get_stats(request):
+    return web.json_response({name: region.stats for name, region in request.app["regions"].items()})
+
+# Function to build the aiohttp application for the given {region: profile} config
+def create_app(profiles=None, seed=None):
+    app = web.Application(middlewares=[region_middleware])
+    app["regions"] = {name: MockRegion(name, profile, seed) for name, profile in (profiles or mock_regions).items()}
+    agents = "/{region}/api/projects/{project}"
+    app.router.add_get("/_mock/stats", get_stats)
+    app.router.add_post("/{region}/openai/deployments/{deployment}/chat/completions", chat_completions)
+    app.router.add_post("/{region}/serving-endpoints/chat/completions", chat_completions)
+    app.router.add_post("/{region}/serving-endpoints/{endpoint}/invocations", chat_completions)
+    app.router.add_post("/{region}/v1/messages", anthropic_messages)
+    app.router.add_post(agents + "/assistants", create_assistant)
+    app.router.add_get(agents + "/assistants/{assistant_id}", get_assistant)
+    app.router.add_post(agents + "/threads", create_thread)
+    app.router.add_post(agents + "/threads/{thread_id}/messages", create_message)
+    app.router.add_get(agents + "/threads/{thread_id}/messages", list_messages)
+    app.router.add_post(agents + "/threads/{thread_id}/runs", create_run)
+    app.router.add_get(agents + "/threads/{thread_id}/runs/{run_id}", get_run)
+    app.router.add_get(agents + "/connections/{name}", get_connection)
+    return app
+
+# Function to build a regions dict (the AzureOpenAILatencyTest.regions shape) pointing at
+# a running mock server; provider is any ProviderAdapters provider ("openai" is served
+# under the region's serving-endpoints/ path)
+def regions_for(base_url, profiles=None, deployment="gpt-4o", provider="azure"):
+    base_url = base_url.rstrip("/")
+    suffix = "serving-endpoints/" if provider == "openai" else ""
+    regions = {name: {"endpoint": f"{base_url}/{name}/{suffix}", "api_key": "mock", "deployment": deployment}
+               for name in (profiles or mock_regions)}
+    if provider != "azure":
+        for config in regions.values():
+            config["provider"] = provider
+    return regions
+
+# Function to run the server on a daemon thread (for scripts and smoke tests); returns the
+# base URL once it is accepting connections, or raises what stopped it from starting (e.g.
+# the port is taken)
+def start_in_thread(profiles=None, host="127.0.0.1", port=8800, seed=None):
+    ready = threading.Event()
+    failure = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            runner = web.AppRunner(create_app(profiles, seed), access_log=None)
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, host, port, backlog=4096).start())
+        except BaseException as e:
+            failure.append(e)
+            ready.set()
+            loop.close()
+            return
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="mock-azure-server", daemon=True).start()
+    ready.wait()
+    if failure:
+        raise failure[0]
+    return f"http://{host}:{port}"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline mock of the Azure OpenAI / Databricks / Anthropic / Agents endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--config", help="JSON file of {region: profile}; replaces the built-in regions")
+    parser.add_argument("--seed", type=int, default=None, help="seed the samplers for reproducible runs")
+    args = parser.parse_args()
+
+    profiles = mock_regions
+    if args.config:
+        with open(args.config, encoding="utf-8") as f:
+            profiles = json.load(f)
+
+    print("Point the benchmark's regions at:")
+    print(json.dumps(regions_for(f"http://{args.host}:{args.port}", profiles), indent=4))
+    web.run_app(create_app(profiles, args.seed), host=args.host, port=args.port, access_log=None, backlog=4096)
@@ -0,0 +1,143 @@
+# Provider adapters: the request and response shapes of each LLM API, so the latency and
+# load benchmarks (AzureOpenAILatencyTest, AzureOpenAILoadTest) run unchanged against any backend
+#
+# A target in AzureOpenAILatencyTest.regions picks its adapter with "provider":
+#   "azure"       (default) Azure OpenAI:
+#                   POST {endpoint}openai/deployments/{deployment}/chat/completions?api-version=...
+#                   with an api-key header
+#   "databricks"  Databricks model serving, OpenAI-compatible (what CallAzureDatabricksClaudeLLM
+#                 does through the OpenAI SDK):
+#                   POST {endpoint}serving-endpoints/chat/completions, "model" = serving endpoint name,
+#                   Authorization: Bearer <personal access token>
+#   "openai"      any OpenAI-compatible base URL (api.openai.com/v1/, vLLM, LLMGateway's /v1/):
+#                   POST {endpoint}chat/completions, Authorization: Bearer
+#   "anthropic"   Anthropic Messages API (api.anthropic.com/, or an Azure AI Foundry .../anthropic/):
+#                   POST {endpoint}v1/messages, x-api-key + anthropic-version headers, system
+#                   prompt outside "messages", usage as input/output tokens, typed SSE events
+# "deployment" names the model for every provider: the Azure deployment, the Databricks
+# serving endpoint, or the model id. "api_version" overrides the Azure/Anthropic version.
+#
+# Each adapter turns (messages, max_tokens, stream) into (url, headers, body) and reads
+# (prompt_tokens, completion_tokens) from a response body, and text/usage from one SSE chunk.
+
+API_VERSION = "2024-12-01-preview"
+ANTHROPIC_VERSION = "2023-06-01"
+
+# OpenAI chat completions; the base for every OpenAI-compatible provider
+class OpenAIAdapter:
+    provider = "openai"
+    # Ask for a final usage chunk when streaming (stream_options.include_usage)
+    stream_usage = True
+
+    def __init__(self, config):
+        self.config = config
+        self.model = config["deployment"]
+
+    def url(self):
+        return f"{self.config['endpoint']}chat/completions"
+
+    def headers(self):
+        return {"Content-Type": "application/json", "Authorization": f"Bearer {self.config['api_key']}"}
+
+    def body(self, messages, max_tokens, stream):
+        body = {"model": self.model, "messages": messages, "max_tokens": max_tokens}
+        if stream:
+            body["stream"] = True
+            if self.stream_usage:
+                body["stream_options"] = {"include_usage": True}
+        return body
+
+    def build_request(self, messages, max_tokens, stream=False):
+        return self.url(), self.headers(), self.body(messages, max_tokens, stream)
+
+    # Function to read (prompt_tokens, completion_tokens) from a non-streaming response body
+    @staticmethod
+    def parse_usage(response):
+        usage = response.get("usage") or {}
+        return usage.get("prompt_tokens"), usage.get("completion_tokens")
+
+    # Function to read one decoded SSE chunk: (content text or None, usage dict or None)
+    @staticmethod
+    def parse_chunk(chunk):
+        usage = chunk.get("usage")
+        if usage:
+            usage = {"prompt_tokens": usage.get("prompt_tokens"), "completion_tokens": usage.get("completion_tokens")}
+        choices = chunk.get("choices") or []
+        text = (choices[0].get("delta") or {}).get("content") if choices else None
+        return text, usage
+
+class AzureOpenAIAdapter(OpenAIAdapter):
+    provider = "azure"
+
+    def url(self):
+        config = self.config
+        return (f"{config['endpoint']}openai/deployments/{config['deployment']}/chat/completions"
+                f"?api-version={config.get('api_version', API_VERSION)}")
+
+    def headers(self):
+        return {"Content-Type": "application/json", "api-key": self.config["api_key"]}
+
+    # The deployment in the URL selects the model
+    def body(self, messages, max_tokens, stream):
+        body = super().body(messages, max_tokens, stream)
+        del body["model"]
+        return body
+
+class DatabricksAdapter(OpenAIAdapter):
+    provider = "databricks"
+    # Not every serving endpoint accepts stream_options; streamed completion tokens fall
+    # back to counting content chunks
+    stream_usage = False
+
+    def url(self):
+        return f"{self.config['endpoint']}serving-endpoints/chat/completions"
+
+class AnthropicAdapter:
+    provider = "anthropic"
+
+    def __init__(self, config):
+        self.config = config
+        self.model = config["deployment"]
+
+    def build_request(self, messages, max_tokens, stream=False):
+        headers = {
+            "Content-Type": "application/json",
+            "x-api-key": self.config["api_key"],
+            "anthropic-version": self.config.get("api_version", ANTHROPIC_VERSION),
+        }
+        system = [m["content"] for m in messages if m["role"] == "system"]
+        body = {"model": self.model, "max_tokens": max_tokens,
+                "messages": [m for m in messages if m["role"] != "system"]}
+        if system:
+            body["system"] = "\n\n".join(system)
+        if stream:
+            body["stream"] = True
+        return f"{self.config['endpoint']}v1/messages", headers, body
+
+    @staticmethod
+    def parse_usage(response):
+        usage = response.get("usage") or {}
+        return usage.get("input_tokens"), usage.get("output_tokens")
+
+    # Prompt tokens arrive in message_start, the output count in message_delta
+    @staticmethod
+    def parse_chunk(chunk):
+        kind = chunk.get("type")
+        if kind == "content_block_delta":
+            return (chunk.get("delta") or {}).get("text"), None
+        if kind == "message_start":
+            usage = (chunk.get("message") or {}).get("usage") or {}
+            return None, {"prompt_tokens": usage.get("input_tokens")}
+        if kind == "message_delta":
+            return None, {"completion_tokens": (chunk.get("usage") or {}).get("output_tokens")}
+        return None, None
+
+PROVIDERS = {adapter.provider: adapter
+             for adapter in (AzureOpenAIAdapter, DatabricksAdapter, OpenAIAdapter, AnthropicAdapter)}
+
+# Function to build the adapter for a target config (a regions entry)
+def adapter_for(config):
+    provider = config.get("provider", "azure")
+    if provider not in PROVIDERS:
+        raise ValueError(f"unknown provider {provider!r}, expected one of {sorted(PROVIDERS)}")
+    return PROVIDERS[provider](config)
@@ -0,0 +1,153 @@
+# Benchmarks for TokenRateLimiter: estimator speed, decisions/sec and enforcement accuracy
+#
+#   1. token estimator - throughput of estimate_prompt_tokens on short and long chat payloads
+#   2. memory backend - decisions/sec and per-decision p50/p99 with 100k warm keys, keys
+#      drawn uniformly and Zipf-skewed, each decision checked against an api_key rule
+#      (rpm + tpm) and an org_id rule (tpd + monthly quota); plus memory per key
+#   3. Redis backend - the same decisions against MiniRedis.py (in its own process) over TCP,
+#      with N concurrent callers sharing the connection pool (one pipelined round trip each)
+#   4. enforcement - one key hammered at a simulated 10 requests/s for 3 minutes against
+#      rpm=100: how many are admitted in every 60s window (should never exceed the limit)
+#
+# Usage:
+#   python RateLimiterBenchmark.py [--keys 100000] [--decisions 500000] [--redis-decisions 20000]
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+import tracemalloc
+
+from GatewayBenchmark import _free_port, wait_for_port
+from LatencyStats import LatencyHistogram
+from TokenRateLimiter import MemoryBackend, RateLimiter, backend_from_url, estimate_prompt_tokens
+import MiniRedis
+
+RULES = [
+    {"key": ["api_key"], "rpm": 1_000_000, "tpm": 1_000_000_000},
+    {"key": ["org_id"], "tpd": 10**12, "quota": {"tokens": 10**13, "period": "month"}},
+]
+
+def _serve_redis(port):
+    asyncio.run(MiniRedis.serve("127.0.0.1", port))
+
+def benchmark_estimator(repeats=20_000):
+    short = [{"role": "user", "content": "How do I pool connections in Python?"}]
+    long = [{"role": "system", "content": "You are a careful assistant. " * 20}] + \
+           [{"role": "user" if i % 2 else "assistant", "content": "Explain connection pooling in detail. " * 30}
+            for i in range(10)]
+    cjk = [{"role": "user", "content": "如何在Python中实现连接池？" * 20}]
+    print("\n===== TOKEN ESTIMATOR =====")
+    for label, messages in (("1 short message", short), ("11 messages, ~11k chars", long), ("CJK, 320 chars", cjk)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            tokens = estimate_prompt_tokens(messages)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<26}{tokens:7d} tokens {elapsed / repeats * 1e6:8.2f}us/estimate")
+
+# Function to draw `count` key indexes, uniformly or Zipf(1.1)-skewed
+def key_stream(keys, count, skew, seed=0):
+    rng = random.Random(seed)
+    if not skew:
+        return [rng.randrange(keys) for _ in range(count)]
+    weights = [1.0 / (i + 1) ** 1.1 for i in range(keys)]
+    return rng.choices(range(keys), weights=weights, k=count)
+
+def _identities(keys):
+    return [{"api_key": f"key-{i}", "org_id": f"org-{i % 1000}"} for i in range(keys)]
+
+def benchmark_memory(keys=100_000, decisions=500_000, sample_every=16):
+    identities = _identities(keys)
+    print(f"\n===== MEMORY BACKEND ({keys} keys, 2 rules per decision) =====")
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    limiter = RateLimiter(RULES, backend=MemoryBackend(max_keys=keys * 2))
+    now = time.time()
+    for identity in identities:
+        limiter.acquire_nowait(identity, 100, now)
+    per_key = (tracemalloc.get_traced_memory()[0] - before) / len(limiter.backend.keys)
+    tracemalloc.stop()
+    print(f"  warm: {len(limiter.backend.keys)} counters, ~{per_key:.0f} bytes per counter")
+    print(f"  {'keys':<10}{'decisions/s':>14}{'p50 us':>10}{'p99 us':>10}")
+    for label, skew in (("uniform", False), ("zipf 1.1", True)):
+        stream = [identities[i] for i in key_stream(keys, decisions, skew)]
+        acquire = limiter.acquire_nowait
+        start = time.perf_counter()
+        for identity in stream:
+            acquire(identity, 100)
+        elapsed = time.perf_counter() - start
+        # Per-decision latency on a sample, timed separately so the clock calls don't skew throughput
+        latency = LatencyHistogram()
+        for identity in stream[::sample_every]:
+            t = time.perf_counter()
+            acquire(identity, 100)
+            latency.record((time.perf_counter() - t) * 1e6)
+        p50, p99 = latency.quantiles((0.5, 0.99))
+        print(f"  {label:<10}{decisions / elapsed:14,.0f}{p50:10.1f}{p99:10.1f}")
+
+async def _redis_run(url, keys, decisions, concurrency):
+    identities = _identities(keys)
+    limiter = RateLimiter(RULES, backend=backend_from_url(url))
+    limiter.backend.client.pool_size = concurrency
+    stream = [identities[i] for i in key_stream(keys, decisions, False)]
+    latency = LatencyHistogram()
+
+    async def worker(offset):
+        for identity in stream[offset::concurrency]:
+            t = time.perf_counter()
+            await limiter.acquire(identity, 100)
+            latency.record((time.perf_counter() - t) * 1e6)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    await limiter.backend.close()
+    return decisions / elapsed, latency
+
+def benchmark_redis(url, keys=100_000, decisions=20_000, concurrency=(1, 16)):
+    print(f"\n===== REDIS BACKEND ({url}, {keys} keys) =====")
+    print(f"  {'callers':<10}{'decisions/s':>14}{'p50 us':>10}{'p99 us':>10}")
+    for callers in concurrency:
+        rate, latency = asyncio.run(_redis_run(url, keys, decisions, callers))
+        p50, p99 = latency.quantiles((0.5, 0.99))
+        print(f"  {callers:<10}{rate:14,.0f}{p50:10.1f}{p99:10.1f}")
+
+# Function to check that no 60s window ever admits more than the limit
+def benchmark_enforcement(rpm=100, rate=10, seconds=180):
+    limiter = RateLimiter([{"key": ["api_key"], "rpm": rpm}])
+    start = 1_000_000.0
+    admitted = []
+    for i in range(seconds * rate):
+        now = start + i / rate
+        if limiter.acquire_nowait({"api_key": "hot"}, 1, now).allowed:
+            admitted.append(now)
+    worst, j = 0, 0
+    for i, t in enumerate(admitted):
+        while admitted[j] <= t - 60:
+            j += 1
+        worst = max(worst, i - j + 1)
+    print(f"\n===== ENFORCEMENT (rpm={rpm}, offered {rate * 60}/min for {seconds}s) =====")
+    print(f"  admitted {len(admitted)} of {seconds * rate}; most in any 60s window: {worst} (limit {rpm}); "
+          f"ideal {min(rate * 60, rpm) * seconds // 60}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token rate limiter benchmarks")
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--decisions", type=int, default=500_000)
+    parser.add_argument("--redis-decisions", type=int, default=20_000)
+    parser.add_argument("--redis", default=None, help="redis://host:port (default: start MiniRedis)")
+    args = parser.parse_args()
+
+    benchmark_estimator()
+    benchmark_memory(args.keys, args.decisions)
+    if args.redis:
+        benchmark_redis(args.redis, args.keys, args.redis_decisions)
+    else:
+        port = _free_port()
+        server = multiprocessing.Process(target=_serve_redis, args=(port,), daemon=True)
+        server.start()
+        wait_for_port(port)
+        benchmark_redis(f"redis://127.0.0.1:{port}", args.keys, args.redis_decisions)
+        server.terminate()
+    benchmark_enforcement()
@@ -0,0 +1,258 @@
+# Client-side latency-based router over a fleet of Azure OpenAI deployments
+#
+# Takes a regions dict in the same shape as AzureOpenAILatencyTest.regions and sends each
+# chat completion to the region currently expected to answer fastest:
+#   - per-region EWMA latency and EWMA error rate, updated from live traffic and from
+#     lightweight background probes (a 1-token call, like perform_warmup)
+#   - a circuit breaker per region: closed -> open after failure_threshold consecutive
+#     failures (for open_seconds, or longer if the service sent Retry-After) -> half-open,
+#     where one trial request decides between closed and open again
+#   - optional hedging: if the first region has not answered within hedge_delay (fixed
+#     seconds, or "p90" for that region's recent p90), the same request goes to the next
+#     best region and the first success wins
+#   - failover to the next region when the chosen one fails
+#
+# Usage:
+#   from AzureOpenAILatencyTest import regions
+#   router = RegionRouter(regions, hedge_delay="p90").start_probes()
+#   region, body = router.chat_completion([{"role": "user", "content": "Hello"}], max_tokens=100)
+#   router.close()
+#
+# Hedged losers cannot be interrupted mid-request with requests; they are abandoned, and
+# their outcome still updates that region's statistics when they finish.
+
+import concurrent.futures
+import random
+import threading
+import time
+
+import requests
+import requests.adapters
+
+from LatencyStats import LatencyHistogram
+from RetryPolicy import classify_outcome, parse_retry_after
+
+API_VERSION = "2024-12-01-preview"
+
+# Raised when no region could serve the request
+class RouterError(Exception):
+    pass
+
+class RegionState:
+    def __init__(self, name, config, window=500):
+        self.name = name
+        self.config = config
+        self.ewma_latency = None
+        self.ewma_error_rate = 0.0
+        self.consecutive_failures = 0
+        self.circuit = "closed"
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        # Two rotating histograms give a recent-window quantile without keeping samples
+        self._window = window
+        self._recent = LatencyHistogram()
+        self._previous = LatencyHistogram()
+
+    def recent_quantile(self, q):
+        return LatencyHistogram().merge(self._previous).merge(self._recent).quantile(q)
+
+    def record_latency(self, latency):
+        self._recent.record(latency)
+        if self._recent.count >= self._window:
+            self._previous, self._recent = self._recent, LatencyHistogram()
+
+class RegionRouter:
+    def __init__(self, regions_config, alpha=0.2, hedge_delay=None, failure_threshold=5, open_seconds=30.0,
+                 probe_interval=30.0, explore=0.05, pool_size=50, timeout=120.0, api_version=API_VERSION):
+        self.regions = {name: RegionState(name, config) for name, config in regions_config.items()}
+        self.alpha = alpha
+        self.hedge_delay = hedge_delay
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+        # Share of requests sent to a random healthy region so estimates stay fresh
+        self.explore = explore
+        self.timeout = timeout
+        self.api_version = api_version
+        self._lock = threading.Lock()
+        self._sessions = {}
+        for name in self.regions:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._sessions[name] = session
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size * len(self.regions))
+        self._stop = threading.Event()
+        self._probe_thread = None
+
+    # ----- health tracking -----
+
+    def record(self, region_name, latency=None, outcome="success", retry_after=None):
+        now = time.monotonic()
+        with self._lock:
+            state = self.regions[region_name]
+            state.requests += 1
+            failed = outcome != "success"
+            state.ewma_error_rate += self.alpha * ((1.0 if failed else 0.0) - state.ewma_error_rate)
+            if state.circuit == "half-open":
+                state.trial_in_flight = False
+            if not failed:
+                state.ewma_latency = latency if state.ewma_latency is None else \
+                    state.ewma_latency + self.alpha * (latency - state.ewma_latency)
+                state.record_latency(latency)
+                state.consecutive_failures = 0
+                state.circuit = "closed"
+                return
+            state.failures += 1
+            state.consecutive_failures += 1
+            if state.circuit == "half-open" or state.consecutive_failures >= self.failure_threshold:
+                state.circuit = "open"
+                state.open_until = now + max(self.open_seconds, retry_after or 0)
+
+    # Regions ordered best first. Open circuits are skipped until their timeout passes,
+    # then admit a single half-open trial.
+    def ranked_regions(self, exclude=()):
+        now = time.monotonic()
+        candidates = []
+        with self._lock:
+            for state in self.regions.values():
+                if state.name in exclude:
+                    continue
+                if state.circuit == "open":
+                    if now < state.open_until:
+                        continue
+                    state.circuit = "half-open"
+                if state.circuit == "half-open" and state.trial_in_flight:
+                    continue
+                # Unmeasured regions score 0 so they are tried first
+                latency = state.ewma_latency or 0.0
+                candidates.append((latency / max(1.0 - state.ewma_error_rate, 0.05), state.name))
+        ranked = [name for _, name in sorted(candidates)]
+        if len(ranked) > 1 and random.random() < self.explore:
+            pick = random.randrange(1, len(ranked))
+            ranked.insert(0, ranked.pop(pick))
+        return ranked
+
+    def _hedge_delay_for(self, region_name):
+        if self.hedge_delay is None:
+            return None
+        if self.hedge_delay == "p90":
+            with self._lock:
+                return self.regions[region_name].recent_quantile(0.9)
+        return float(self.hedge_delay)
+
+    # ----- sending -----
+
+    def _send(self, region_name, messages, max_tokens, **params):
+        state = self.regions[region_name]
+        config = state.config
+        url = (f"{config['endpoint']}openai/deployments/{config['deployment']}/chat/completions"
+               f"?api-version={self.api_version}")
+        headers = {"Content-Type": "application/json", "api-key": config["api_key"]}
+        data = dict(params, messages=messages, max_tokens=max_tokens)
+        with self._lock:
+            state.in_flight += 1
+            if state.circuit == "half-open":
+                state.trial_in_flight = True
+        start = time.perf_counter()
+        try:
+            response = self._sessions[region_name].post(url, headers=headers, json=data, timeout=self.timeout)
+            response.raise_for_status()
+            body = response.json()
+        except Exception as e:
+            response = getattr(e, "response", None)
+            status_code = getattr(response, "status_code", None)
+            self.record(region_name, outcome=classify_outcome(status_code, e),
+                        retry_after=parse_retry_after(getattr(response, "headers", None)))
+            raise
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+        self.record(region_name, time.perf_counter() - start)
+        return body
+
+    # Send a chat completion to the best region; returns (region name, response body).
+    # Falls back through the ranked regions on failure, hedging when hedge_delay is set.
+    def chat_completion(self, messages, max_tokens=100, **params):
+        tried = set()
+        pending = {}
+        last_error = None
+        while True:
+            if not pending:
+                ranked = self.ranked_regions(exclude=tried)
+                if not ranked:
+                    raise RouterError(f"all regions failed or are circuit-open: {last_error}")
+                region_name = ranked[0]
+                tried.add(region_name)
+                pending[self._executor.submit(self._send, region_name, messages, max_tokens, **params)] = region_name
+
+            # Wait for the in-flight attempt(s); hedge if the primary is slow
+            primary = next(iter(pending.values()))
+            delay = self._hedge_delay_for(primary) if len(pending) == 1 else None
+            done, _ = concurrent.futures.wait(pending, timeout=delay,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                hedge_regions = self.ranked_regions(exclude=tried)
+                if hedge_regions:
+                    tried.add(hedge_regions[0])
+                    future = self._executor.submit(self._send, hedge_regions[0], messages, max_tokens, **params)
+                    pending[future] = hedge_regions[0]
+                else:
+                    # Nothing to hedge to: wait for the primary without a deadline
+                    concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                continue
+
+            for future in done:
+                region_name = pending.pop(future)
+                try:
+                    body = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                # First success wins; any other in-flight attempt is abandoned
+                return region_name, body
+
+    # ----- background probes -----
+
+    def probe(self):
+        futures = [self._executor.submit(self._send, name, [{"role": "user", "content": "ping"}], 1)
+                   for name in self.regions]
+        concurrent.futures.wait(futures)
+
+    def _probe_loop(self):
+        while not self._stop.is_set():
+            self.probe()
+            self._stop.wait(self.probe_interval)
+
+    def start_probes(self):
+        self._probe_thread = threading.Thread(target=self._probe_loop, name="region-router-probes", daemon=True)
+        self._probe_thread.start()
+        return self
+
+    # Current per-region view, for logging or dashboards
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {
+                    "ewma_latency": state.ewma_latency,
+                    "ewma_error_rate": state.ewma_error_rate,
+                    "p90": state.recent_quantile(0.9),
+                    "circuit": state.circuit,
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "failures": state.failures,
+                }
+                for name, state in self.regions.items()
+            }
+
+    def close(self):
+        self._stop.set()
+        if self._probe_thread is not None:
+            self._probe_thread.join()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for session in self._sessions.values():
+            session.close()
@@ -0,0 +1,99 @@
+# Retry policy shared by the benchmark runners
+#
+# Production clients retry throttled and failed calls, so benchmark numbers that count a
+# 429 as a lost request understate real tail latency. RetryPolicy decides whether an
+# attempt is retried and how long to wait: the service's retry-after-ms / Retry-After
+# headers win, otherwise exponential backoff with jitter, and nothing is retried past
+# the per-request deadline.
+
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+# Outcome classes used in results and reports
+OUTCOMES = ("success", "throttled", "timeout", "server_error", "client_error", "connection_error", "error")
+
+# Function to classify one attempt from its HTTP status and/or exception. Exception types
+# are matched by name so requests, httpx and aiohttp errors all classify the same way.
+def classify_outcome(status_code=None, exception=None):
+    if status_code == 429:
+        return "throttled"
+    if status_code is not None and status_code >= 500:
+        return "server_error"
+    if status_code == 408:
+        return "timeout"
+    if status_code is not None and status_code >= 400:
+        return "client_error"
+    if exception is not None:
+        name = type(exception).__name__
+        if isinstance(exception, TimeoutError) or "Timeout" in name:
+            return "timeout"
+        if "Connect" in name or isinstance(exception, ConnectionError):
+            return "connection_error"
+        return "error"
+    return "success"
+
+# Function to read the server's requested wait in seconds from response headers
+# (retry-after-ms from Azure OpenAI first, then standard Retry-After as seconds or a date)
+def parse_retry_after(headers):
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=30.0, jitter=True, deadline=None,
+                 retry_on=("throttled", "timeout", "server_error", "connection_error"), honor_retry_after=True):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        # Seconds from the first attempt after which no further attempt starts
+        self.deadline = deadline
+        self.retry_on = set(retry_on)
+        self.honor_retry_after = honor_retry_after
+
+    # Seconds left before the deadline (None without one)
+    def remaining(self, start_time):
+        if self.deadline is None:
+            return None
+        return self.deadline - (time.perf_counter() - start_time)
+
+    # Timeout for the next attempt: the default, capped by what is left of the deadline
+    def attempt_timeout(self, start_time, default=120.0):
+        remaining = self.remaining(start_time)
+        return default if remaining is None else max(min(default, remaining), 0.001)
+
+    # Seconds to wait before attempt number `attempt + 1`, or None to give up
+    def next_delay(self, attempt, outcome, start_time, retry_after=None):
+        if outcome not in self.retry_on or attempt >= self.max_attempts:
+            return None
+        if self.honor_retry_after and retry_after is not None:
+            delay = retry_after
+        else:
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            if self.jitter:
+                # Full jitter: spreads retries from many clients over the whole window
+                delay = random.uniform(0, delay)
+        remaining = self.remaining(start_time)
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
+
+# Single attempt, no retries: the benchmark's original behaviour
+NO_RETRY = RetryPolicy(max_attempts=1)
@@ -0,0 +1,156 @@
+# Benchmarks for GatewaySemanticCache: lookup latency and hit rate
+#
+#   1. lookup latency by cache size - exact-hash fast path, prompt embedding (HashingEmbedder),
+#      brute-force search for one query and per query in a batch of 32, and IVF search past
+#      ivf_threshold, with IVF recall@1 against brute force. Vectors are unit vectors
+#      scattered around a few thousand random "topic" directions (real embeddings cluster;
+#      uniformly random ones are the worst case for IVF); queries are noisy copies of cached ones.
+#   2. hit rate - a Zipf-distributed stream of prompts drawn from many "intents", each asked
+#      in several surface variants (casing, punctuation, filler words, synonyms). Misses are
+#      answered and stored. For each similarity threshold: exact hits, semantic hits, false
+#      hits (answer cached for a different intent) and the model time and tokens saved
+#      against the mean lookup cost.
+#
+# Usage:
+#   python SemanticCacheBenchmark.py [--sizes 1000 10000 100000] [--dim 384] [--requests 20000]
+
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from GatewaySemanticCache import HashingEmbedder, SemanticCache, VectorIndex, _normalize_rows, normalize_text
+from LatencyStats import LatencyHistogram
+
+# Model cost a hit avoids: median eastus TTFT in MockAzureServer plus 100 tokens at 80 tokens/s
+MODEL_SECONDS = 0.30 + 100 / 80.0
+MODEL_TOKENS = 150
+
+TOPICS = ["connection pooling", "retry with backoff", "streaming responses", "rate limiting", "token counting",
+          "prompt caching", "circuit breakers", "load balancing", "TLS termination", "request hedging",
+          "vector search", "batch inference", "model routing", "quota management", "log redaction"]
+LANGUAGES = ["Python", "Go", "Java", "TypeScript", "C#", "Rust"]
+TEMPLATES = ["How do I implement {topic} in {lang}?", "What is the best way to test {topic} in {lang}?",
+             "Explain {topic} for a {lang} service.", "Give me a {lang} example of {topic}.",
+             "What are common mistakes with {topic} in {lang}?"]
+FILLERS = ["", "please ", "quick question: ", "hey, ", "can you tell me: "]
+SYNONYMS = {"implement": "build", "best": "recommended", "example": "sample", "common": "typical",
+            "Explain": "Describe", "service": "backend"}
+
+# Function to time fn `repeats` times; each sample is divided by `per` (queries per call)
+def _time_us(fn, repeats, per=1):
+    histogram = LatencyHistogram()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        histogram.record((time.perf_counter() - start) * 1e6 / per)
+    return histogram
+
+def _row(label, histogram):
+    p50, p99 = histogram.quantiles((0.5, 0.99))
+    print(f"  {label:<34}{p50:10.1f}{p99:10.1f}")
+
+# Function to benchmark lookup latency at each cache size
+def benchmark_lookup(sizes=(1_000, 10_000, 100_000), dim=384, repeats=300, ivf_threshold=100_000, seed=0):
+    rng = np.random.default_rng(seed)
+    embedder = HashingEmbedder(dim)
+    prompt = normalize_text("How do I implement connection pooling in Python for a service behind a gateway? " * 3)
+    print(f"\n===== LOOKUP LATENCY (dim {dim}, microseconds) =====")
+    print(f"  {'':<34}{'p50':>10}{'p99':>10}")
+    _row("embed one prompt (hashing)", _time_us(lambda: embedder.embed_sync([prompt]), repeats))
+    keys = {f"key-{i}": i for i in range(max(sizes))}
+    _row("exact-hash fast path", _time_us(lambda: keys.get(SemanticCache.key_hash(prompt)), repeats))
+
+    for size in sizes:
+        centers = rng.standard_normal((max(size // 50, 1), dim))
+        vectors = _normalize_rows(centers[rng.integers(0, len(centers), size)] +
+                                  0.08 * rng.standard_normal((size, dim)) * np.sqrt(dim / 16))
+        index = VectorIndex(dim, size, ivf_threshold=ivf_threshold)
+        for vector in vectors:
+            index.add(vector)
+        queries = _normalize_rows(vectors[rng.integers(0, size, 64)] + 0.01 * rng.standard_normal((64, dim)))
+        print(f" {size} entries:")
+        _row("brute force, 1 query", _time_us(lambda: index.search(queries[:1]), repeats))
+        _row("brute force, batch of 32 (per query)",
+             _time_us(lambda: index.search(queries[:32]), max(repeats // 8, 20), per=32))
+        if size >= ivf_threshold:
+            exact_scores, exact_slots = index.search(queries)
+            start = time.perf_counter()
+            index.install(VectorIndex.train(index.training_snapshot()))
+            print(f"  IVF trained on {size} rows in {time.perf_counter() - start:.1f}s "
+                  f"({len(index.centroids)} lists, nprobe {index.nprobe})")
+            _row("IVF, 1 query", _time_us(lambda: index.search(queries[:1]), repeats))
+            _, ivf_slots = index.search(queries)
+            print(f"  IVF recall@1 vs brute force: {np.mean(ivf_slots[:, 0] == exact_slots[:, 0]):.3f}")
+
+# Function to build the prompt variants for one intent
+def intent_text(intent_id):
+    topic = TOPICS[intent_id % len(TOPICS)]
+    lang = LANGUAGES[(intent_id // len(TOPICS)) % len(LANGUAGES)]
+    template = TEMPLATES[(intent_id // (len(TOPICS) * len(LANGUAGES))) % len(TEMPLATES)]
+    suffix = intent_id // (len(TOPICS) * len(LANGUAGES) * len(TEMPLATES))
+    text = template.format(topic=topic, lang=lang)
+    # Past the template combinations, intents differ by a project number
+    return f"{text} (project {suffix})" if suffix else text
+
+def variant(text, rng):
+    if rng.random() < 0.3:
+        for word, synonym in SYNONYMS.items():
+            text = text.replace(word, synonym)
+    text = rng.choice(FILLERS) + text
+    if rng.random() < 0.3:
+        text = text.upper() if rng.random() < 0.2 else text.lower()
+    if rng.random() < 0.3:
+        text = text.rstrip("?.") + rng.choice(["", "?", "??", " ."])
+    return text
+
+# Function to replay a Zipf workload against a fresh cache at one threshold
+async def replay(prompts, threshold, dim):
+    cache = SemanticCache(HashingEmbedder(dim), similarity_threshold=threshold, max_size=len(prompts))
+    lookup_time = LatencyHistogram()
+    false_hits = 0
+    for intent_id, text in prompts:
+        start = time.perf_counter()
+        match, key_hash, vector = await cache.lookup(normalize_text(text))
+        lookup_time.record(time.perf_counter() - start)
+        if match is None:
+            cache.put(key_hash, vector, str(intent_id).encode(), False)
+        elif int(cache.entries[match[0]][1]) != intent_id:
+            false_hits += 1
+    return cache, lookup_time, false_hits
+
+def benchmark_hit_rate(requests=20_000, intents=2_000, thresholds=(0.80, 0.85, 0.90, 0.95), dim=512, seed=0):
+    rng = random.Random(seed)
+    weights = [1.0 / (i + 1) ** 1.1 for i in range(intents)]
+    chosen = rng.choices(range(intents), weights=weights, k=requests)
+    prompts = [(intent_id, variant(intent_text(intent_id), rng)) for intent_id in chosen]
+
+    print(f"\n===== HIT RATE ({requests} requests over {intents} intents, Zipf 1.1, hashing embedder) =====")
+    print(f"  {'threshold':<10}{'exact':>8}{'semantic':>10}{'false':>8}{'hit rate':>10}"
+          f"{'lookup p50':>12}{'lookup p99':>12}{'model s saved':>15}{'tokens saved':>14}")
+    for threshold in thresholds:
+        cache, lookup_time, false_hits = asyncio.run(replay(prompts, threshold, dim))
+        summary = cache.summary()
+        hits = summary["exact_hits"] + summary["semantic_hits"]
+        # Time saved = correct hits x model time, less the lookup cost paid on every request
+        saved = (hits - false_hits) * MODEL_SECONDS - lookup_time.mean * requests
+        p50, p99 = lookup_time.quantiles((0.5, 0.99))
+        print(f"  {threshold:<10.2f}{summary['exact_hits']:8d}{summary['semantic_hits']:10d}{false_hits:8d}"
+              f"{summary['hit_rate']:10.1%}{p50 * 1e6:10.0f}us{p99 * 1e6:10.0f}us{saved:15.0f}"
+              f"{(hits - false_hits) * MODEL_TOKENS:14d}")
+    print(f"  (a hit avoids ~{MODEL_SECONDS:.2f}s and ~{MODEL_TOKENS} tokens; false hits return another intent's answer)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Semantic cache lookup-latency and hit-rate benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384, help="embedding dimension for the lookup benchmark")
+    parser.add_argument("--ivf-threshold", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--intents", type=int, default=2_000)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.80, 0.85, 0.90, 0.95])
+    args = parser.parse_args()
+
+    benchmark_lookup(args.sizes, args.dim, ivf_threshold=args.ivf_threshold)
+    benchmark_hit_rate(args.requests, args.intents, args.thresholds)
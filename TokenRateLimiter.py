@@ -0,0 +1,761 @@
+# Token rate limiting and quotas for LLMGateway (llm-gateway-spec/SKILL.md section 4)
+#
+# A rule names the request dimensions its counter is keyed by and the limits on that key:
+#   {"key": ["api_key"], "tpm": 10000, "rpm": 100}
+#   {"key": ["org_id", "model"], "tpd": 5000000, "quota": {"tokens": 50000000, "period": "month"}}
+# Dimensions: api_key, user_id, org_id, ip, model, header:<name>. A request is checked
+# against every rule whose dimensions it has, and counted only if all of them allow it.
+#
+# Metrics: rpm / tpm are sliding 60s windows (12 buckets of 5s), tpd a sliding day (24
+# hourly buckets). A window spans the current bucket, the full buckets before it and part of
+# one more; that oldest bucket is weighted by how much of it is still inside the window, so
+# the count moves smoothly instead of dropping a whole bucket at once. "quota"
+# is a token budget per calendar week, month or year (UTC).
+#
+# Counting is hybrid (spec 4.3): acquire reserves the estimated prompt tokens plus
+# completion_reserve x max_tokens, and correct() replaces the reservation with the real
+# total from the response's usage (or refunds it when the call failed). The correction
+# lands in the bucket the reservation went to, as long as that bucket is still in the window.
+#
+# Backends:
+#   MemoryBackend - per-key ring buffers in an OrderedDict, no locks (the gateway's event
+#                   loop is the only writer), least recently used keys evicted past max_keys
+#                   and keys idle for longer than the longest window dropped as they age out
+#   RedisBackend  - the same windows as one Redis key per bucket, rate:{key}:{metric}:{bucket};
+#                   one pipelined round trip per decision (INCRBY, EXPIRE, MGET), with a
+#                   compensating INCRBY when a limit rejects. Talks RESP2 directly, so it
+#                   works against Redis or MiniRedis.py without a client library.
+#                   While Redis is unreachable, failure_mode "open" (default) admits requests
+#                   uncounted and "closed" answers 503.
+#
+# Usage (gateway config):
+#   "rate_limiting": {"enabled": true, "rules": [{"key": ["api_key"], "tpm": 10000, "rpm": 100}],
+#                     "overrides": [{"key_type": "api_key", "key_value": "premium-client", "tpm": 50000}]}
+# Benchmark: python RateLimiterBenchmark.py
+
+import asyncio
+import calendar
+import collections
+import time
+from urllib.parse import urlparse
+
+from aiohttp import web
+
+# Sliding-window metrics: (counts tokens, window seconds, buckets)
+METRICS = {
+    "rpm": (False, 60, 12),
+    "tpm": (True, 60, 12),
+    "tpd": (True, 86400, 24),
+}
+QUOTA_PERIODS = ("week", "month", "year")
+
+# ----- token estimation -----
+
+# Function to estimate tokens in a string without a tokenizer: ~4 characters per token for
+# Latin text, ~1 token per CJK (3-byte UTF-8) character
+def estimate_text_tokens(text):
+    n = len(text)
+    if text.isascii():
+        return (n + 3) // 4
+    wide = (len(text.encode("utf-8")) - n) // 2
+    return (n - wide + 3) // 4 + wide
+
+# Function to estimate prompt tokens of a messages array (OpenAI counts ~4 tokens of
+# framing per message and 3 to prime the reply)
+def estimate_prompt_tokens(messages):
+    tokens = 3
+    for message in messages or ():
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += 4 + estimate_text_tokens(content)
+        elif content:
+            tokens += 4 + sum(estimate_text_tokens(part.get("text", "")) for part in content if isinstance(part, dict))
+        else:
+            tokens += 4
+    return tokens
+
+# Function to return (prompt estimate, tokens to reserve) for a chat completion payload
+def estimate_request_tokens(payload, completion_reserve=1.0):
+    prompt = estimate_prompt_tokens(payload.get("messages"))
+    max_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens") or 0
+    return prompt, prompt + int(max_tokens * completion_reserve)
+
+# ----- window arithmetic shared by the backends -----
+
+BUCKET_SECONDS = {metric: window / buckets for metric, (_, window, buckets) in METRICS.items()}
+
+# Function to estimate a sliding-window count from its buckets, oldest first, with the
+# oldest bucket weighted by the share of it still inside the window
+def window_count(counts, fraction):
+    return sum(counts) - counts[0] * fraction
+
+# Function to compute how long until `excess` tokens/requests have left the window. Each
+# bucket drains out linearly over the bucket-length it spends as the oldest one.
+def window_retry_after(counts, fraction, bucket_seconds, excess):
+    for age, count in enumerate(counts):
+        remaining = count * (1.0 - fraction) if age == 0 else count
+        if remaining >= excess and count:
+            starts = 0.0 if age == 0 else age - fraction
+            return (starts + excess / count) * bucket_seconds
+        excess -= remaining
+    return len(counts) * bucket_seconds
+
+# Current period per kind: (start, end, period id), recomputed only when a period rolls over
+_quota_periods = {}
+
+# Function to return (period id, seconds until the period ends) for a calendar quota
+def quota_period(period, now):
+    current = _quota_periods.get(period)
+    if current is not None and current[0] <= now < current[1]:
+        return current[2], current[1] - now
+    t = time.gmtime(now)
+    if period == "week":
+        start = calendar.timegm((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0)) - t.tm_wday * 86400
+        current = (start, start + 7 * 86400, time.strftime("%G-W%V", t))
+    elif period == "month":
+        year, month = (t.tm_year + 1, 1) if t.tm_mon == 12 else (t.tm_year, t.tm_mon + 1)
+        current = (calendar.timegm((t.tm_year, t.tm_mon, 1, 0, 0, 0)), calendar.timegm((year, month, 1, 0, 0, 0)),
+                   f"{t.tm_year}-{t.tm_mon:02d}")
+    elif period == "year":
+        current = (calendar.timegm((t.tm_year, 1, 1, 0, 0, 0)), calendar.timegm((t.tm_year + 1, 1, 1, 0, 0, 0)),
+                   str(t.tm_year))
+    else:
+        raise ValueError(f"unknown quota period {period!r}")
+    _quota_periods[period] = current
+    return current[2], current[1] - now
+
+# ----- in-memory backend -----
+
+# Ring buffer of one metric's buckets: the window's full buckets plus the partly expired one
+class SlidingWindow:
+    __slots__ = ("counts", "head", "total", "bucket_seconds", "tokens")
+
+    def __init__(self, metric):
+        counts_tokens, _, buckets = METRICS[metric]
+        self.counts = [0] * (buckets + 1)
+        self.head = 0       # absolute index of the newest bucket
+        self.total = 0
+        self.bucket_seconds = BUCKET_SECONDS[metric]
+        self.tokens = counts_tokens
+
+    def advance(self, bucket):
+        gap = bucket - self.head
+        if gap <= 0:
+            return
+        counts = self.counts
+        size = len(counts)
+        if gap >= size:
+            for i in range(size):
+                counts[i] = 0
+            self.total = 0
+        else:
+            for b in range(self.head + 1, bucket + 1):
+                i = b % size
+                self.total -= counts[i]
+                counts[i] = 0
+        self.head = bucket
+
+    def oldest_first(self):
+        size = len(self.counts)
+        start = (self.head + 1) % size
+        return self.counts[start:] + self.counts[:start]
+
+class KeyState:
+    __slots__ = ("limits", "windows", "quota_kind", "quota_period", "quota_used", "last_seen")
+
+    def __init__(self, limits):
+        self.windows = {}
+        self.quota_period = None
+        self.quota_used = 0
+        self.last_seen = 0.0
+        self.set_limits(limits)
+
+    # Limits change when an override is set; windows already counting keep their counts
+    def set_limits(self, limits):
+        self.limits = limits
+        windows = self.windows
+        self.windows = {metric: windows.get(metric) or SlidingWindow(metric) for metric in limits if metric in METRICS}
+        self.quota_kind = limits["quota"]["period"] if "quota" in limits else None
+
+class MemoryBackend:
+    is_async = False
+
+    def __init__(self, max_keys=1_000_000, idle_seconds=None):
+        self.keys = collections.OrderedDict()
+        self.max_keys = max_keys
+        # Keys untouched for longer than this hold only expired buckets; None = longest window
+        self.idle_seconds = idle_seconds or max(window + window / size for _, window, size in METRICS.values())
+        self.evicted = 0
+        self._calls = 0
+
+    def _state(self, key, limits, now):
+        keys = self.keys
+        state = keys.get(key)
+        if state is None:
+            state = keys[key] = KeyState(limits)
+            if len(keys) > self.max_keys:
+                keys.popitem(last=False)
+                self.evicted += 1
+        else:
+            keys.move_to_end(key)
+            if state.limits is not limits:
+                state.set_limits(limits)
+        state.last_seen = now
+        # Every 256 calls, drop idle keys from the least recently used end
+        self._calls += 1
+        if not self._calls & 255:
+            cutoff = now - self.idle_seconds
+            while keys:
+                oldest = next(iter(keys.values()))
+                if oldest.last_seen >= cutoff:
+                    break
+                keys.popitem(last=False)
+                self.evicted += 1
+        return state
+
+    # Function to check one key against its limits without counting anything; returns None
+    # when allowed, else (metric, retry_after)
+    @staticmethod
+    def _check(state, limits, tokens, now):
+        for metric, window in state.windows.items():
+            position = now / window.bucket_seconds
+            bucket = int(position)
+            window.advance(bucket)
+            counts = window.counts
+            fraction = position - bucket
+            amount = tokens if window.tokens else 1
+            limit = limits[metric]
+            count = window.total - counts[(bucket + 1) % len(counts)] * fraction
+            if count + amount > limit:
+                if amount > limit:
+                    return metric, None
+                return metric, window_retry_after(window.oldest_first(), fraction, window.bucket_seconds,
+                                                  count + amount - limit)
+        if state.quota_kind:
+            period, remaining = quota_period(state.quota_kind, now)
+            if state.quota_period != period:
+                state.quota_period, state.quota_used = period, 0
+            if state.quota_used + tokens > limits["quota"]["tokens"]:
+                return "quota", remaining
+        return None
+
+    # Function to check every (key, limits) entry and count the request against all of them
+    # only if all allow it. Returns None, or (key, metric, retry_after) of a rejection.
+    def acquire(self, entries, tokens, now):
+        states = [self._state(key, limits, now) for key, limits in entries]
+        for state, (key, limits) in zip(states, entries):
+            rejected = self._check(state, limits, tokens, now)
+            if rejected is not None:
+                return (key,) + rejected
+        # _check advanced every window to `now`, so the newest bucket is the one to count in
+        for state in states:
+            for window in state.windows.values():
+                amount = tokens if window.tokens else 1
+                window.counts[window.head % len(window.counts)] += amount
+                window.total += amount
+            if state.quota_kind:
+                state.quota_used += tokens
+        return None
+
+    # Function to move `delta` tokens into the buckets a reservation made at `reserved_at` used
+    def correct(self, entries, delta, reserved_at, now):
+        for key, _ in entries:
+            state = self.keys.get(key)
+            if state is None:
+                continue
+            for window in state.windows.values():
+                if not window.tokens:
+                    continue
+                bucket = int(now / window.bucket_seconds)
+                window.advance(bucket)
+                reserved_bucket = int(reserved_at / window.bucket_seconds)
+                counts = window.counts
+                if bucket - reserved_bucket < len(counts):
+                    i = reserved_bucket % len(counts)
+                    applied = max(delta, -counts[i])
+                    counts[i] += applied
+                    window.total += applied
+                elif delta > 0:
+                    # The reservation's bucket has left the window; count the overshoot now
+                    counts[bucket % len(counts)] += delta
+                    window.total += delta
+            if state.quota_kind and state.quota_period == quota_period(state.quota_kind, reserved_at)[0]:
+                state.quota_used = max(state.quota_used + delta, 0)
+
+    def usage(self, key, now):
+        state = self.keys.get(key)
+        if state is None:
+            return None
+        usage = {}
+        for metric, window in state.windows.items():
+            position = now / window.bucket_seconds
+            window.advance(int(position))
+            usage[metric] = window_count(window.oldest_first(), position - int(position))
+        if state.quota_kind:
+            usage["quota"] = state.quota_used
+        return usage
+
+# ----- Redis backend -----
+
+class RedisError(Exception):
+    pass
+
+# What a backend raises when the counter store cannot be reached or answers with an error;
+# the middleware's failure_mode (one of FAILURE_MODES) decides what that means for the request
+BACKEND_ERRORS = (OSError, EOFError, RedisError)
+FAILURE_MODES = ("open", "closed")
+
+# Minimal pipelined RESP2 client: a pool of connections, one command batch per checkout
+class RespClient:
+    def __init__(self, host="127.0.0.1", port=6379, pool_size=8):
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._idle = []
+        self._created = 0
+        self._waiters = collections.deque()
+        self._opening = set()
+
+    @staticmethod
+    def encode(command):
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    @classmethod
+    async def read_reply(cls, reader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("redis connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            return RedisError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            return None if size < 0 else (await reader.readexactly(size + 2))[:-2]
+        if kind == b"*":
+            size = int(rest)
+            return None if size < 0 else [await cls.read_reply(reader) for _ in range(size)]
+        raise RedisError(f"unexpected reply {line!r}")
+
+    async def _checkout(self):
+        if self._idle:
+            return self._idle.pop()
+        if self._created < self.pool_size:
+            self._created += 1
+            try:
+                return await asyncio.open_connection(self.host, self.port)
+            except OSError:
+                self._release()
+                raise
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        return await waiter
+
+    def _checkin(self, connection):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(connection)
+                return
+        self._idle.append(connection)
+
+    # Function to free the pool slot of a connection that failed or was never opened; a
+    # queued caller gets a fresh connection in its place
+    def _release(self):
+        self._created -= 1
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._created += 1
+                task = asyncio.ensure_future(self._open_for(waiter))
+                self._opening.add(task)
+                task.add_done_callback(self._opening.discard)
+                return
+
+    async def _open_for(self, waiter):
+        try:
+            connection = await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            # The server is unreachable: every queued caller would fail the same way
+            self._created -= 1
+            waiters, self._waiters = [waiter, *self._waiters], collections.deque()
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(e)
+            return
+        if waiter.done():
+            # Cancelled while the connection was opening
+            self._checkin(connection)
+        else:
+            waiter.set_result(connection)
+
+    # Function to send a batch of commands in one write and read all replies
+    async def execute(self, commands):
+        connection = await self._checkout()
+        reader, writer = connection
+        try:
+            writer.write(b"".join(self.encode(command) for command in commands))
+            await writer.drain()
+            replies = [await self.read_reply(reader) for _ in commands]
+        except BaseException:
+            # The connection's state is unknown; drop it
+            writer.close()
+            self._release()
+            raise
+        self._checkin(connection)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    async def close(self):
+        for task in list(self._opening):
+            task.cancel()
+        for _, writer in self._idle:
+            writer.close()
+        self._idle = []
+        self._created = 0
+
+class RedisBackend:
+    is_async = True
+
+    def __init__(self, client, prefix="rate"):
+        self.client = client
+        self.prefix = prefix
+
+    # The window's buckets oldest first: `size` full ones and the partly expired one before them
+    def _bucket_keys(self, key, metric, bucket, size):
+        return [f"{self.prefix}:{key}:{metric}:{b}" for b in range(bucket - size, bucket + 1)]
+
+    async def acquire(self, entries, tokens, now):
+        commands, plan, increments = [], [], []
+        for key, limits in entries:
+            for metric, limit in limits.items():
+                if metric == "quota":
+                    period, remaining = quota_period(limit["period"], now)
+                    redis_key = f"{self.prefix}:{key}:quota:{period}"
+                    commands += [("INCRBY", redis_key, tokens), ("EXPIRE", redis_key, int(remaining) + 60)]
+                    plan.append((key, metric, limit["tokens"], tokens, len(commands) - 2, remaining, None))
+                    increments.append((redis_key, tokens))
+                    continue
+                counts_tokens, window, size = METRICS[metric]
+                amount = tokens if counts_tokens else 1
+                bucket_seconds = BUCKET_SECONDS[metric]
+                position = now / bucket_seconds
+                bucket = int(position)
+                bucket_keys = self._bucket_keys(key, metric, bucket, size)
+                commands += [("INCRBY", bucket_keys[-1], amount),
+                             ("EXPIRE", bucket_keys[-1], int(window + 2 * bucket_seconds)),
+                             ("MGET", *bucket_keys)]
+                plan.append((key, metric, limit, amount, len(commands) - 1, position - bucket, bucket_seconds))
+                increments.append((bucket_keys[-1], amount))
+        # The counters are incremented first (optimistically) so concurrent gateways never
+        # both squeeze under a limit; a rejection takes the increments back
+        replies = await self.client.execute(commands)
+        rejected = None
+        for key, metric, limit, amount, index, extra, bucket_seconds in plan:
+            if metric == "quota":
+                if replies[index] > limit:
+                    rejected = (key, metric, None if amount > limit else extra)
+                    break
+                continue
+            counts = [int(c) if c is not None else 0 for c in replies[index]]
+            count = window_count(counts, extra)
+            if count > limit:
+                if amount > limit:
+                    rejected = (key, metric, None)
+                else:
+                    rejected = (key, metric, window_retry_after(counts, extra, bucket_seconds, count - limit))
+                break
+        if rejected is not None:
+            await self.client.execute([("INCRBY", redis_key, -amount) for redis_key, amount in increments])
+        return rejected
+
+    async def correct(self, entries, delta, reserved_at, now):
+        commands = []
+        for key, limits in entries:
+            for metric, limit in limits.items():
+                if metric == "quota":
+                    period, remaining = quota_period(limit["period"], reserved_at)
+                    commands.append(("INCRBY", f"{self.prefix}:{key}:quota:{period}", delta))
+                    continue
+                counts_tokens, window, size = METRICS[metric]
+                if not counts_tokens:
+                    continue
+                bucket_seconds = BUCKET_SECONDS[metric]
+                reserved_bucket = int(reserved_at / bucket_seconds)
+                bucket = int(now / bucket_seconds)
+                if bucket - reserved_bucket <= size:
+                    commands.append(("INCRBY", f"{self.prefix}:{key}:{metric}:{reserved_bucket}", delta))
+                elif delta > 0:
+                    redis_key = f"{self.prefix}:{key}:{metric}:{bucket}"
+                    commands += [("INCRBY", redis_key, delta), ("EXPIRE", redis_key, int(window + 2 * bucket_seconds))]
+        if commands:
+            await self.client.execute(commands)
+
+    async def usage(self, key, limits, now):
+        usage = {}
+        for metric, limit in limits.items():
+            if metric == "quota":
+                period, _ = quota_period(limit["period"], now)
+                (value,) = await self.client.execute([("GET", f"{self.prefix}:{key}:quota:{period}")])
+                usage[metric] = int(value or 0)
+                continue
+            position = now / BUCKET_SECONDS[metric]
+            (counts,) = await self.client.execute([("MGET", *self._bucket_keys(key, metric, int(position),
+                                                                               METRICS[metric][2]))])
+            usage[metric] = window_count([int(c or 0) for c in counts], position - int(position))
+        return usage
+
+    async def close(self):
+        await self.client.close()
+
+# ----- limiter -----
+
+class Decision:
+    __slots__ = ("allowed", "key", "limit", "retry_after", "reservation")
+
+    def __init__(self, allowed, key=None, limit=None, retry_after=None, reservation=None):
+        self.allowed = allowed
+        self.key = key
+        self.limit = limit
+        self.retry_after = retry_after
+        # ((key, limits) entries counted, tokens reserved, time reserved) for correct()
+        self.reservation = reservation
+
+def _is_limit(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+# Function to check a limits dict ({"tpm": 10000, "quota": {"tokens": ..., "period": "month"}})
+# for rules and overrides; raises ValueError
+def check_limits(limits):
+    if not isinstance(limits, dict) or not limits:
+        raise ValueError(f"limits must be a non-empty object of {(*METRICS, 'quota')}")
+    for metric, value in limits.items():
+        if metric == "quota":
+            if not isinstance(value, dict) or not _is_limit(value.get("tokens")):
+                raise ValueError('quota must be {"tokens": <number>, "period": ...}')
+            if value.get("period") not in QUOTA_PERIODS:
+                raise ValueError(f"quota period must be one of {QUOTA_PERIODS}")
+        elif metric not in METRICS:
+            raise ValueError(f"unknown limit {metric!r}, expected one of {(*METRICS, 'quota')}")
+        elif not _is_limit(value):
+            raise ValueError(f"{metric} must be a non-negative number, got {value!r}")
+
+class Rule:
+    def __init__(self, spec):
+        self.dimensions = tuple(spec["key"])
+        self.limits = {metric: spec[metric] for metric in (*METRICS, "quota") if spec.get(metric) is not None}
+        if not self.limits:
+            raise ValueError(f"rate limit rule {spec} sets no limit")
+        check_limits(self.limits)
+        self.prefix = "|".join(self.dimensions) + "="
+        self.overrides = {}
+        self._single = self.dimensions[0] if len(self.dimensions) == 1 else None
+
+    def key_for(self, identity):
+        if self._single:
+            value = identity.get(self._single)
+            return None if value is None else self.prefix + str(value)
+        values = []
+        for dimension in self.dimensions:
+            value = identity.get(dimension)
+            if value is None:
+                return None
+            values.append(str(value))
+        return self.prefix + "|".join(values)
+
+class RateLimiter:
+    def __init__(self, rules, overrides=(), backend=None, completion_reserve=1.0):
+        self.rules = [Rule(spec) for spec in rules]
+        self.backend = backend or MemoryBackend()
+        self.completion_reserve = completion_reserve
+        for override in overrides:
+            self.set_override(override["key_type"], override["key_value"],
+                              {metric: override[metric] for metric in (*METRICS, "quota") if metric in override})
+        self.stats = {"allowed": 0, "rejected": 0, "backend_errors": 0}
+
+    # Function to set limits for one key value, e.g. ("api_key", "premium-client", {"tpm": 50000}),
+    # on every rule keyed by that dimension (or dimensions, joined with "|"). Raises
+    # ValueError for bad limits and KeyError when no rule is keyed by key_type
+    def set_override(self, key_type, key_value, limits):
+        check_limits(limits)
+        rules = [rule for rule in self.rules if "|".join(rule.dimensions) == key_type]
+        if not rules:
+            raise KeyError(key_type)
+        for rule in rules:
+            rule.overrides[rule.prefix + str(key_value)] = dict(rule.limits, **limits)
+
+    def _entries(self, identity):
+        entries = []
+        for rule in self.rules:
+            key = rule.key_for(identity)
+            if key is not None:
+                entries.append((key, rule.overrides.get(key, rule.limits)))
+        return entries
+
+    def _decision(self, rejected, entries, tokens, now):
+        if rejected is None:
+            self.stats["allowed"] += 1
+            return Decision(True, reservation=(entries, tokens, now))
+        self.stats["rejected"] += 1
+        key, metric, retry_after = rejected
+        return Decision(False, key, metric, retry_after)
+
+    # Function for the in-memory hot path (no await); `tokens` is the reservation
+    def acquire_nowait(self, identity, tokens, now=None):
+        now = time.time() if now is None else now
+        entries = self._entries(identity)
+        return self._decision(self.backend.acquire(entries, tokens, now), entries, tokens, now)
+
+    async def acquire(self, identity, tokens, now=None):
+        if not self.backend.is_async:
+            return self.acquire_nowait(identity, tokens, now)
+        now = time.time() if now is None else now
+        entries = self._entries(identity)
+        return self._decision(await self.backend.acquire(entries, tokens, now), entries, tokens, now)
+
+    # Function to replace a reservation with the tokens actually used (0 refunds it)
+    async def correct(self, decision, actual_tokens, now=None):
+        if not decision.allowed:
+            return
+        entries, reserved, reserved_at = decision.reservation
+        delta = actual_tokens - reserved
+        if not delta:
+            return
+        now = time.time() if now is None else now
+        if self.backend.is_async:
+            await self.backend.correct(entries, delta, reserved_at, now)
+        else:
+            self.backend.correct(entries, delta, reserved_at, now)
+
+    # Function to return a key's current counts; `key` as counted, e.g. "api_key=premium-client"
+    async def usage(self, key, now=None):
+        now = time.time() if now is None else now
+        if not self.backend.is_async:
+            return self.backend.usage(key, now)
+        rule = next((rule for rule in self.rules if key.startswith(rule.prefix)), None)
+        return await self.backend.usage(key, rule.overrides.get(key, rule.limits), now) if rule else None
+
+# ----- gateway middleware -----
+
+class RateLimitMiddleware:
+    # failure_mode: what happens to a request while the counter backend is unreachable -
+    # "open" lets it through uncounted, "closed" answers 503
+    def __init__(self, limiter, failure_mode="open"):
+        if failure_mode not in FAILURE_MODES:
+            raise ValueError(f"failure_mode must be one of {FAILURE_MODES}")
+        self.limiter = limiter
+        self.failure_mode = failure_mode
+        self.header_dimensions = sorted({d for rule in limiter.rules for d in rule.dimensions if d.startswith("header:")})
+
+    @staticmethod
+    def identity(ctx):
+        request = ctx.request
+        headers = request.headers
+        identity = {
+            "api_key": ctx.api_key,
+            "user_id": ctx.payload.get("user") or headers.get("x-user-id"),
+            "org_id": headers.get("x-org-id"),
+            "ip": request.remote,
+            "model": ctx.model,
+        }
+        return identity
+
+    async def on_request(self, ctx):
+        identity = self.identity(ctx)
+        for dimension in self.header_dimensions:
+            identity[dimension] = ctx.request.headers.get(dimension[7:])
+        # ctx.prompt_tokens is already this module's estimate (RequestContext uses it)
+        max_tokens = ctx.payload.get("max_completion_tokens") or ctx.payload.get("max_tokens") or 0
+        reserve = ctx.prompt_tokens + int(max_tokens * self.limiter.completion_reserve)
+        from LLMGateway import error_response
+        try:
+            decision = await self.limiter.acquire(identity, reserve)
+        except BACKEND_ERRORS:
+            self.limiter.stats["backend_errors"] += 1
+            if self.failure_mode == "open":
+                return None
+            return error_response(503, "Rate limiting is unavailable", "service_unavailable",
+                                  "rate_limit_unavailable")
+        if decision.allowed:
+            ctx.extra["rate_limit"] = decision
+            return None
+        headers = {}
+        if decision.retry_after is not None:
+            headers["Retry-After"] = str(max(int(decision.retry_after + 0.999), 1))
+        return error_response(429, f"Rate limit exceeded: {decision.limit} for {decision.key}", "rate_limit_error",
+                              "rate_limit_exceeded", headers)
+
+    async def on_response(self, ctx):
+        decision = ctx.extra.get("rate_limit")
+        if decision is None:
+            return
+        # Refund what never reached the model; a stream the client abandoned is still charged
+        if ctx.status != 200 and not ctx.completion_tokens:
+            actual = 0
+        elif ctx.usage and ctx.usage.get("total_tokens") is not None:
+            actual = ctx.usage["total_tokens"]
+        else:
+            actual = ctx.prompt_tokens + ctx.completion_tokens
+        try:
+            await self.limiter.correct(decision, actual)
+        except BACKEND_ERRORS:
+            # The reservation stands; the response has already been sent
+            self.limiter.stats["backend_errors"] += 1
+
+    async def list_rules(self, request):
+        return web.json_response([{"key": list(rule.dimensions), **rule.limits,
+                                   "overrides": rule.overrides} for rule in self.limiter.rules])
+
+    async def put_override(self, request):
+        from LLMGateway import error_response
+        key_type, _, key_value = request.match_info["key"].partition("=")
+        try:
+            limits = await request.json()
+            self.limiter.set_override(key_type, key_value, limits)
+        except ValueError as e:
+            # Includes a body that is not JSON
+            return error_response(400, f"Invalid rate limit override: {e}")
+        except KeyError:
+            return error_response(404, f"No rate limit rule is keyed by {key_type!r}", code="rule_not_found")
+        return web.json_response({"key": request.match_info["key"], "limits": limits})
+
+    async def get_usage(self, request):
+        usage = await self.limiter.usage(request.match_info["key"])
+        if usage is None:
+            return web.json_response({"error": "no usage recorded for this key"}, status=404)
+        return web.json_response(usage)
+
+    # Admin endpoints (spec 10.2); {key} is "dimension=value", e.g. "api_key=premium-client"
+    def add_routes(self, router):
+        router.add_get("/admin/rate-limits", self.list_rules)
+        router.add_put("/admin/rate-limits/{key}", self.put_override)
+        router.add_get("/admin/rate-limits/{key}/usage", self.get_usage)
+
+    async def close(self):
+        if hasattr(self.limiter.backend, "close"):
+            await self.limiter.backend.close()
+
+# Function to build a backend from a config string: "memory" or "redis://host:port"
+def backend_from_url(url="memory", max_keys=1_000_000):
+    if url == "memory":
+        return MemoryBackend(max_keys)
+    parsed = urlparse(url)
+    if parsed.scheme != "redis":
+        raise ValueError(f"unknown rate limit backend {url!r}")
+    return RedisBackend(RespClient(parsed.hostname or "127.0.0.1", parsed.port or 6379))
+
+# Function to build the middleware from the gateway's "rate_limiting" config section
+def limiter_from_config(rate_limiting):
+    backend = backend_from_url(rate_limiting.get("backend", "memory"), rate_limiting.get("max_keys", 1_000_000))
+    limiter = RateLimiter(rate_limiting.get("rules", []), rate_limiting.get("overrides", []), backend,
+                          rate_limiting.get("completion_reserve", 1.0))
+    return RateLimitMiddleware(limiter, rate_limiting.get("failure_mode", "open"))